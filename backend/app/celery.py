@@ -0,0 +1,57 @@
+"""
+Celery application and periodic task schedule
+
+The app is configured by init_celery() from create_app; worker and beat
+start from worker.py (``celery -A worker.celery``), which builds the Flask
+app for FLASK_ENV first.
+"""
+from celery import Celery
+from celery.schedules import crontab
+
+celery = Celery('ispmax', include=['app.tasks'])
+
+celery.conf.beat_schedule = {
+    'nightly-config-backups': {
+        'task': 'app.tasks.backup_all_routers',
+        'schedule': crontab(hour=3, minute=0)
+    },
+    'daily-billing-run': {
+        'task': 'app.tasks.generate_invoices',
+        'schedule': crontab(hour=0, minute=30)
+    },
+    'daily-overdue-suspensions': {
+        'task': 'app.tasks.process_overdue_invoices',
+        'schedule': crontab(hour=6, minute=0)
+    },
+    'router-sampling': {
+        'task': 'app.tasks.sample_routers',
+        'schedule': 60.0
+    },
+    'router-write-reconcile': {
+        'task': 'app.tasks.reconcile_router_writes',
+        'schedule': 60.0
+    },
+}
+
+
+def init_celery(app):
+    """Bind Celery to the application's configuration and context
+    
+    Called from create_app, so tasks can be enqueued from web workers
+    without importing this module building a second application.
+    """
+    celery.conf.update(
+        broker_url=app.config['CELERY_BROKER_URL'],
+        result_backend=app.config['CELERY_RESULT_BACKEND']
+    )
+    
+    class FlaskTask(celery.Task):
+        """Run every task inside the Flask application context"""
+        
+        def __call__(self, *args, **kwargs):
+            with app.app_context():
+                return self.run(*args, **kwargs)
+    
+    celery.Task = FlaskTask
+    app.extensions['celery'] = celery
+    return celery
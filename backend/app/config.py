@@ -20,12 +20,25 @@ class Config:
     # Redis
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
     
+    # Metadata cache (Plan, ISP, router connection details)
+    METADATA_CACHE_SIZE = int(os.environ.get('METADATA_CACHE_SIZE', 10000))
+    METADATA_CACHE_TTL = int(os.environ.get('METADATA_CACHE_TTL', 300))
+    
     # CORS
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:3000').split(',')
     
-    # Rate limiting
-    RATELIMIT_DEFAULT = "200 per minute"
-    RATELIMIT_STORAGE_URL = REDIS_URL
+    # Rate limiting: per-tenant (ISP) budgets by route class, enforced from
+    # in-process token buckets that are reconciled through Redis every
+    # RATELIMIT_SYNC_INTERVAL seconds. 'router' covers endpoints that open a
+    # RouterOS session. Requests on <subdomain>.RATELIMIT_TENANT_DOMAIN are
+    # keyed by subdomain, others by the token's ISP, else by client address.
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
+    RATELIMIT_BUDGETS = {
+        'default': os.environ.get('RATELIMIT_DEFAULT', '600 per minute'),
+        'router': os.environ.get('RATELIMIT_ROUTER', '120 per minute')
+    }
+    RATELIMIT_SYNC_INTERVAL = float(os.environ.get('RATELIMIT_SYNC_INTERVAL', 1.0))
+    RATELIMIT_TENANT_DOMAIN = os.environ.get('RATELIMIT_TENANT_DOMAIN')
     
     # Email
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
@@ -40,6 +53,13 @@ class Config:
     STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
     STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
     
+    # Billing runs
+    BILLING_BATCH_SIZE = int(os.environ.get('BILLING_BATCH_SIZE', 5000))
+    BILLING_DUE_DAYS = int(os.environ.get('BILLING_DUE_DAYS', 10))
+    OVERDUE_GRACE_DAYS = int(os.environ.get('OVERDUE_GRACE_DAYS', 0))
+    OVERDUE_BATCH_SIZE = int(os.environ.get('OVERDUE_BATCH_SIZE', 5000))
+    OVERDUE_SUSPENSION_CHUNK = int(os.environ.get('OVERDUE_SUSPENSION_CHUNK', 500))
+    
     # Twilio (WhatsApp/SMS)
     TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
     TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
@@ -55,6 +75,61 @@ class Config:
     # MikroTik
     MIKROTIK_DEFAULT_USERNAME = os.environ.get('MIKROTIK_DEFAULT_USERNAME', 'admin')
     MIKROTIK_DEFAULT_PASSWORD = os.environ.get('MIKROTIK_DEFAULT_PASSWORD', '')
+    MIKROTIK_LAST_SEEN_INTERVAL = int(os.environ.get('MIKROTIK_LAST_SEEN_INTERVAL', 60))
+    # Router scheduler, per process: concurrent API sessions and commands in
+    # flight per router, sessions over all routers (shared fairly between
+    # ISPs), and seconds a request queues before answering 503
+    MIKROTIK_SCHEDULER_ENABLED = os.environ.get('MIKROTIK_SCHEDULER_ENABLED', 'true').lower() == 'true'
+    MIKROTIK_ROUTER_SESSIONS = int(os.environ.get('MIKROTIK_ROUTER_SESSIONS', 2))
+    MIKROTIK_ROUTER_COMMANDS = int(os.environ.get('MIKROTIK_ROUTER_COMMANDS', 2))
+    MIKROTIK_MAX_SESSIONS = int(os.environ.get('MIKROTIK_MAX_SESSIONS', 64))
+    MIKROTIK_QUEUE_TIMEOUT = float(os.environ.get('MIKROTIK_QUEUE_TIMEOUT', 10))
+    # Seconds client activations, suspensions and speed changes are buffered
+    # per router before being applied together (0 applies each immediately)
+    ROUTER_WRITE_WINDOW = float(os.environ.get('ROUTER_WRITE_WINDOW', 2.0))
+    
+    # Speed test: download payload file (written once per host, served with
+    # sendfile), write/read chunk size and the largest accepted upload
+    SPEEDTEST_BUFFER_BYTES = int(os.environ.get('SPEEDTEST_BUFFER_BYTES', 64 * 1024 * 1024))
+    SPEEDTEST_BUFFER_PATH = os.environ.get('SPEEDTEST_BUFFER_PATH')
+    SPEEDTEST_CHUNK_BYTES = int(os.environ.get('SPEEDTEST_CHUNK_BYTES', 256 * 1024))
+    SPEEDTEST_MAX_UPLOAD_BYTES = int(os.environ.get('SPEEDTEST_MAX_UPLOAD_BYTES', 256 * 1024 * 1024))
+    
+    # Usage accounting
+    USAGE_LIMIT_ACTION = os.environ.get('USAGE_LIMIT_ACTION', 'throttle')  # throttle, suspend
+    USAGE_THROTTLE_LIMIT = os.environ.get('USAGE_THROTTLE_LIMIT', '1M/1M')
+    
+    # Health baselines
+    HEALTH_EWMA_ALPHA = float(os.environ.get('HEALTH_EWMA_ALPHA', 0.05))
+    HEALTH_WARMUP_SAMPLES = int(os.environ.get('HEALTH_WARMUP_SAMPLES', 10))
+    
+    # Per-step timing of every provisioning run (otherwise opt-in per request)
+    PROVISION_PROFILING = os.environ.get('PROVISION_PROFILING', 'false').lower() == 'true'
+    
+    # Network map spatial index (seconds before it is rebuilt from the database)
+    MAP_INDEX_TTL = int(os.environ.get('MAP_INDEX_TTL', 60))
+    
+    # Polled API reads: seconds a response snapshot is served (and revalidated
+    # with ETag/Last-Modified) before the router or database is read again,
+    # and compression of bodies above the size threshold
+    HTTP_SNAPSHOT_TTL = float(os.environ.get('HTTP_SNAPSHOT_TTL', 10))
+    HTTP_SNAPSHOT_MAX_BYTES = int(os.environ.get('HTTP_SNAPSHOT_MAX_BYTES', 8 * 1024 * 1024))
+    HTTP_COMPRESS_MIN_BYTES = int(os.environ.get('HTTP_COMPRESS_MIN_BYTES', 1024))
+    HTTP_COMPRESS_LEVEL = int(os.environ.get('HTTP_COMPRESS_LEVEL', 5))
+    
+    # Password hashing: bcrypt cost (each +1 doubles login CPU; tune per host
+    # with benchmarks/bench_login.py), hashing threads per worker (default:
+    # CPU count), logins allowed to wait for one before answering 503, and
+    # the longest a login waits for its hash
+    PASSWORD_BCRYPT_ROUNDS = int(os.environ.get('PASSWORD_BCRYPT_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or None
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 5.0))
+    
+    # Configuration backups
+    BACKUP_STORE_PATH = os.environ.get('BACKUP_STORE_PATH') or \
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backups', 'configs')
+    BACKUP_INGEST_WORKERS = int(os.environ.get('BACKUP_INGEST_WORKERS', 16))
     
     # Logging
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
@@ -72,6 +147,8 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     JWT_SECRET_KEY = 'test-secret-key'
     SECRET_KEY = 'test-secret-key'
+    PASSWORD_BCRYPT_ROUNDS = 4
+    SPEEDTEST_BUFFER_BYTES = 1024 * 1024
 
 
 class ProductionConfig(Config):
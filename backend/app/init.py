@@ -10,8 +10,6 @@ from flask_jwt_extended import JWTManager
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_mail import Mail
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 from prometheus_flask_exporter import PrometheusMetrics
 
 # Initialize extensions
@@ -19,25 +17,54 @@ db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
 mail = Mail()
-limiter = Limiter(key_func=get_remote_address)
 metrics = PrometheusMetrics.for_app_factory()
 
-def create_app(config_class='config.Config'):
-    """Application factory"""
+def create_app(config_class='default'):
+    """Application factory
+    
+    ``config_class`` is a name from ``app.config.config`` ('production',
+    'development', ...), a config class, or an import path to one.
+    """
     app = Flask(__name__)
     
     # Load configuration
-    app.config.from_object(config_class)
+    app.config.from_object(_resolve_config(config_class))
     
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
     mail.init_app(app)
-    limiter.init_app(app)
     metrics.init_app(app)
     CORS(app, resources={r"/api/*": {"origins": app.config['CORS_ORIGINS']}})
     
+    from app.services.metadata_cache import metadata_cache
+    metadata_cache.init_app(app)
+    
+    from app.services.map_index import map_index
+    map_index.init_app(app)
+    
+    from app.services.response_snapshots import response_snapshots
+    response_snapshots.init_app(app)
+    
+    from app.services.password_hashing import password_hasher
+    password_hasher.init_app(app)
+    
+    from app.services.rate_limits import rate_limiter
+    rate_limiter.init_app(app)
+    
+    from app.services.router_scheduler import router_scheduler
+    router_scheduler.init_app(app)
+    
+    from app.services.router_writes import router_writes
+    router_writes.init_app(app)
+    
+    from app.services.speed_test import speed_test
+    speed_test.init_app(app)
+    
+    from app.celery import init_celery
+    init_celery(app)
+    
     # Configure logging
     if not app.debug:
         gunicorn_logger = logging.getLogger('gunicorn.error')
@@ -52,6 +79,7 @@ def create_app(config_class='config.Config'):
     from app.routes.admin import admin_bp
     from app.routes.provisioning import provisioning_bp
     from app.routes.monitoring import monitoring_bp
+    from app.routes.speedtest import speedtest_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(clients_bp, url_prefix='/api/clients')
@@ -60,9 +88,13 @@ def create_app(config_class='config.Config'):
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
     app.register_blueprint(provisioning_bp, url_prefix='/api/provisioning')
     app.register_blueprint(monitoring_bp, url_prefix='/api/monitoring')
+    app.register_blueprint(speedtest_bp, url_prefix='/api/speedtest')
     
     # Health check endpoint
+    from app.services.rate_limits import route_class
+    
     @app.route('/health')
+    @route_class(None)
     def health():
         return jsonify({'status': 'healthy', 'service': 'ispmax-backend'})
     
@@ -78,6 +110,27 @@ def create_app(config_class='config.Config'):
     
     @app.errorhandler(429)
     def ratelimit_handler(e):
-        return jsonify({'error': 'Rate limit exceeded'}), 429
+        response = e.get_response()
+        response.data = jsonify({'error': 'Rate limit exceeded'}).get_data()
+        response.mimetype = 'application/json'
+        return response
+    
+    @app.errorhandler(503)
+    def unavailable_handler(e):
+        response = e.get_response()
+        response.data = jsonify({'error': e.description}).get_data()
+        response.mimetype = 'application/json'
+        return response
     
     return app
+
+def _resolve_config(config_class):
+    if isinstance(config_class, str):
+        from app.config import config
+        if config_class in config:
+            return config[config_class]
+        if '.' not in config_class:
+            # e.g. a mistyped FLASK_ENV; from_object would fail importing it
+            raise ValueError(f"Unknown configuration {config_class!r}, "
+                             f"expected one of {sorted(config)} or an import path")
+    return config_class
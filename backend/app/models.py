@@ -4,7 +4,7 @@ Database models for ISPMAX
 from app import db
 from datetime import datetime, timedelta
 import uuid
-import bcrypt
+from app.services.password_hashing import password_hasher
 
 class TimestampMixin:
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -43,12 +43,20 @@ class User(db.Model, TimestampMixin):
     })
     
     def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        """Hash and set password at the configured bcrypt cost"""
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Verify password"""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        """Verify password; upgrades a hash made at another cost (caller commits)
+
+        Raises HashingOverloaded (503) when the hashing pool is saturated.
+        """
+        if not password_hasher.verify(password, self.password_hash):
+            return False
+        new_hash = password_hasher.upgrade(password, self.password_hash)
+        if new_hash:
+            self.password_hash = new_hash
+        return True
     
     def to_dict(self):
         """Convert to dictionary for API responses"""
@@ -133,6 +141,44 @@ class Client(db.Model, TimestampMixin):
     invoices = db.relationship('Invoice', backref='client', lazy='dynamic')
     tickets = db.relationship('SupportTicket', backref='client', lazy='dynamic')
     
+    # Network identities must be unique per ISP among non-cancelled clients;
+    # the partial unique indexes double as the lookup path for the finders below.
+    __table_args__ = (
+        db.Index('ix_clients_isp_id_status', 'isp_id', 'status'),
+        db.Index('uq_clients_isp_ip_address', 'isp_id', 'ip_address', unique=True,
+                 postgresql_where=db.text("status <> 'cancelled'"),
+                 sqlite_where=db.text("status <> 'cancelled'")),
+        db.Index('uq_clients_isp_mac_address', 'isp_id', 'mac_address', unique=True,
+                 postgresql_where=db.text("status <> 'cancelled'"),
+                 sqlite_where=db.text("status <> 'cancelled'")),
+        db.Index('uq_clients_isp_pppoe_username', 'isp_id', 'pppoe_username', unique=True,
+                 postgresql_where=db.text("status <> 'cancelled'"),
+                 sqlite_where=db.text("status <> 'cancelled'")),
+    )
+    
+    @classmethod
+    def find_by_ip(cls, isp_id: str, ip_address: str):
+        """Find the non-cancelled client holding an IP address"""
+        return cls.query.filter(cls.isp_id == isp_id, cls.ip_address == ip_address,
+                                cls.status != 'cancelled').first()
+    
+    @classmethod
+    def find_by_mac(cls, isp_id: str, mac_address: str):
+        """Find the non-cancelled client owning a MAC address"""
+        return cls.query.filter(cls.isp_id == isp_id, cls.mac_address == mac_address,
+                                cls.status != 'cancelled').first()
+    
+    @classmethod
+    def find_by_pppoe_username(cls, isp_id: str, username: str):
+        """Find the non-cancelled client using a PPPoE username"""
+        return cls.query.filter(cls.isp_id == isp_id, cls.pppoe_username == username,
+                                cls.status != 'cancelled').first()
+    
+    @classmethod
+    def with_status(cls, isp_id: str, status: str):
+        """Query clients of an ISP in a given status"""
+        return cls.query.filter(cls.isp_id == isp_id, cls.status == status)
+    
     def to_dict(self):
         """Convert to dictionary for API responses"""
         return {
@@ -229,6 +275,12 @@ class Invoice(db.Model, TimestampMixin):
     # PDF
     pdf_url = db.Column(db.String(255))
     
+    # One invoice per client and billing period; makes billing runs idempotent
+    __table_args__ = (
+        db.Index('uq_invoices_client_id_period_start', 'client_id', 'period_start', unique=True),
+        db.Index('ix_invoices_status_due_date', 'status', 'due_date'),
+    )
+    
     def to_dict(self):
         """Convert to dictionary for API responses"""
         return {
@@ -242,6 +294,80 @@ class Invoice(db.Model, TimestampMixin):
         }
 
 
+class ClientUsage(db.Model, TimestampMixin):
+    __tablename__ = 'client_usage'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    client_id = db.Column(db.String(36), db.ForeignKey('clients.id'), nullable=False)
+    
+    # Billing period
+    period_start = db.Column(db.DateTime, nullable=False)
+    period_end = db.Column(db.DateTime)
+    
+    # Accumulated traffic (queue upload/download counters)
+    bytes_up = db.Column(db.BigInteger, default=0, nullable=False)
+    bytes_down = db.Column(db.BigInteger, default=0, nullable=False)
+    
+    # Data limit enforcement
+    limit_exceeded_at = db.Column(db.DateTime)
+    limit_action = db.Column(db.String(20))  # throttle, suspend
+    
+    __table_args__ = (
+        db.Index('uq_client_usage_client_id_period_start', 'client_id', 'period_start', unique=True),
+    )
+    
+    def to_dict(self):
+        """Convert to dictionary for API responses"""
+        return {
+            'client_id': self.client_id,
+            'period_start': self.period_start.isoformat() if self.period_start else None,
+            'period_end': self.period_end.isoformat() if self.period_end else None,
+            'bytes_up': self.bytes_up,
+            'bytes_down': self.bytes_down,
+            'limit_exceeded_at': self.limit_exceeded_at.isoformat() if self.limit_exceeded_at else None,
+            'limit_action': self.limit_action
+        }
+
+
+class SpeedTestResult(db.Model, TimestampMixin):
+    __tablename__ = 'speed_test_results'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    client_id = db.Column(db.String(36), db.ForeignKey('clients.id'), nullable=False)
+    
+    # Measured by the browser against /api/speedtest
+    download_mbps = db.Column(db.Float)
+    upload_mbps = db.Column(db.Float)
+    ping_ms = db.Column(db.Float)
+    jitter_ms = db.Column(db.Float)
+    bytes_down = db.Column(db.BigInteger)
+    bytes_up = db.Column(db.BigInteger)
+    
+    # Where the test ran from and against
+    server = db.Column(db.String(100))
+    ip_address = db.Column(db.String(45))
+    user_agent = db.Column(db.String(255))
+    
+    __table_args__ = (
+        db.Index('ix_speed_test_results_client_id_created_at', 'client_id', 'created_at'),
+    )
+    
+    def to_dict(self):
+        """Convert to dictionary for API responses"""
+        return {
+            'id': self.id,
+            'client_id': self.client_id,
+            'download_mbps': self.download_mbps,
+            'upload_mbps': self.upload_mbps,
+            'ping_ms': self.ping_ms,
+            'jitter_ms': self.jitter_ms,
+            'bytes_down': self.bytes_down,
+            'bytes_up': self.bytes_up,
+            'server': self.server,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
 class MikroTikRouter(db.Model, TimestampMixin):
     __tablename__ = 'mikrotik_routers'
     
@@ -278,6 +404,15 @@ class MikroTikRouter(db.Model, TimestampMixin):
     backup_enabled = db.Column(db.Boolean, default=True)
     backup_schedule = db.Column(db.String(20), default='daily')  # daily, weekly, monthly
     
+    __table_args__ = (
+        db.Index('ix_mikrotik_routers_isp_id_is_active', 'isp_id', 'is_active'),
+    )
+    
+    @classmethod
+    def active_for_isp(cls, isp_id: str):
+        """Resolve the active router serving an ISP"""
+        return cls.query.filter(cls.isp_id == isp_id, cls.is_active.is_(True)).first()
+    
     def to_dict(self):
         """Convert to dictionary for API responses"""
         return {
@@ -0,0 +1,49 @@
+"""
+Billing API endpoints
+"""
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from app.services.billing_service import BillingRunService
+from app.services.collections_service import OverduePipeline
+from datetime import date
+import logging
+
+billing_bp = Blueprint('billing', __name__)
+logger = logging.getLogger(__name__)
+
+@billing_bp.route('/runs', methods=['POST'])
+@jwt_required()
+def run_billing():
+    """Generate the invoices due on a date (default today)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        run_date = date.fromisoformat(data['date']) if data.get('date') else None
+        
+        service = BillingRunService(
+            batch_size=current_app.config['BILLING_BATCH_SIZE'],
+            due_days=current_app.config['BILLING_DUE_DAYS']
+        )
+        result = service.run(run_date, isp_id=data.get('isp_id'))
+        return jsonify({'success': True, 'run': result}), 200
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid date'}), 400
+    except Exception as e:
+        logger.error(f"Error running billing: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@billing_bp.route('/overdue/run', methods=['POST'])
+@jwt_required()
+def run_overdue():
+    """Mark past-due invoices overdue and queue suspensions for their clients"""
+    try:
+        data = request.get_json(silent=True) or {}
+        pipeline = OverduePipeline(
+            batch_size=current_app.config['OVERDUE_BATCH_SIZE'],
+            grace_days=current_app.config['OVERDUE_GRACE_DAYS'],
+            suspension_chunk=current_app.config['OVERDUE_SUSPENSION_CHUNK']
+        )
+        result = pipeline.run(isp_id=data.get('isp_id'), dry_run=bool(data.get('dry_run')))
+        return jsonify({'success': True, 'run': result}), 200
+    except Exception as e:
+        logger.error(f"Error processing overdue invoices: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
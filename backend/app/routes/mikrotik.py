@@ -2,11 +2,27 @@
 """
 MikroTik API endpoints
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import MikroTikRouter, Client, Plan
+from app.models import MikroTikRouter, Client
 from app.services.mikrotik_service import MikroTikService
 from app.services.mikrotik_advanced_service import MikroTikAdvancedService
+from app.services.backup_store import get_backup_store
+from app.services.config_drift_service import ConfigDriftService
+from app.services.provisioning_profile import ProvisioningProfileStore
+from app.services.query_service import client_list, router_list
+from app.services.response_snapshots import ROUTERS_SCOPE, response_snapshots
+from app.services.routeros_metrics import command_stats
+from app.services.health_service import HealthScoringService
+from app.services.json_stream import dumps, iter_envelope
+from app.services.map_index import map_index, parse_bbox
+from app.services.rate_limits import ROUTER_CLASS, route_class
+from app.services.router_scheduler import WRITE, RouterBusy, router_scheduler
+from app.services.router_writes import router_writes
+from app.services.metadata_cache import metadata_cache
+from app.services.traffic_service import TrafficService
+from app.services.usage_service import UsageAccountingService
+from datetime import datetime
 import logging
 
 mikrotik_bp = Blueprint('mikrotik', __name__)
@@ -15,18 +31,60 @@ logger = logging.getLogger(__name__)
 @mikrotik_bp.route('/routers', methods=['GET'])
 @jwt_required()
 def get_routers():
-    """Get all MikroTik routers"""
+    """Get MikroTik routers, one keyset page at a time"""
     try:
-        routers = MikroTikRouter.query.all()
+        cached = response_snapshots.cached(ROUTERS_SCOPE)
+        if cached is not None:
+            return cached
+        
+        page = router_list.page(request.args)
+        return response_snapshots.respond(ROUTERS_SCOPE, [dumps({
+            'success': True,
+            'routers': page['items'],
+            'next_cursor': page['next_cursor']
+        })])
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error getting routers: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@mikrotik_bp.route('/clients', methods=['GET'])
+@jwt_required()
+def get_clients():
+    """Get clients, one keyset page at a time"""
+    try:
+        page = client_list.page(request.args)
         return jsonify({
             'success': True,
-            'routers': [r.to_dict() for r in routers]
+            'clients': page['items'],
+            'next_cursor': page['next_cursor']
         }), 200
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
-        logger.error(f"Error getting routers: {e}")
+        logger.error(f"Error getting clients: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@mikrotik_bp.route('/clients/<client_id>/usage', methods=['GET'])
+@jwt_required()
+def get_client_usage(client_id):
+    """Get a client's traffic per billing period, newest first"""
+    try:
+        limit = min(int(request.args.get('limit', 12)), 120)
+        return jsonify({
+            'success': True,
+            'client_id': client_id,
+            'usage': UsageAccountingService.usage_for(client_id, limit=limit)
+        }), 200
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit'}), 400
+    except Exception as e:
+        logger.error(f"Error getting client usage: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @mikrotik_bp.route('/routers/<router_id>', methods=['GET'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def get_router(router_id):
     """Get specific router details"""
@@ -49,11 +107,14 @@ def get_router(router_id):
             'info': router_info,
             'interfaces': interface_stats
         }), 200
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error getting router {router_id}: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @mikrotik_bp.route('/provision', methods=['POST'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def provision_client():
     """Provision a new client on MikroTik"""
@@ -66,28 +127,69 @@ def provision_client():
             return jsonify({'success': False, 'error': 'Missing client_id or router_id'}), 400
         
         client = Client.query.get(client_id)
-        router = MikroTikRouter.query.get(router_id)
+        router = metadata_cache.get_router(router_id)
         
         if not client:
             return jsonify({'success': False, 'error': 'Client not found'}), 404
         if not router:
             return jsonify({'success': False, 'error': 'Router not found'}), 404
         
+        from app import db
+        previous = client.status
+        # Re-provisioning can be deferred and merged with other pending
+        # changes; custom config needs the synchronous path. The flush reads
+        # the committed status, so it is committed before buffering.
+        deferred = bool(data.get('defer')) and not data.get('config')
+        if deferred:
+            client.status = 'active'
+            db.session.commit()
+            if router_writes.enqueue(router_id, client_id, provision=True):
+                return jsonify({'success': True, 'queued': True, 'message': 'Provisioning queued'}), 202
+        
         # Provision client
-        service = MikroTikService(router_id)
-        results = service.provision_client(client, client.plan, data.get('config', {}))
+        results = {'success': False}
+        try:
+            service = MikroTikService(router_id, priority=WRITE)
+            plan = metadata_cache.get_plan(client.plan_id) if client.plan_id else None
+            results = service.provision_client(client, plan, data.get('config', {}),
+                                               profile=data.get('profile'))
+        finally:
+            if deferred and not results['success']:
+                client.status = previous
+                db.session.commit()
         
         if results['success']:
             client.status = 'active'
-            from app import db
             db.session.commit()
+            response_snapshots.invalidate_router(router_id)
         
         return jsonify(results), 200 if results['success'] else 500
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error provisioning client: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@mikrotik_bp.route('/provision/profile', methods=['GET'])
+@jwt_required()
+def get_provisioning_profile():
+    """Slowest provisioning steps per router model and RouterOS version"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 500))
+        result = ProvisioningProfileStore().slowest_steps(
+            limit=limit,
+            model=request.args.get('model'),
+            version=request.args.get('version')
+        )
+        return jsonify({'success': True, **result}), 200
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit'}), 400
+    except Exception as e:
+        logger.error(f"Error reading provisioning profile: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @mikrotik_bp.route('/clients/<client_id>/suspend', methods=['POST'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def suspend_client(client_id):
     """Suspend client access"""
@@ -100,25 +202,42 @@ def suspend_client(client_id):
             return jsonify({'success': False, 'error': 'Client not found'}), 404
         
         # Find router for this client
-        router = MikroTikRouter.query.filter_by(isp_id=client.isp_id, is_active=True).first()
+        router = metadata_cache.get_active_router_for_isp(client.isp_id)
         if not router:
             return jsonify({'success': False, 'error': 'No active router found'}), 404
         
-        service = MikroTikService(router.id)
-        success = service.suspend_client(client, reason)
+        # Committed first, as the flush applies whatever the database holds;
+        # buffered with other changes to this router, applied within the window
+        from app import db
+        previous = client.status
+        client.status = 'suspended'
+        db.session.commit()
+        if router_writes.enqueue(router.id, client.id, status=True, reason=reason):
+            return jsonify({'success': True, 'queued': True,
+                            'message': f'Client suspension queued: {reason}'}), 202
+        
+        success = False
+        try:
+            service = MikroTikService(router.id, priority=WRITE)
+            success = service.suspend_client(client, reason)
+        finally:
+            if not success:
+                client.status = previous
+                db.session.commit()
         
         if success:
-            client.status = 'suspended'
-            from app import db
-            db.session.commit()
+            response_snapshots.invalidate_router(router.id)
             return jsonify({'success': True, 'message': f'Client suspended: {reason}'}), 200
         else:
             return jsonify({'success': False, 'error': 'Failed to suspend client'}), 500
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error suspending client: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @mikrotik_bp.route('/clients/<client_id>/activate', methods=['POST'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def activate_client(client_id):
     """Activate suspended client"""
@@ -127,25 +246,39 @@ def activate_client(client_id):
         if not client:
             return jsonify({'success': False, 'error': 'Client not found'}), 404
         
-        router = MikroTikRouter.query.filter_by(isp_id=client.isp_id, is_active=True).first()
+        router = metadata_cache.get_active_router_for_isp(client.isp_id)
         if not router:
             return jsonify({'success': False, 'error': 'No active router found'}), 404
         
-        service = MikroTikService(router.id)
-        success = service.activate_client(client)
+        from app import db
+        previous = client.status
+        client.status = 'active'
+        db.session.commit()
+        if router_writes.enqueue(router.id, client.id, status=True):
+            return jsonify({'success': True, 'queued': True, 'message': 'Client activation queued'}), 202
+        
+        success = False
+        try:
+            service = MikroTikService(router.id, priority=WRITE)
+            success = service.activate_client(client)
+        finally:
+            if not success:
+                client.status = previous
+                db.session.commit()
         
         if success:
-            client.status = 'active'
-            from app import db
-            db.session.commit()
+            response_snapshots.invalidate_router(router.id)
             return jsonify({'success': True, 'message': 'Client activated'}), 200
         else:
             return jsonify({'success': False, 'error': 'Failed to activate client'}), 500
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error activating client: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @mikrotik_bp.route('/clients/<client_id>/update-speed', methods=['POST'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def update_client_speed(client_id):
     """Update client speed/plan"""
@@ -157,74 +290,213 @@ def update_client_speed(client_id):
         if not client:
             return jsonify({'success': False, 'error': 'Client not found'}), 404
         
-        new_plan = Plan.query.get(plan_id)
+        new_plan = metadata_cache.get_plan(plan_id)
         if not new_plan:
             return jsonify({'success': False, 'error': 'Plan not found'}), 404
         
-        router = MikroTikRouter.query.filter_by(isp_id=client.isp_id, is_active=True).first()
+        router = metadata_cache.get_active_router_for_isp(client.isp_id)
         if not router:
             return jsonify({'success': False, 'error': 'No active router found'}), 404
         
-        service = MikroTikService(router.id)
-        success = service.update_client_speed(client, new_plan)
+        from app import db
+        previous = client.plan_id
+        client.plan_id = plan_id
+        db.session.commit()
+        if router_writes.enqueue(router.id, client.id, plan=True):
+            return jsonify({'success': True, 'queued': True,
+                            'message': f'Speed change to {new_plan.name} queued'}), 202
+        
+        success = False
+        try:
+            service = MikroTikService(router.id, priority=WRITE)
+            success = service.update_client_speed(client, new_plan)
+        finally:
+            if not success:
+                client.plan_id = previous
+                db.session.commit()
         
         if success:
-            client.plan_id = plan_id
-            from app import db
-            db.session.commit()
+            response_snapshots.invalidate_router(router.id)
             return jsonify({'success': True, 'message': f'Speed updated to {new_plan.name}'}), 200
         else:
             return jsonify({'success': False, 'error': 'Failed to update speed'}), 500
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error updating client speed: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @mikrotik_bp.route('/routers/<router_id>/health', methods=['GET'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def get_router_health(router_id):
     """Get router health status"""
     try:
+        scope = f'router:{router_id}:health'
+        cached = response_snapshots.cached(scope)
+        if cached is not None:
+            return cached
+        
         service = MikroTikService(router_id)
         if not service.api:
             return jsonify({'success': False, 'error': 'Could not connect to router'}), 500
         
         health = service.get_system_health()
-        return jsonify({'success': True, 'health': health}), 200
+        return response_snapshots.respond(scope, [dumps({'success': True, 'health': health})],
+                                          cacheable=lambda: 'error' not in health)
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error getting router health: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@mikrotik_bp.route('/health/worst', methods=['GET'])
+@jwt_required()
+def get_worst_routers():
+    """Rank routers by baseline-aware health score from cached samples"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 500))
+        scorer = HealthScoringService(alpha=current_app.config['HEALTH_EWMA_ALPHA'],
+                                      warmup=current_app.config['HEALTH_WARMUP_SAMPLES'])
+        return jsonify({'success': True, **scorer.worst_routers(limit=limit)}), 200
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit'}), 400
+    except Exception as e:
+        logger.error(f"Error ranking router health: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @mikrotik_bp.route('/routers/<router_id>/queues', methods=['GET'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def get_router_queues(router_id):
-    """Get router queue statistics"""
+    """Stream router queue statistics (?limit=N, default 50, or limit=all)"""
     try:
+        limit = request.args.get('limit', '50')
+        limit = None if limit == 'all' else max(1, int(limit))
+        
+        scope = f'router:{router_id}:queues'
+        cached = response_snapshots.cached(scope)
+        if cached is not None:
+            return cached
+        
         service = MikroTikService(router_id)
         if not service.api:
             return jsonify({'success': False, 'error': 'Could not connect to router'}), 500
         
-        queues = service.get_queue_stats()
-        return jsonify({'success': True, 'queues': queues}), 200
+        trailer = {}
+        chunks = iter_envelope('queues', service.iter_queue_stats(limit=limit),
+                               on_close=service.disconnect, trailer=trailer)
+        return response_snapshots.respond(scope, chunks, cacheable=lambda: trailer.get('complete', False))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error getting router queues: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@mikrotik_bp.route('/top-talkers', methods=['GET'])
+@jwt_required()
+def get_top_talkers():
+    """Rank queues by current rate, fleet-wide or for one router, from cached samples"""
+    try:
+        n = max(1, min(int(request.args.get('n', 10)), 500))
+        result = TrafficService().top_talkers(
+            n=n,
+            router_id=request.args.get('router_id'),
+            by=request.args.get('by', 'total')
+        )
+        return jsonify({'success': True, **result}), 200
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error ranking top talkers: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@mikrotik_bp.route('/map', methods=['GET'])
+@jwt_required()
+def get_map():
+    """Clients or routers inside a bounding box, clustered for the zoom level"""
+    try:
+        layer = request.args.get('layer', 'clients')
+        zoom = max(0, min(int(request.args.get('zoom', 12)), 22))
+        bbox = parse_bbox(request.args.get('bbox'))
+        
+        index = map_index.get(layer)
+        positions = index.query(bbox, isp_id=request.args.get('isp_id'))
+        return jsonify({
+            'success': True,
+            'layer': layer,
+            'zoom': zoom,
+            'total': len(positions),
+            **index.clusters(positions, zoom)
+        }), 200
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error building map view: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@mikrotik_bp.route('/debug/commands', methods=['GET'])
+@jwt_required()
+def get_command_stats():
+    """RouterOS API latency, rows and bytes per router, path and verb (this process)"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), 1000))
+        result = command_stats.summary(
+            router=request.args.get('router_id'),
+            limit=limit,
+            sort=request.args.get('sort', 'total_seconds')
+        )
+        return jsonify({'success': True, **result}), 200
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error reading command stats: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@mikrotik_bp.route('/debug/scheduler', methods=['GET'])
+@jwt_required()
+def get_scheduler_stats():
+    """Sessions, in-flight commands, queue depth and wait time per router (this process)"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), 1000))
+        result = router_scheduler.stats(router_id=request.args.get('router_id'))
+        result['routers'] = result['routers'][:limit]
+        return jsonify({'success': True, **result}), 200
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error reading scheduler stats: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @mikrotik_bp.route('/routers/<router_id>/connections', methods=['GET'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def get_router_connections(router_id):
-    """Get active connections"""
+    """Stream active DHCP leases and PPPoE sessions"""
     try:
+        scope = f'router:{router_id}:connections'
+        cached = response_snapshots.cached(scope)
+        if cached is not None:
+            return cached
+        
         service = MikroTikService(router_id)
         if not service.api:
             return jsonify({'success': False, 'error': 'Could not connect to router'}), 500
         
-        connections = service.get_active_connections()
-        return jsonify({'success': True, 'connections': connections}), 200
+        trailer = {}
+        chunks = iter_envelope('connections', service.iter_active_connections(),
+                               on_close=service.disconnect, trailer=trailer)
+        return response_snapshots.respond(scope, chunks, cacheable=lambda: trailer.get('complete', False))
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error getting connections: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @mikrotik_bp.route('/routers/<router_id>/backup', methods=['POST'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def backup_router(router_id):
     """Backup router configuration"""
@@ -238,11 +510,144 @@ def backup_router(router_id):
         
         result = service.backup_configuration(backup_name)
         return jsonify(result), 200 if result['success'] else 500
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error backing up router: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@mikrotik_bp.route('/routers/<router_id>/backups', methods=['GET'])
+@jwt_required()
+def list_router_backups(router_id):
+    """List stored configuration versions for a router"""
+    try:
+        store = get_backup_store()
+        return jsonify({
+            'success': True,
+            'backups': store.list_versions(router_id),
+            'stats': store.stats(router_id)
+        }), 200
+    except Exception as e:
+        logger.error(f"Error listing backups for router {router_id}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@mikrotik_bp.route('/routers/<router_id>/backups/diff', methods=['GET'])
+@jwt_required()
+def diff_router_backups(router_id):
+    """Stream a unified diff between two stored versions"""
+    try:
+        store = get_backup_store()
+        old_version = request.args.get('from')
+        new_version = request.args.get('to') or store.latest_version(router_id)
+        
+        if not old_version or not new_version:
+            return jsonify({'success': False, 'error': 'Missing from/to versions'}), 400
+        
+        store.get_manifest(router_id, old_version)
+        store.get_manifest(router_id, new_version)
+        
+        return Response(
+            stream_with_context(store.diff(router_id, old_version, new_version)),
+            mimetype='text/plain'
+        )
+    except KeyError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error diffing backups for router {router_id}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@mikrotik_bp.route('/routers/<router_id>/backups/<version>', methods=['GET'])
+@jwt_required()
+def get_router_backup(router_id, version):
+    """Stream a stored configuration export"""
+    try:
+        store = get_backup_store()
+        store.get_manifest(router_id, version)
+        return Response(
+            stream_with_context(store.iter_export(router_id, version)),
+            mimetype='text/plain'
+        )
+    except KeyError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error fetching backup {version} for router {router_id}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@mikrotik_bp.route('/backups/run', methods=['POST'])
+@route_class(ROUTER_CLASS)
+@jwt_required()
+def run_fleet_backup():
+    """Back up all active routers with backups enabled"""
+    try:
+        router_ids = [r.id for r in MikroTikRouter.query.filter_by(
+            is_active=True, backup_enabled=True
+        ).with_entities(MikroTikRouter.id)]
+        
+        results = MikroTikService.backup_routers(router_ids)
+        failed = [rid for rid, result in results.items() if not result.get('success')]
+        
+        return jsonify({
+            'success': not failed,
+            'total': len(results),
+            'failed': failed
+        }), 200
+    except Exception as e:
+        logger.error(f"Error running fleet backup: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@mikrotik_bp.route('/routers/<router_id>/drift', methods=['GET'])
+@route_class(ROUTER_CLASS)
+@jwt_required()
+def get_router_drift(router_id):
+    """Compare a router's config against its baseline or an earlier version"""
+    try:
+        drift = ConfigDriftService().drift(
+            router_id,
+            against=request.args.get('against', 'baseline'),
+            version=request.args.get('version'),
+            include_lines=request.args.get('lines', 'false').lower() == 'true'
+        )
+        return jsonify({'success': True, 'drift': drift}), 200
+    except KeyError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error computing drift for router {router_id}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@mikrotik_bp.route('/routers/<router_id>/drift/baseline', methods=['POST'])
+@route_class(ROUTER_CLASS)
+@jwt_required()
+def set_router_drift_baseline(router_id):
+    """Mark a backup version as the provisioned baseline"""
+    try:
+        data = request.get_json(silent=True) or {}
+        version = ConfigDriftService().mark_baseline(router_id, data.get('version'))
+        return jsonify({'success': True, 'baseline': version}), 200
+    except KeyError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error setting drift baseline for router {router_id}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@mikrotik_bp.route('/drift/changes', methods=['GET'])
+@jwt_required()
+def get_fleet_drift():
+    """List routers whose configuration changed since a point in time"""
+    try:
+        since = request.args.get('since')
+        if not since:
+            return jsonify({'success': False, 'error': 'Missing since'}), 400
+        
+        changes = ConfigDriftService().changes_since(datetime.fromisoformat(since))
+        return jsonify({'success': True, 'routers': changes, 'count': len(changes)}), 200
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid since timestamp'}), 400
+    except Exception as e:
+        logger.error(f"Error getting fleet drift: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @mikrotik_bp.route('/routers/<router_id>/reboot', methods=['POST'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def reboot_router(router_id):
     """Reboot MikroTik router"""
@@ -253,11 +658,14 @@ def reboot_router(router_id):
         
         success = service.reboot_router()
         return jsonify({'success': success}), 200 if success else 500
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error rebooting router: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @mikrotik_bp.route('/routers/<router_id>/execute-script', methods=['POST'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def execute_script(router_id):
     """Execute script on router"""
@@ -274,11 +682,14 @@ def execute_script(router_id):
         
         result = service.execute_script(script_content)
         return jsonify(result), 200
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error executing script: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @mikrotik_bp.route('/routers/<router_id>/hotspot', methods=['POST'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def configure_hotspot(router_id):
     """Configure hotspot on router"""
@@ -291,11 +702,14 @@ def configure_hotspot(router_id):
         
         success = service.configure_hotspot(data)
         return jsonify({'success': success}), 200 if success else 500
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error configuring hotspot: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @mikrotik_bp.route('/routers/<router_id>/multi-wan', methods=['POST'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def configure_multi_wan(router_id):
     """Configure multi-WAN on router"""
@@ -308,11 +722,14 @@ def configure_multi_wan(router_id):
         
         success = service.configure_multi_wan(data)
         return jsonify({'success': success}), 200 if success else 500
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error configuring multi-WAN: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @mikrotik_bp.route('/discover', methods=['GET'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def discover_routers():
     """Discover MikroTik routers in network"""
@@ -331,6 +748,7 @@ def discover_routers():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @mikrotik_bp.route('/advanced/provision', methods=['POST'])
+@route_class(ROUTER_CLASS)
 @jwt_required()
 def advanced_provision():
     """Advanced provisioning with v6/v7 support"""
@@ -342,7 +760,7 @@ def advanced_provision():
         if not router_id or not client_id:
             return jsonify({'success': False, 'error': 'Missing router_id or client_id'}), 400
         
-        router = MikroTikRouter.query.get(router_id)
+        router = metadata_cache.get_router(router_id)
         client = Client.query.get(client_id)
         
         if not router:
@@ -355,10 +773,15 @@ def advanced_provision():
             router.ip_address,
             router.username,
             router.password,
-            router.api_port
+            router.api_port,
+            router_id=router.id
         )
         
-        results = service.provision_client(client, client.plan)
+        plan = metadata_cache.get_plan(client.plan_id) if client.plan_id else None
+        results = service.provision_client(
+            client, plan,
+            profile=data.get('profile', current_app.config.get('PROVISION_PROFILING', False))
+        )
         
         if results['success']:
             client.status = 'active'
@@ -366,6 +789,8 @@ def advanced_provision():
             db.session.commit()
         
         return jsonify(results), 200
+    except RouterBusy as e:
+        return jsonify({'success': False, 'error': e.description}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error in advanced provisioning: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
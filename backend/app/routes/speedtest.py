@@ -0,0 +1,146 @@
+"""
+Speed test API endpoints
+"""
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app import db
+from app.models import Client, SpeedTestResult
+from app.services.metadata_cache import metadata_cache
+from app.services.rate_limits import route_class
+from app.services.speed_test import mbps, no_store, speed_test, summarize_samples
+import logging
+import socket
+import time
+
+speedtest_bp = Blueprint('speedtest', __name__)
+logger = logging.getLogger(__name__)
+
+SERVER_NAME = socket.gethostname()
+
+# The probes below are exempt from the ISP's request budget: one test is a
+# few dozen requests, and a tenant's subscribers testing at once must not
+# throttle each other or its dashboards. Saving a result is budgeted.
+
+@speedtest_bp.route('/ping', methods=['GET'])
+@route_class(None)
+@jwt_required()
+def ping():
+    """Latency probe; the browser times a series of these for ping and jitter"""
+    return no_store(jsonify({'server': SERVER_NAME, 'time': time.time()}))
+
+@speedtest_bp.route('/download', methods=['GET'])
+@route_class(None)
+@jwt_required()
+def download():
+    """Stream incompressible payload (?bytes=, at most SPEEDTEST_BUFFER_BYTES)"""
+    try:
+        nbytes = request.args.get('bytes')
+        return speed_test.download(int(nbytes) if nbytes else None)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid bytes'}), 400
+    except Exception as e:
+        logger.error(f"Error serving speed test download: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@speedtest_bp.route('/upload', methods=['POST'])
+@route_class(None)
+@jwt_required()
+def upload():
+    """Receive and discard a request body, reporting how fast it arrived"""
+    nbytes, seconds = speed_test.drain(request.stream, request.content_length)
+    return no_store(jsonify({
+        'success': True,
+        'bytes': nbytes,
+        'seconds': round(seconds, 6),
+        'mbps': mbps(nbytes, seconds)
+    }))
+
+@speedtest_bp.route('/results', methods=['POST'])
+@jwt_required()
+def save_result():
+    """Store a finished test for the caller's client (staff pass client_id)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        client_id = _resolve_client(data.get('client_id'))
+
+        result = SpeedTestResult(
+            client_id=client_id,
+            download_mbps=_number(data, 'download_mbps'),
+            upload_mbps=_number(data, 'upload_mbps'),
+            ping_ms=_number(data, 'ping_ms'),
+            jitter_ms=_number(data, 'jitter_ms'),
+            bytes_down=_number(data, 'bytes_down', int),
+            bytes_up=_number(data, 'bytes_up', int),
+            server=SERVER_NAME,
+            ip_address=request.remote_addr,
+            user_agent=(request.user_agent.string or '')[:255] or None
+        )
+        if data.get('ping_samples'):
+            summary = summarize_samples(list(data['ping_samples']))
+            result.ping_ms = summary['ping_ms']
+            result.jitter_ms = summary['jitter_ms']
+
+        db.session.add(result)
+        db.session.commit()
+        return jsonify({'success': True, 'result': result.to_dict()}), 201
+    except PermissionError as e:
+        return jsonify({'success': False, 'error': str(e)}), 403
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error saving speed test result: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@speedtest_bp.route('/results', methods=['GET'])
+@jwt_required()
+def list_results():
+    """A client's speed tests, newest first (?client_id= for staff, &limit=)"""
+    try:
+        client_id = _resolve_client(request.args.get('client_id'))
+        limit = max(1, min(int(request.args.get('limit', 20)), 200))
+        results = SpeedTestResult.query.filter_by(client_id=client_id) \
+            .order_by(SpeedTestResult.created_at.desc()).limit(limit).all()
+        return jsonify({
+            'success': True,
+            'client_id': client_id,
+            'results': [r.to_dict() for r in results]
+        }), 200
+    except PermissionError as e:
+        return jsonify({'success': False, 'error': str(e)}), 403
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error listing speed test results: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _resolve_client(requested):
+    """Client the caller may record or read tests for
+
+    Subscribers always get their own client; staff name one, limited to
+    their ISP when they belong to one.
+    """
+    user = metadata_cache.get_user(str(get_jwt_identity()))
+    if user is None:
+        raise PermissionError('Unknown user')
+    if user.role == 'client':
+        if not user.client_id:
+            raise PermissionError('User has no client account')
+        return user.client_id
+    if not requested:
+        raise ValueError('client_id is required')
+    client = db.session.query(Client.id, Client.isp_id).filter(Client.id == requested).first()
+    if client is None:
+        raise ValueError('Client not found')
+    if user.isp_id and client.isp_id != user.isp_id:
+        raise PermissionError('Client belongs to another ISP')
+    return client.id
+
+def _number(data, field, cast=float):
+    value = data.get(field)
+    if value is None:
+        return None
+    value = cast(value)
+    if value < 0:
+        raise ValueError(f'{field} must not be negative')
+    return value
@@ -0,0 +1,287 @@
+"""
+Configuration Backup Store
+Content-addressed, deduplicated storage for RouterOS /export output
+"""
+import difflib
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Chunk boundaries are content-defined on line boundaries, so inserting a
+# line only re-chunks its neighbourhood instead of shifting every chunk.
+MIN_CHUNK_SIZE = 2 * 1024
+MAX_CHUNK_SIZE = 16 * 1024
+BOUNDARY_MASK = 0x1F
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+
+def chunk_lines(lines: Iterable[bytes]) -> Iterator[bytes]:
+    """Group export lines into content-defined chunks"""
+    buffer: List[bytes] = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= MAX_CHUNK_SIZE or (
+                size >= MIN_CHUNK_SIZE and zlib.crc32(line) & BOUNDARY_MASK == 0):
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def iter_encoded_lines(lines: Iterable) -> Iterator[bytes]:
+    """Normalize str/bytes lines to newline-terminated UTF-8 bytes"""
+    for line in lines:
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        if not line.endswith(b'\n'):
+            line += b'\n'
+        yield line
+
+
+def version_timestamp(moment: datetime) -> str:
+    """UTC ``YYYYMMDDTHHMMSSZ`` prefix of version ids; naive datetimes are taken as UTC"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.strftime('%Y%m%dT%H%M%SZ')
+
+
+def safe_name(value: str) -> str:
+    """Make an identifier safe to use as a file or directory name"""
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in str(value))
+
+
+def write_atomic(path: str, data: bytes):
+    """Write via a temp file and rename so concurrent writers never see partial data"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class ConfigBackupStore:
+    """Local content-addressed store for router configuration exports
+
+    Layout::
+
+        <root>/objects/<aa>/<sha256>     zlib-compressed chunk
+        <root>/manifests/<router>/<version>.json
+    """
+
+    def __init__(self, root: str, compression_level: int = 6):
+        self.root = root
+        self.compression_level = compression_level
+        self.objects_dir = os.path.join(root, 'objects')
+        self.manifests_dir = os.path.join(root, 'manifests')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+    # ==================== INGEST ====================
+
+    def ingest(self, router_id: str, lines: Iterable, name: str = None,
+               created_at: datetime = None) -> Dict:
+        """Store an export streamed as lines and return its manifest"""
+        created_at = created_at or datetime.utcnow()
+        digest = hashlib.sha256()
+        chunks: List[Tuple[str, int, int]] = []
+        size = 0
+        stored_size = 0
+
+        for chunk in chunk_lines(iter_encoded_lines(lines)):
+            digest.update(chunk)
+            chunk_hash = hashlib.sha256(chunk).hexdigest()
+            stored_size += self._put_object(chunk_hash, chunk)
+            chunks.append((chunk_hash, len(chunk), chunk.count(b'\n')))
+            size += len(chunk)
+
+        export_digest = digest.hexdigest()
+        version = f"{version_timestamp(created_at)}-{export_digest[:12]}"
+        manifest = {
+            'router_id': router_id,
+            'version': version,
+            'name': name or version,
+            'created_at': created_at.isoformat(),
+            'digest': export_digest,
+            'size': size,
+            'stored_size': stored_size,
+            'chunks': chunks
+        }
+        write_atomic(self._manifest_path(router_id, version),
+                     json.dumps(manifest).encode('utf-8'))
+        logger.info(f"Backup {version} stored for router {router_id}: "
+                    f"{size} bytes, {stored_size} new bytes on disk")
+        return manifest
+
+    # ==================== READ ====================
+
+    def list_versions(self, router_id: str) -> List[Dict]:
+        """List stored versions for a router, newest first, without chunk lists"""
+        router_dir = os.path.join(self.manifests_dir, safe_name(router_id))
+        if not os.path.isdir(router_dir):
+            return []
+
+        versions = []
+        for filename in sorted(os.listdir(router_dir), reverse=True):
+            if not filename.endswith('.json'):
+                continue
+            manifest = self.get_manifest(router_id, filename[:-5])
+            manifest.pop('chunks', None)
+            versions.append(manifest)
+        return versions
+
+    def latest_version(self, router_id: str) -> Optional[str]:
+        """Return the newest version identifier for a router"""
+        router_dir = os.path.join(self.manifests_dir, safe_name(router_id))
+        if not os.path.isdir(router_dir):
+            return None
+        names = [f[:-5] for f in os.listdir(router_dir) if f.endswith('.json')]
+        return max(names) if names else None
+
+    def get_manifest(self, router_id: str, version: str) -> Dict:
+        """Load a version manifest"""
+        path = self._manifest_path(router_id, version)
+        if not os.path.exists(path):
+            raise KeyError(f"Backup {version} not found for router {router_id}")
+        with open(path, 'rb') as f:
+            return json.load(f)
+
+    def iter_export(self, router_id: str, version: str) -> Iterator[bytes]:
+        """Stream a stored export chunk by chunk"""
+        manifest = self.get_manifest(router_id, version)
+        for chunk_hash, _, _ in manifest['chunks']:
+            yield self._get_object(chunk_hash)
+
+    def iter_lines(self, router_id: str, version: str) -> Iterator[str]:
+        """Stream a stored export line by line"""
+        for chunk in self.iter_export(router_id, version):
+            yield from chunk.decode('utf-8', errors='replace').splitlines(keepends=True)
+
+    def diff(self, router_id: str, old_version: str, new_version: str,
+             context: int = 3) -> Iterator[str]:
+        """Stream a unified diff between two versions
+
+        Chunk lists are aligned first, so only chunks that differ are
+        decompressed and compared line by line.
+        """
+        old_manifest = self.get_manifest(router_id, old_version)['chunks']
+        new_manifest = self.get_manifest(router_id, new_version)['chunks']
+        old_chunks = [c[0] for c in old_manifest]
+        new_chunks = [c[0] for c in new_manifest]
+        old_offsets = self._line_offsets(old_manifest)
+        new_offsets = self._line_offsets(new_manifest)
+
+        yield f"--- {old_version}\n"
+        yield f"+++ {new_version}\n"
+
+        matcher = difflib.SequenceMatcher(None, old_chunks, new_chunks, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                continue
+            old_lines = self._lines_of(old_chunks[i1:i2])
+            new_lines = self._lines_of(new_chunks[j1:j2])
+            hunks = difflib.unified_diff(old_lines, new_lines, n=context, lineterm='')
+            for line in hunks:
+                if line.startswith(('---', '+++')):
+                    continue
+                if line.startswith('@@'):
+                    line = self._shift_hunk_header(line, old_offsets[i1], new_offsets[j1])
+                yield line if line.endswith('\n') else line + '\n'
+
+    def stats(self, router_id: str = None) -> Dict:
+        """Summarize raw versus stored bytes across versions"""
+        router_ids = [router_id] if router_id else os.listdir(self.manifests_dir)
+        versions = 0
+        raw_size = 0
+        stored_size = 0
+        for rid in router_ids:
+            for manifest in self.list_versions(rid):
+                versions += 1
+                raw_size += manifest['size']
+                stored_size += manifest['stored_size']
+        return {
+            'versions': versions,
+            'raw_bytes': raw_size,
+            'stored_bytes': stored_size,
+            'ratio': round(stored_size / raw_size, 4) if raw_size else 0.0
+        }
+
+    @staticmethod
+    def _line_offsets(chunks: List) -> List[int]:
+        offsets = [0]
+        for _, _, line_count in chunks:
+            offsets.append(offsets[-1] + line_count)
+        return offsets
+
+    @staticmethod
+    def _shift_hunk_header(header: str, old_offset: int, new_offset: int) -> str:
+        """Translate chunk-relative hunk line numbers into export line numbers"""
+        match = HUNK_HEADER.match(header)
+        if not match:
+            return header
+        old_start, old_len, new_start, new_len = match.groups()
+        old_part = f"-{int(old_start) + old_offset}" + (f",{old_len}" if old_len is not None else '')
+        new_part = f"+{int(new_start) + new_offset}" + (f",{new_len}" if new_len is not None else '')
+        return f"@@ {old_part} {new_part} @@"
+
+    # ==================== OBJECTS ====================
+
+    def _lines_of(self, chunk_hashes: List[str]) -> List[str]:
+        lines: List[str] = []
+        for chunk_hash in chunk_hashes:
+            lines.extend(self._get_object(chunk_hash).decode('utf-8', errors='replace')
+                         .splitlines(keepends=True))
+        return lines
+
+    def _object_path(self, chunk_hash: str) -> str:
+        return os.path.join(self.objects_dir, chunk_hash[:2], chunk_hash)
+
+    def _put_object(self, chunk_hash: str, chunk: bytes) -> int:
+        """Write a chunk unless already present; return bytes written"""
+        path = self._object_path(chunk_hash)
+        if os.path.exists(path):
+            return 0
+        data = zlib.compress(chunk, self.compression_level)
+        write_atomic(path, data)
+        return len(data)
+
+    def _get_object(self, chunk_hash: str) -> bytes:
+        with open(self._object_path(chunk_hash), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def _manifest_path(self, router_id: str, version: str) -> str:
+        return os.path.join(self.manifests_dir, safe_name(router_id),
+                            f"{safe_name(version)}.json")
+
+
+_stores: Dict[str, ConfigBackupStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_backup_store(root: str = None) -> ConfigBackupStore:
+    """Return the process-wide store for the configured backup path"""
+    if root is None:
+        from flask import current_app
+        root = current_app.config['BACKUP_STORE_PATH']
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = ConfigBackupStore(root)
+        return _stores[root]
@@ -0,0 +1,165 @@
+"""
+Collections Service
+Streaming overdue detection and router suspension fan-out
+"""
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import select
+
+from app import db
+from app.models import Client, Invoice
+from app.services.metadata_cache import metadata_cache
+from app.services.query_service import keyset_after
+
+logger = logging.getLogger(__name__)
+
+SUSPENSION_REASON = 'non-payment'
+
+
+class OverduePipeline:
+    """Flag unpaid invoices past due and suspend the affected clients
+
+    Pending invoices are streamed in (due_date, id) keyset order, so memory
+    stays bounded by the batch size regardless of the backlog. Each batch is
+    flipped to 'overdue' with one UPDATE and committed, then its active
+    clients are grouped by the router that serves their ISP and handed to
+    one suspension task per router chunk, so each router sees a single
+    session instead of one connection per client. A final pass re-queues
+    clients that are still active with an overdue invoice (a run that died
+    before enqueueing, or a suspension that failed), so re-running picks up
+    wherever the previous run or its tasks stopped.
+    """
+
+    def __init__(self, batch_size: int = 5000, grace_days: int = 0,
+                 suspension_chunk: int = 500):
+        self.batch_size = batch_size
+        self.grace_days = grace_days
+        self.suspension_chunk = suspension_chunk
+
+    def run(self, now: datetime = None, isp_id: str = None, dry_run: bool = False) -> Dict:
+        """Process every pending invoice due before now minus the grace period"""
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(days=self.grace_days)
+        started = time.perf_counter()
+
+        invoices = 0
+        seen: Set[str] = set()
+        routers: Dict[str, int] = defaultdict(int)
+        without_router: List[str] = []
+        tasks = 0
+        after: Optional[List] = None
+
+        while True:
+            batch = self._overdue_batch(cutoff, isp_id, after)
+            if not batch:
+                break
+            after = [batch[-1].due_date, batch[-1].id]
+            invoice_ids = [row.id for row in batch]
+            client_ids = {row.client_id for row in batch} - seen
+            seen.update(client_ids)
+
+            if not dry_run:
+                Invoice.query.filter(
+                    Invoice.id.in_(invoice_ids),
+                    Invoice.status == 'pending'
+                ).update({'status': 'overdue', 'updated_at': now}, synchronize_session=False)
+                db.session.commit()
+            invoices += len(invoice_ids)
+            tasks += self._suspend(self._active_clients(client_ids), routers, without_router, dry_run)
+
+        # Clients left active by an earlier run or a failed suspension task
+        retried = 0
+        after_client: Optional[str] = None
+        while True:
+            stranded = self._stranded_batch(cutoff, isp_id, after_client)
+            if not stranded:
+                break
+            after_client = stranded[-1].id
+            stranded = [row for row in stranded if row.id not in seen]
+            retried += len(stranded)
+            tasks += self._suspend(stranded, routers, without_router, dry_run)
+
+        elapsed = time.perf_counter() - started
+        to_suspend = sum(routers.values())
+        logger.info(f"Overdue run: {invoices} invoices, {to_suspend} clients "
+                    f"({retried} retried) on {len(routers)} routers, {tasks} tasks in {elapsed:.2f}s")
+        if without_router:
+            logger.warning(f"{len(without_router)} overdue clients have no active router")
+
+        return {
+            'cutoff': cutoff.isoformat(),
+            'dry_run': dry_run,
+            'invoices_marked_overdue': invoices,
+            'clients_to_suspend': to_suspend,
+            'clients_retried': retried,
+            'clients_without_router': len(without_router),
+            'routers': dict(routers),
+            'tasks_enqueued': tasks,
+            'elapsed_seconds': round(elapsed, 3)
+        }
+
+    def _overdue_batch(self, cutoff: datetime, isp_id: Optional[str], after: Optional[List]):
+        query = db.session.query(Invoice.id, Invoice.client_id, Invoice.due_date).filter(
+            Invoice.status == 'pending',
+            Invoice.due_date < cutoff
+        )
+        if isp_id:
+            query = query.join(Client, Client.id == Invoice.client_id).filter(Client.isp_id == isp_id)
+        if after:
+            query = query.filter(keyset_after([Invoice.due_date, Invoice.id], after))
+        return query.order_by(Invoice.due_date, Invoice.id).limit(self.batch_size).all()
+
+    def _stranded_batch(self, cutoff: datetime, isp_id: Optional[str], after: Optional[str]):
+        # Uncorrelated IN: the overdue invoices are read once via their
+        # (status, due_date) index instead of once per client
+        overdue_clients = select(Invoice.client_id).where(
+            Invoice.status == 'overdue',
+            Invoice.due_date < cutoff
+        )
+        query = db.session.query(Client.id, Client.isp_id).filter(
+            Client.status == 'active',
+            Client.id.in_(overdue_clients)
+        )
+        if isp_id:
+            query = query.filter(Client.isp_id == isp_id)
+        if after:
+            query = query.filter(Client.id > after)
+        return query.order_by(Client.id).limit(self.batch_size).all()
+
+    def _suspend(self, clients, routers: Dict[str, int], without_router: List[str],
+                 dry_run: bool) -> int:
+        """Group (client id, ISP id) rows by router and enqueue their suspension"""
+        by_router: Dict[str, List[str]] = defaultdict(list)
+        for client_id, client_isp_id in clients:
+            router = metadata_cache.get_active_router_for_isp(client_isp_id)
+            if router is None:
+                without_router.append(client_id)
+            else:
+                by_router[router.id].append(client_id)
+        for router_id, client_ids in by_router.items():
+            routers[router_id] += len(client_ids)
+        return 0 if dry_run else self._enqueue_suspensions(by_router)
+
+    @staticmethod
+    def _active_clients(client_ids: Set[str]):
+        if not client_ids:
+            return []
+        return db.session.query(Client.id, Client.isp_id).filter(
+            Client.id.in_(list(client_ids)),
+            Client.status == 'active'
+        ).all()
+
+    def _enqueue_suspensions(self, by_router: Dict[str, List[str]]) -> int:
+        from app.tasks import suspend_clients_on_router
+
+        tasks = 0
+        for router_id, client_ids in by_router.items():
+            for i in range(0, len(client_ids), self.suspension_chunk):
+                suspend_clients_on_router.delay(router_id, client_ids[i:i + self.suspension_chunk],
+                                                SUSPENSION_REASON)
+                tasks += 1
+        return tasks
@@ -0,0 +1,314 @@
+"""
+Configuration Drift Service
+Section-aware, line-hashed indexes of RouterOS exports and fast diffs between them
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+from array import array
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import or_
+
+from app import db
+from app.models import MikroTikRouter
+from app.services.backup_store import (ConfigBackupStore, get_backup_store, safe_name,
+                                       version_timestamp, write_atomic)
+
+logger = logging.getLogger(__name__)
+
+ROOT_SECTION = '/'
+
+
+def iter_statements(lines: Iterable) -> Iterator[Tuple[str, str]]:
+    """Yield (section, statement) pairs from /export output
+
+    Comment lines are dropped (the export header carries a timestamp),
+    backslash continuations are joined and whitespace is normalized so
+    cosmetic re-wrapping never shows up as drift.
+    """
+    section = ROOT_SECTION
+    pending = ''
+    for raw in lines:
+        if isinstance(raw, bytes):
+            raw = raw.decode('utf-8', errors='replace')
+        line = raw.rstrip('\r\n')
+        if not pending and (not line.strip() or line.lstrip().startswith('#')):
+            continue
+        if line.endswith('\\'):
+            pending += line[:-1].strip() + ' '
+            continue
+        statement = ' '.join((pending + line.strip()).split())
+        pending = ''
+        if statement.startswith('/'):
+            section = statement
+        else:
+            yield section, statement
+    if pending:
+        yield section, ' '.join(pending.split())
+
+
+def line_hash(statement: str) -> int:
+    """64-bit hash of a normalized statement"""
+    return int.from_bytes(hashlib.blake2b(statement.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class ExportIndex:
+    """Per-section line hashes and digests for one export snapshot"""
+
+    def __init__(self, sections: Dict[str, array], version: str = None,
+                 created_at: str = None):
+        self.sections = sections
+        self.version = version
+        self.created_at = created_at
+        self.digests = {path: self._digest(hashes) for path, hashes in sections.items()}
+        self.fingerprint = self._fingerprint(self.digests)
+
+    @classmethod
+    def from_lines(cls, lines: Iterable, version: str = None, created_at: str = None) -> 'ExportIndex':
+        """Build an index in a single pass over export lines"""
+        sections: Dict[str, array] = {}
+        for section, statement in iter_statements(lines):
+            hashes = sections.get(section)
+            if hashes is None:
+                hashes = sections[section] = array('Q')
+            hashes.append(line_hash(statement))
+        return cls(sections, version=version, created_at=created_at)
+
+    @staticmethod
+    def _digest(hashes: array) -> str:
+        return hashlib.blake2b(hashes.tobytes(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def _fingerprint(digests: Dict[str, str]) -> str:
+        h = hashlib.blake2b(digest_size=8)
+        for path in sorted(digests):
+            h.update(path.encode('utf-8'))
+            h.update(bytes.fromhex(digests[path]))
+        return h.hexdigest()
+
+    def to_dict(self) -> Dict:
+        return {
+            'version': self.version,
+            'created_at': self.created_at,
+            'fingerprint': self.fingerprint,
+            'sections': {
+                path: {
+                    'digest': self.digests[path],
+                    'count': len(hashes),
+                    'hashes': base64.b64encode(hashes.tobytes()).decode('ascii')
+                }
+                for path, hashes in self.sections.items()
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ExportIndex':
+        sections = {}
+        for path, section in data['sections'].items():
+            hashes = array('Q')
+            hashes.frombytes(base64.b64decode(section['hashes']))
+            sections[path] = hashes
+        return cls(sections, version=data.get('version'), created_at=data.get('created_at'))
+
+
+def diff_indexes(old: ExportIndex, new: ExportIndex) -> Dict[str, Dict]:
+    """Compare two indexes section by section in linear time
+
+    Sections with identical digests are skipped outright; the rest are
+    compared as multisets of line hashes, so moved lines within a section
+    are reported as a reorder rather than as add/remove pairs.
+    """
+    changes = {}
+    for path in sorted(set(old.sections) | set(new.sections)):
+        if old.digests.get(path) == new.digests.get(path):
+            continue
+        old_counts = Counter(old.sections.get(path, ()))
+        new_counts = Counter(new.sections.get(path, ()))
+        added = new_counts - old_counts
+        removed = old_counts - new_counts
+        changes[path] = {
+            'status': 'added' if path not in old.sections else
+                      'removed' if path not in new.sections else 'modified',
+            'added': list(added.elements()),
+            'removed': list(removed.elements()),
+            'reordered': not added and not removed
+        }
+    return changes
+
+
+class ConfigDriftService:
+    """Record export indexes per router and answer drift queries from them"""
+
+    def __init__(self, store: ConfigBackupStore = None):
+        self.store = store or get_backup_store()
+        self.indexes_dir = os.path.join(self.store.root, 'indexes')
+
+    # ==================== RECORDING ====================
+
+    def record(self, router_id: str, version: str, lines: Iterable,
+               created_at: datetime = None) -> ExportIndex:
+        """Index an export, persist it and stamp the router's config_version"""
+        created_at = created_at or datetime.utcnow()
+        index = ExportIndex.from_lines(lines, version=version, created_at=created_at.isoformat())
+        self._write_index(router_id, index)
+
+        changed = MikroTikRouter.query.filter(
+            MikroTikRouter.id == router_id,
+            or_(MikroTikRouter.config_version.is_(None),
+                MikroTikRouter.config_version != index.fingerprint)
+        ).update({'config_version': index.fingerprint}, synchronize_session=False)
+        db.session.commit()
+        if changed:
+            logger.info(f"Router {router_id} config version is now {index.fingerprint}")
+
+        return index
+
+    def mark_baseline(self, router_id: str, version: str = None) -> str:
+        """Mark a stored version as the provisioned baseline"""
+        version = version or self.latest_version(router_id)
+        if not version:
+            raise KeyError(f"No indexed versions for router {router_id}")
+        self.load_index(router_id, version)
+        write_atomic(self._baseline_path(router_id), version.encode('utf-8'))
+        return version
+
+    # ==================== QUERIES ====================
+
+    def list_versions(self, router_id: str) -> List[str]:
+        """Indexed versions for a router, oldest first"""
+        router_dir = os.path.join(self.indexes_dir, safe_name(router_id))
+        if not os.path.isdir(router_dir):
+            return []
+        return sorted(f[:-5] for f in os.listdir(router_dir) if f.endswith('.json'))
+
+    def latest_version(self, router_id: str, before: datetime = None) -> Optional[str]:
+        """Newest indexed version, optionally at or before a point in time"""
+        versions = self.list_versions(router_id)
+        if before is not None:
+            cutoff = version_timestamp(before)
+            versions = [v for v in versions if v[:16] <= cutoff]
+        return versions[-1] if versions else None
+
+    def baseline_version(self, router_id: str) -> Optional[str]:
+        path = self._baseline_path(router_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return f.read().strip() or None
+
+    def load_index(self, router_id: str, version: str) -> ExportIndex:
+        path = self._index_path(router_id, version)
+        if not os.path.exists(path):
+            raise KeyError(f"No index for version {version} of router {router_id}")
+        with open(path, 'rb') as f:
+            return ExportIndex.from_dict(json.load(f))
+
+    def drift(self, router_id: str, against: str = 'baseline', version: str = None,
+              include_lines: bool = False) -> Dict:
+        """Diff a version (default latest) against the baseline, the previous
+        version or an explicit version"""
+        versions = self.list_versions(router_id)
+        new_version = version or (versions[-1] if versions else None)
+        if not new_version:
+            raise KeyError(f"No indexed versions for router {router_id}")
+
+        if against == 'baseline':
+            old_version = self.baseline_version(router_id)
+        elif against == 'previous':
+            older = [v for v in versions if v < new_version]
+            old_version = older[-1] if older else None
+        else:
+            old_version = against
+        if not old_version:
+            raise KeyError(f"No '{against}' version to compare for router {router_id}")
+
+        old_index = self.load_index(router_id, old_version)
+        new_index = self.load_index(router_id, new_version)
+        changes = diff_indexes(old_index, new_index)
+
+        result = {
+            'router_id': router_id,
+            'from': old_version,
+            'to': new_version,
+            'drifted': old_index.fingerprint != new_index.fingerprint,
+            'fingerprint': new_index.fingerprint,
+            'sections': {
+                path: {
+                    'status': change['status'],
+                    'added': len(change['added']),
+                    'removed': len(change['removed']),
+                    'reordered': change['reordered']
+                }
+                for path, change in changes.items()
+            }
+        }
+        if include_lines and changes:
+            self._resolve_lines(router_id, old_version, new_version, changes, result['sections'])
+        return result
+
+    def changes_since(self, since: datetime, router_ids: Iterable[str] = None) -> List[Dict]:
+        """Fleet-wide "what changed since X", answered from indexes only"""
+        if router_ids is None:
+            router_ids = os.listdir(self.indexes_dir) if os.path.isdir(self.indexes_dir) else []
+
+        changed = []
+        for router_id in router_ids:
+            old_version = self.latest_version(router_id, before=since)
+            new_version = self.latest_version(router_id)
+            if not new_version or new_version == old_version:
+                continue
+
+            new_index = self.load_index(router_id, new_version)
+            if old_version is None:
+                changed.append({
+                    'router_id': router_id,
+                    'from': None,
+                    'to': new_version,
+                    'sections': sorted(new_index.sections)
+                })
+                continue
+
+            old_index = self.load_index(router_id, old_version)
+            if old_index.fingerprint == new_index.fingerprint:
+                continue
+            changed.append({
+                'router_id': router_id,
+                'from': old_version,
+                'to': new_version,
+                'sections': sorted(path for path in set(old_index.digests) | set(new_index.digests)
+                                   if old_index.digests.get(path) != new_index.digests.get(path))
+            })
+        return changed
+
+    # ==================== HELPERS ====================
+
+    def _resolve_lines(self, router_id: str, old_version: str, new_version: str,
+                       changes: Dict[str, Dict], summary: Dict[str, Dict]):
+        """Map changed line hashes back to text by streaming only the two exports"""
+        for version, key in ((old_version, 'removed'), (new_version, 'added')):
+            wanted = Counter((path, h) for path, change in changes.items() for h in change[key])
+            if not wanted:
+                continue
+            for path in changes:
+                summary[path][f'{key}_lines'] = []
+            for section, statement in iter_statements(self.store.iter_lines(router_id, version)):
+                item = (section, line_hash(statement))
+                if wanted[item] > 0:
+                    wanted[item] -= 1
+                    summary[section][f'{key}_lines'].append(statement)
+
+    def _write_index(self, router_id: str, index: ExportIndex):
+        write_atomic(self._index_path(router_id, index.version),
+                     json.dumps(index.to_dict()).encode('utf-8'))
+
+    def _index_path(self, router_id: str, version: str) -> str:
+        return os.path.join(self.indexes_dir, safe_name(router_id),
+                            f"{safe_name(version)}.json")
+
+    def _baseline_path(self, router_id: str) -> str:
+        return os.path.join(self.indexes_dir, safe_name(router_id), 'baseline')
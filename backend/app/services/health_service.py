@@ -0,0 +1,263 @@
+"""
+Health Scoring Service
+Rolling EWMA baselines per router and vectorized, baseline-aware fleet health scores
+"""
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.metadata_cache import metadata_cache
+from app.services.usage_service import get_redis
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = 'ispmax:health:state:{router_id}'
+ROUTERS_KEY = 'ispmax:health:routers'
+# Baselines of routers that stop reporting expire instead of piling up
+STATE_TTL = 24 * 3600
+
+METRICS = ('cpu_load', 'memory_used_pct', 'error_rate', 'rx_bps', 'tx_bps')
+# +1: only increases are bad; 0: deviations either way are (traffic drops)
+DIRECTIONS = np.array([1, 1, 1, 0, 0])
+WEIGHTS = np.array([25.0, 20.0, 25.0, 15.0, 15.0])
+# Smallest standard deviation trusted per metric, so a flat baseline does
+# not turn tiny wobbles into huge z-scores.
+STD_FLOORS = np.array([5.0, 2.0, 1.0, 1e6, 1e6])
+STD_RELATIVE_FLOOR = 0.1
+
+# Absolute limits still apply, however normal a high value is for a router
+ABSOLUTE = {'cpu_load': (80.0, 100.0, 30.0), 'memory_used_pct': (85.0, 100.0, 30.0)}
+
+Z_ANOMALY = 3.0
+Z_RAMP = (2.0, 4.0)
+INTERFACE_DOWN_PENALTY = 10.0
+INTERFACE_DOWN_MAX_PENALTY = 30.0
+# An interface counts as normally up once its running EWMA reaches this
+NORMALLY_UP = 0.9
+AGGREGATE_EXCLUDED_TYPES = ('bridge', 'vlan', 'pppoe-in', 'pppoe-out', 'l2tp-in', 'ovpn-in')
+
+
+def score_fleet(values: np.ndarray, mean: np.ndarray, std: np.ndarray, samples: np.ndarray,
+                interfaces_down: np.ndarray, warmup: int = 10) -> Dict[str, np.ndarray]:
+    """Score many routers at once
+
+    All inputs are (routers, len(METRICS)) except samples and
+    interfaces_down, which have one entry per router. Returns z-scores,
+    anomaly flags and a 0-100 score per router.
+    """
+    std = np.maximum(np.maximum(std, STD_FLOORS), np.abs(mean) * STD_RELATIVE_FLOOR)
+    z = (values - mean) / std
+    directed = np.where(DIRECTIONS > 0, z, np.abs(z))
+    warmed = (samples >= warmup)[:, None]
+
+    low, high = Z_RAMP
+    ramp = np.clip((directed - low) / (high - low), 0.0, 1.0)
+    penalty = np.where(warmed, ramp * WEIGHTS, 0.0).sum(axis=1)
+
+    for name, (soft, hard, weight) in ABSOLUTE.items():
+        column = values[:, METRICS.index(name)]
+        penalty += np.clip((column - soft) / (hard - soft), 0.0, 1.0) * weight
+
+    penalty += np.minimum(interfaces_down * INTERFACE_DOWN_PENALTY, INTERFACE_DOWN_MAX_PENALTY)
+    return {
+        'z': z,
+        'anomalies': warmed & (directed > Z_ANOMALY),
+        'score': np.clip(100.0 - penalty, 0.0, 100.0)
+    }
+
+
+class HealthScoringService:
+    """Keep per-router baselines in Redis and score routers against them
+
+    Each observation updates an exponentially weighted mean and variance
+    per metric and stores the raw values next to the baseline they were
+    judged against, so the fleet view only reads cached state and scores
+    every router in one NumPy pass.
+    """
+
+    def __init__(self, redis_client=None, alpha: float = 0.05, warmup: int = 10):
+        self.redis = redis_client if redis_client is not None else get_redis()
+        self.alpha = alpha
+        self.warmup = warmup
+
+    # ==================== OBSERVATION ====================
+
+    def observe(self, router_id: str, router_info: Dict, interfaces: List[Dict],
+                now: float = None, update: bool = True) -> Dict:
+        """Score a live sample; with update, fold it into the router's baseline
+
+        The readers return empty router info or no interfaces when a read
+        fails; such a sample is scored but never folded in, so it neither
+        drags the baseline to zero nor forgets the interface state.
+        """
+        now = now or time.time()
+        state = self._load(router_id) or {
+            'samples': 0,
+            'mean': [0.0] * len(METRICS),
+            'var': [0.0] * len(METRICS),
+            'interfaces': {}
+        }
+        values, down, interface_state = self._metrics(router_info, interfaces, state, now)
+
+        mean = np.array(state['mean'])
+        var = np.array(state['var'])
+        scored = score_fleet(values[None, :], mean[None, :], np.sqrt(var)[None, :],
+                             np.array([state['samples']]), np.array([len(down)]), self.warmup)
+        result = self._describe(router_id, values, mean, np.sqrt(var), state['samples'], down,
+                                scored['z'][0], scored['anomalies'][0], float(scored['score'][0]))
+
+        complete = bool(router_info) and bool(interfaces)
+        if update and not complete:
+            logger.warning(f"Incomplete health sample for router {router_id}; baseline not updated")
+            result['issues'].append("Health sample incomplete")
+        elif update:
+            if state['samples'] == 0:
+                mean, var = values, np.zeros(len(METRICS))
+            else:
+                delta = values - mean
+                mean = mean + self.alpha * delta
+                var = (1 - self.alpha) * (var + self.alpha * delta ** 2)
+            self._save(router_id, {
+                'sampled_at': now,
+                'samples': state['samples'] + 1,
+                'values': values.tolist(),
+                'baseline_mean': state['mean'],
+                'baseline_var': state['var'],
+                'mean': mean.tolist(),
+                'var': var.tolist(),
+                'down': down,
+                'interfaces': interface_state
+            })
+        return result
+
+    def _metrics(self, router_info: Dict, interfaces: List[Dict], state: Dict, now: float):
+        total_memory = router_info.get('total_memory') or 0
+        free_memory = router_info.get('memory_usage') or 0
+        memory_used = (total_memory - free_memory) / total_memory * 100 if total_memory else 0.0
+
+        previous = state.get('interfaces', {})
+        elapsed = now - state['sampled_at'] if state.get('sampled_at') else 0.0
+        errors = rx = tx = 0.0
+        down = []
+        interface_state = {}
+        for interface in interfaces:
+            name = interface.get('name')
+            counters = (interface.get('rx_bytes', 0), interface.get('tx_bytes', 0),
+                        interface.get('rx_errors', 0) + interface.get('tx_errors', 0))
+            running = 1.0 if interface.get('running') else 0.0
+            last = previous.get(name)
+
+            up_ewma = running if last is None else last[3] + self.alpha * (running - last[3])
+            if last is not None and not running and not interface.get('disabled') \
+                    and last[3] >= NORMALLY_UP:
+                down.append(name)
+
+            if last is not None and elapsed > 0 and interface.get('type') not in AGGREGATE_EXCLUDED_TYPES:
+                # Counters that went backwards were reset; skip them this round
+                deltas = [c - p if c >= p else 0 for c, p in zip(counters, last[:3])]
+                rx += deltas[0] * 8 / elapsed
+                tx += deltas[1] * 8 / elapsed
+                errors += deltas[2] / elapsed
+            interface_state[name] = [*counters, up_ewma]
+
+        values = np.array([float(router_info.get('cpu_load') or 0), memory_used, errors, rx, tx])
+        return values, down, interface_state
+
+    # ==================== FLEET ====================
+
+    def worst_routers(self, limit: int = 20, router_ids: Optional[List[str]] = None) -> Dict:
+        """Rank routers from their cached state, lowest score first"""
+        started = time.perf_counter()
+        states = self._load_many(router_ids)
+        if not states:
+            return {'routers': 0, 'items': [], 'elapsed_ms': 0.0}
+
+        ids = list(states)
+        values = np.array([states[r]['values'] for r in ids])
+        mean = np.array([states[r]['baseline_mean'] for r in ids])
+        std = np.sqrt(np.array([states[r]['baseline_var'] for r in ids]))
+        samples = np.array([states[r]['samples'] - 1 for r in ids])
+        down = np.array([len(states[r]['down']) for r in ids])
+        scored = score_fleet(values, mean, std, samples, down, self.warmup)
+
+        order = np.argsort(scored['score'], kind='stable')[:limit]
+        now = time.time()
+        items = []
+        for i in order.tolist():
+            router_id = ids[i]
+            item = self._describe(router_id, values[i], mean[i], std[i], int(samples[i]),
+                                  states[router_id]['down'], scored['z'][i],
+                                  scored['anomalies'][i], float(scored['score'][i]))
+            router = metadata_cache.get_router(router_id)
+            item['router_name'] = router.name if router else None
+            item['age_seconds'] = round(now - states[router_id]['sampled_at'], 1)
+            items.append(item)
+
+        return {
+            'routers': len(ids),
+            'average_score': round(float(scored['score'].mean()), 1),
+            'items': items,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    # ==================== HELPERS ====================
+
+    def _describe(self, router_id: str, values, mean, std, samples: int, down: List[str],
+                  z, anomalies, score: float) -> Dict:
+        flagged = [METRICS[k] for k in np.flatnonzero(anomalies).tolist()]
+        issues = [f"{name} {values[METRICS.index(name)]:.1f} vs baseline "
+                  f"{mean[METRICS.index(name)]:.1f}" for name in flagged]
+        cpu, memory = values[0], values[1]
+        if cpu > ABSOLUTE['cpu_load'][0]:
+            issues.append(f"CPU high: {cpu:.0f}%")
+        if memory > ABSOLUTE['memory_used_pct'][0]:
+            issues.append(f"Memory high: {memory:.1f}%")
+        issues.extend(f"Interface down: {name}" for name in down)
+        return {
+            'router_id': router_id,
+            'score': round(score, 1),
+            'metrics': dict(zip(METRICS, np.round(values, 2).tolist())),
+            'baseline': dict(zip(METRICS, np.round(mean, 2).tolist())) if samples >= self.warmup else None,
+            'z_scores': dict(zip(METRICS, np.round(z, 2).tolist())) if samples >= self.warmup else None,
+            'anomalies': flagged,
+            'issues': issues
+        }
+
+    def _load(self, router_id: str) -> Optional[Dict]:
+        try:
+            value = self.redis.get(STATE_KEY.format(router_id=router_id))
+        except Exception as e:
+            logger.warning(f"Could not load health baseline for router {router_id}: {e}")
+            return None
+        return json.loads(value) if value else None
+
+    def _load_many(self, router_ids: Optional[List[str]]) -> Dict[str, Dict]:
+        if router_ids is None:
+            router_ids = sorted(r.decode('utf-8') for r in self.redis.smembers(ROUTERS_KEY))
+        if not router_ids:
+            return {}
+        values = self.redis.mget([STATE_KEY.format(router_id=r) for r in router_ids])
+        states = {}
+        expired = []
+        for router_id, value in zip(router_ids, values):
+            if value is None:
+                expired.append(router_id)
+                continue
+            state = json.loads(value)
+            if 'values' in state:
+                states[router_id] = state
+        if expired:
+            self.redis.srem(ROUTERS_KEY, *expired)
+        return states
+
+    def _save(self, router_id: str, state: Dict):
+        try:
+            pipe = self.redis.pipeline()
+            pipe.set(STATE_KEY.format(router_id=router_id), json.dumps(state), ex=STATE_TTL)
+            pipe.sadd(ROUTERS_KEY, router_id)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not store health baseline for router {router_id}: {e}")
@@ -0,0 +1,74 @@
+"""
+JSON Stream
+Compact JSON encoding and chunked envelopes built row by row from generators
+"""
+import json
+import logging
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library encoder is used instead
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Encoded rows are buffered up to this size before a chunk is written
+CHUNK_BYTES = 64 * 1024
+
+
+def _default(value: Any):
+    """Fallback for values the standard encoder does not know (NumPy scalars, datetimes)"""
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+_encoder = json.JSONEncoder(separators=(',', ':'), default=_default)
+
+
+def dumps(value: Any) -> bytes:
+    """Compact UTF-8 JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return _encoder.encode(value).encode('utf-8')
+
+
+def iter_envelope(key: str, rows: Iterable, fields: Dict = None,
+                  on_close: Optional[Callable[[], Any]] = None, trailer: Dict = None) -> Iterator[bytes]:
+    """``{"success": true, ...fields, key: [rows...], "count": n, "complete": true}`` in chunks
+
+    Only one row is encoded at a time, so memory does not grow with the
+    listing. The status line is already sent when a row fails, so errors
+    end the array early with ``"complete": false`` and the message.
+    ``on_close`` runs once the body is finished or the client goes away;
+    ``trailer``, when given, is filled with the closing fields.
+    """
+    try:
+        head = dumps({'success': True, **(fields or {})})
+        buffer = bytearray(head[:-1])
+        buffer += b',' + dumps(key) + b':['
+        count = 0
+        try:
+            for row in rows:
+                if count:
+                    buffer += b','
+                buffer += dumps(row)
+                count += 1
+                if len(buffer) >= CHUNK_BYTES:
+                    yield bytes(buffer)
+                    buffer.clear()
+            closing = {'count': count, 'complete': True}
+        except Exception as e:
+            logger.error(f"Error streaming {key}: {e}")
+            closing = {'count': count, 'complete': False, 'error': str(e)}
+        if trailer is not None:
+            trailer.update(closing)
+        buffer += b'],' + dumps(closing)[1:]
+        yield bytes(buffer)
+    finally:
+        if on_close is not None:
+            on_close()
+
@@ -0,0 +1,212 @@
+"""
+Map Index
+Grid-based spatial index over client and router coordinates with per-zoom clustering
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app import db
+from app.models import Client, MikroTikRouter
+
+logger = logging.getLogger(__name__)
+
+# Integer Web Mercator coordinates: 2^26 units per axis is one unit per
+# pixel at zoom 18, the deepest level the map is used at.
+COORD_BITS = 26
+# The index is bucketed on a 256 x 256 grid (zoom 8 tiles)
+GRID_BITS = 8
+# Clusters are 64px cells: four per tile side at the requested zoom
+CLUSTER_CELL_BITS = 2
+# From this zoom on points are returned individually
+CLUSTER_MAX_ZOOM = 17
+MAX_POINTS = 5000
+MAX_LATITUDE = 85.05112878
+
+LAYERS = {
+    'clients': {
+        'model': Client,
+        'name': Client.full_name,
+        'statuses': ('active', 'suspended', 'cancelled')
+    },
+    'routers': {
+        'model': MikroTikRouter,
+        'name': MikroTikRouter.name,
+        'statuses': ('online', 'offline', 'maintenance')
+    }
+}
+
+
+def project(lat: np.ndarray, lng: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Latitude/longitude to integer Web Mercator coordinates"""
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    scale = (1 << COORD_BITS) - 1
+    x = (np.asarray(lng, dtype=np.float64) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    return (np.clip(x, 0.0, 1.0) * scale).astype(np.int64), (np.clip(y, 0.0, 1.0) * scale).astype(np.int64)
+
+
+class SpatialIndex:
+    """Immutable point set sorted by grid cell for bounding-box lookups"""
+
+    def __init__(self, ids: Sequence[str], names: Sequence[str], lat: np.ndarray, lng: np.ndarray,
+                 status: np.ndarray, isp: np.ndarray, statuses: Sequence[str], isps: Sequence[str]):
+        x, y = project(lat, lng)
+        shift = COORD_BITS - GRID_BITS
+        cells = (y >> shift) << GRID_BITS | (x >> shift)
+        order = np.argsort(cells, kind='stable')
+
+        self.cells = cells[order]
+        self.x = x[order]
+        self.y = y[order]
+        self.lat = np.asarray(lat, dtype=np.float64)[order]
+        self.lng = np.asarray(lng, dtype=np.float64)[order]
+        self.status = np.asarray(status, dtype=np.int8)[order]
+        self.isp = np.asarray(isp, dtype=np.int32)[order]
+        self.ids = np.asarray(ids, dtype=object)[order]
+        self.names = np.asarray(names, dtype=object)[order]
+        self.statuses = tuple(statuses)
+        self.isps = {isp_id: i for i, isp_id in enumerate(isps)}
+        self.built_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def query(self, bbox: Tuple[float, float, float, float], isp_id: str = None) -> np.ndarray:
+        """Positions of the points inside (min_lng, min_lat, max_lng, max_lat)"""
+        min_lng, min_lat, max_lng, max_lat = bbox
+        (x0, x1), (y1, y0) = project(np.array([min_lat, max_lat]), np.array([min_lng, max_lng]))
+        shift = COORD_BITS - GRID_BITS
+        rows = np.arange(y0 >> shift, (y1 >> shift) + 1)
+        starts = np.searchsorted(self.cells, rows << GRID_BITS | (x0 >> shift), side='left')
+        ends = np.searchsorted(self.cells, rows << GRID_BITS | (x1 >> shift), side='right')
+
+        candidates = [np.arange(s, e) for s, e in zip(starts.tolist(), ends.tolist()) if e > s]
+        if not candidates:
+            return np.zeros(0, dtype=np.int64)
+        positions = np.concatenate(candidates)
+        mask = ((self.x[positions] >= x0) & (self.x[positions] <= x1)
+                & (self.y[positions] >= y0) & (self.y[positions] <= y1))
+        if isp_id is not None:
+            mask &= self.isp[positions] == self.isps.get(isp_id, -1)
+        return positions[mask]
+
+    def clusters(self, positions: np.ndarray, zoom: int) -> Dict:
+        """Aggregate points into zoom-dependent cells; singletons stay points"""
+        if zoom >= CLUSTER_MAX_ZOOM or len(positions) == 0:
+            return {'clusters': [], 'points': self._points(positions[:MAX_POINTS]),
+                    'truncated': len(positions) > MAX_POINTS}
+
+        shift = max(COORD_BITS - (zoom + CLUSTER_CELL_BITS), 0)
+        keys = (self.y[positions] >> shift) << 32 | (self.x[positions] >> shift)
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(-1)
+
+        n_status = len(self.statuses)
+        lat = np.bincount(inverse, weights=self.lat[positions]) / counts
+        lng = np.bincount(inverse, weights=self.lng[positions]) / counts
+        by_status = np.bincount(inverse * n_status + self.status[positions],
+                                minlength=len(counts) * n_status).reshape(len(counts), n_status)
+        dominant = by_status.argmax(axis=1)
+
+        singles = np.flatnonzero(counts == 1)
+        single_positions = positions[np.isin(inverse, singles)]
+        clusters = [
+            {
+                'lat': round(la, 6),
+                'lng': round(ln, 6),
+                'count': count,
+                'status': self.statuses[d],
+                'statuses': {s: c for s, c in zip(self.statuses, row) if c}
+            }
+            for la, ln, count, d, row in zip(lat.tolist(), lng.tolist(), counts.tolist(),
+                                             dominant.tolist(), by_status.tolist())
+            if count > 1
+        ]
+        return {'clusters': clusters, 'points': self._points(single_positions), 'truncated': False}
+
+    def _points(self, positions: np.ndarray) -> List[Dict]:
+        return [
+            {'id': i, 'name': n, 'lat': la, 'lng': ln, 'status': self.statuses[s]}
+            for i, n, la, ln, s in zip(self.ids[positions].tolist(), self.names[positions].tolist(),
+                                       self.lat[positions].tolist(), self.lng[positions].tolist(),
+                                       self.status[positions].tolist())
+        ]
+
+
+class MapIndexCache:
+    """Per-process spatial indexes, rebuilt from the database after a TTL"""
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._indexes: Dict[str, SpatialIndex] = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('MAP_INDEX_TTL', 60)
+        app.extensions['map_index'] = self
+
+    def get(self, layer: str) -> SpatialIndex:
+        if layer not in LAYERS:
+            raise ValueError(f"Unknown layer: {layer}")
+        index = self._indexes.get(layer)
+        if index is not None and time.time() - index.built_at < self.ttl:
+            return index
+        with self._lock:
+            index = self._indexes.get(layer)
+            if index is None or time.time() - index.built_at >= self.ttl:
+                index = self._indexes[layer] = self._build(layer)
+        return index
+
+    def invalidate(self, layer: str = None):
+        with self._lock:
+            if layer:
+                self._indexes.pop(layer, None)
+            else:
+                self._indexes.clear()
+
+    @staticmethod
+    def _build(layer: str) -> SpatialIndex:
+        started = time.perf_counter()
+        spec = LAYERS[layer]
+        model = spec['model']
+        rows = db.session.query(
+            model.id, spec['name'], model.latitude, model.longitude, model.status, model.isp_id
+        ).filter(model.latitude.isnot(None), model.longitude.isnot(None)).all()
+
+        statuses = spec['statuses']
+        status_codes = {s: i for i, s in enumerate(statuses)}
+        isps: Dict[str, int] = {}
+        ids, names, lat, lng, status, isp = [], [], [], [], [], []
+        for row in rows:
+            ids.append(row[0])
+            names.append(row[1])
+            lat.append(row[2])
+            lng.append(row[3])
+            status.append(status_codes.get(row[4], 0))
+            isp.append(isps.setdefault(row[5], len(isps)))
+
+        index = SpatialIndex(ids, names, np.array(lat, dtype=np.float64), np.array(lng, dtype=np.float64),
+                             np.array(status), np.array(isp), statuses, list(isps))
+        logger.info(f"Map index '{layer}' built: {len(index)} points in "
+                    f"{time.perf_counter() - started:.2f}s")
+        return index
+
+
+map_index = MapIndexCache()
+
+
+def parse_bbox(value: Optional[str]) -> Tuple[float, float, float, float]:
+    """Parse 'min_lng,min_lat,max_lng,max_lat'"""
+    if not value:
+        return (-180.0, -90.0, 180.0, 90.0)
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(v) for v in value.split(','))
+    except ValueError:
+        raise ValueError('Invalid bbox')
+    if min_lng > max_lng or min_lat > max_lat:
+        raise ValueError('Invalid bbox')
+    return min_lng, min_lat, max_lng, max_lat
@@ -0,0 +1,277 @@
+"""
+Metadata Cache
+Process-local read-through cache for Plan, ISP, router connection and user tenancy metadata
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import ISP, MikroTikRouter, Plan, User
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'ispmax:metadata-cache:invalidate'
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU with per-entry TTL
+
+    Every delete bumps the key's generation. A reader that takes
+    ``generation(key)`` before loading and passes it to ``set`` stores
+    nothing if the key was invalidated meanwhile, so a load that raced a
+    write cannot put the old value back.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._generations: Dict[Hashable, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = _MISSING) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self, key: Hashable) -> Tuple[int, int]:
+        with self._lock:
+            return self._epoch, self._generations.get(key, 0)
+
+    def set(self, key: Hashable, value: Any, generation: Tuple[int, int] = None) -> bool:
+        """Store ``value``; False if ``key`` was invalidated since ``generation``"""
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(key, 0)):
+                return False
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+            if len(self._generations) > self.maxsize:
+                # Bounded bookkeeping: a new epoch stands in for every counter
+                self._generations.clear()
+                self._epoch += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def _snapshot_fields(model, exclude: Iterable[str] = ()) -> Tuple[str, ...]:
+    skip = {'created_at', 'updated_at', *exclude}
+    return tuple(c.key for c in model.__table__.columns if c.key not in skip)
+
+
+PLAN_FIELDS = _snapshot_fields(Plan)
+ISP_FIELDS = _snapshot_fields(ISP)
+# Only what is needed to reach and identify a router; volatile columns such
+# as last_seen or config_version must not invalidate the entry on every write.
+ROUTER_FIELDS = ('id', 'isp_id', 'name', 'model', 'serial_number', 'firmware_version',
+                 'ip_address', 'api_port', 'ssh_port', 'username', 'password',
+                 'is_active', 'backup_enabled', 'backup_schedule')
+# Tenancy only, resolved on every request by the rate limiter
+USER_FIELDS = ('id', 'isp_id', 'role', 'client_id')
+
+PlanSnapshot = namedtuple('PlanSnapshot', PLAN_FIELDS)
+ISPSnapshot = namedtuple('ISPSnapshot', ISP_FIELDS)
+RouterSnapshot = namedtuple('RouterSnapshot', ROUTER_FIELDS)
+UserSnapshot = namedtuple('UserSnapshot', USER_FIELDS)
+
+_CACHED_MODELS = {
+    Plan: ('plan', PLAN_FIELDS),
+    ISP: ('isp', ISP_FIELDS),
+    MikroTikRouter: ('router', ROUTER_FIELDS),
+    User: ('user', USER_FIELDS),
+}
+
+
+class MetadataCache:
+    """Read-through cache of immutable snapshots, invalidated on commit
+
+    Writes to cached models are detected in the SQLAlchemy session, evicted
+    locally after commit and broadcast over Redis pub/sub so every worker
+    process drops its copy.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.cache = LRUCache(maxsize, ttl)
+        self.redis_url = None
+        self._redis = None
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.cache = LRUCache(app.config.get('METADATA_CACHE_SIZE', 10000),
+                              app.config.get('METADATA_CACHE_TTL', 300))
+        self.redis_url = app.config.get('REDIS_URL')
+        if not event.contains(Session, 'after_flush', _collect_invalidations):
+            event.listen(Session, 'after_flush', _collect_invalidations)
+            event.listen(Session, 'after_commit', _publish_invalidations)
+            event.listen(Session, 'after_rollback', _discard_invalidations)
+        app.extensions['metadata_cache'] = self
+
+    # ==================== LOOKUPS ====================
+
+    def get_plan(self, plan_id: str) -> Optional[PlanSnapshot]:
+        return self._read_through(('plan', plan_id), Plan, PLAN_FIELDS, PlanSnapshot,
+                                  Plan.id == plan_id)
+
+    def get_isp(self, isp_id: str) -> Optional[ISPSnapshot]:
+        return self._read_through(('isp', isp_id), ISP, ISP_FIELDS, ISPSnapshot,
+                                  ISP.id == isp_id)
+
+    def get_router(self, router_id: str) -> Optional[RouterSnapshot]:
+        return self._read_through(('router', router_id), MikroTikRouter, ROUTER_FIELDS,
+                                  RouterSnapshot, MikroTikRouter.id == router_id)
+
+    def get_user(self, user_id: str) -> Optional[UserSnapshot]:
+        return self._read_through(('user', user_id), User, USER_FIELDS, UserSnapshot,
+                                  User.id == user_id)
+
+    def get_active_router_for_isp(self, isp_id: str) -> Optional[RouterSnapshot]:
+        """Cached equivalent of MikroTikRouter.active_for_isp"""
+        return self._read_through(('isp_router', isp_id), MikroTikRouter, ROUTER_FIELDS,
+                                  RouterSnapshot, MikroTikRouter.isp_id == isp_id,
+                                  MikroTikRouter.is_active.is_(True))
+
+    def _read_through(self, key, model, fields, snapshot_cls, *criteria):
+        self._ensure_listener()
+        value = self.cache.get(key)
+        if value is not _MISSING:
+            return value
+
+        # Taken before the query: a commit evicting the key while it runs
+        # makes the set below a no-op instead of caching the old row
+        generation = self.cache.generation(key)
+        row = db.session.query(*[getattr(model, f) for f in fields]).filter(*criteria).first()
+        value = snapshot_cls(*row) if row else None
+        self.cache.set(key, value, generation)
+        return value
+
+    # ==================== INVALIDATION ====================
+
+    def invalidate(self, keys: Iterable[Tuple[str, str]], broadcast: bool = True):
+        keys = [tuple(k) for k in keys]
+        for key in keys:
+            self.cache.delete(key)
+        if broadcast and keys:
+            self._publish(keys)
+
+    def stats(self) -> Dict:
+        return {
+            'size': len(self.cache),
+            'maxsize': self.cache.maxsize,
+            'ttl': self.cache.ttl,
+            'hits': self.cache.hits,
+            'misses': self.cache.misses
+        }
+
+    def _get_redis(self):
+        if self._redis is None and self.redis_url:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def _publish(self, keys: List[Tuple[str, str]]):
+        try:
+            client = self._get_redis()
+            if client is not None:
+                client.publish(INVALIDATION_CHANNEL, json.dumps(keys))
+        except Exception as e:
+            # Peers fall back to TTL expiry if the broadcast is lost
+            logger.warning(f"Could not broadcast cache invalidation: {e}")
+
+    def _ensure_listener(self):
+        """Start the pub/sub listener once per process (again after fork)"""
+        if self._listener_pid == os.getpid() or not self.redis_url:
+            return
+        with self._listener_lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._redis = None
+            thread = threading.Thread(target=self._listen, name='metadata-cache-invalidation',
+                                      daemon=True)
+            thread.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything cached before the subscription may have missed a message
+                self.cache.clear()
+                for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    for key in json.loads(message['data']):
+                        self.cache.delete(tuple(key))
+            except Exception as e:
+                logger.warning(f"Metadata cache listener error, retrying: {e}")
+                self.cache.clear()
+                time.sleep(5)
+
+
+metadata_cache = MetadataCache()
+
+
+def _changed_keys(obj, deleted: bool) -> Set[Tuple[str, str]]:
+    kind, fields = _CACHED_MODELS[type(obj)]
+    state = inspect(obj)
+    if not deleted and not any(state.attrs[f].history.has_changes() for f in fields):
+        return set()
+    keys = {(kind, obj.id)}
+    if kind == 'router':
+        keys.add(('isp_router', obj.isp_id))
+        previous_isp = state.attrs['isp_id'].history.deleted
+        keys.update(('isp_router', isp_id) for isp_id in previous_isp if isp_id)
+    return keys
+
+
+def _collect_invalidations(session, flush_context):
+    pending = session.info.setdefault('metadata_cache_invalidations', set())
+    for objs, deleted in ((session.new, False), (session.dirty, False), (session.deleted, True)):
+        for obj in objs:
+            if type(obj) in _CACHED_MODELS:
+                pending.update(_changed_keys(obj, deleted))
+
+
+def _publish_invalidations(session):
+    pending = session.info.pop('metadata_cache_invalidations', None)
+    if pending:
+        metadata_cache.invalidate(pending)
+
+
+def _discard_invalidations(session):
+    session.info.pop('metadata_cache_invalidations', None)
@@ -1,32 +1,51 @@
 """
 Advanced MikroTik Service with v6/v7 support
 """
-import routeros_api
 from typing import Dict, List, Optional, Any
 import logging
 import re
+import weakref
 from datetime import datetime
 from app.models import Client, Plan, MikroTikRouter
 from app import db
+from app.services.provisioning_profile import ProvisioningProfiler
+from app.services.routeros_metrics import instrument
+from app.services.router_scheduler import WRITE, router_scheduler, track_request_session
+from app.startup import lazy_module
+from app.services.routeros_values import (INTERFACE_SCHEMA, SIMPLE_QUEUE_SCHEMA, SYSTEM_RESOURCE_SCHEMA,
+                                          parse_row, parse_table, to_records)
 
 logger = logging.getLogger(__name__)
 
+routeros_api = lazy_module('routeros_api')
+
 class MikroTikAdvancedService:
     """Advanced MikroTik management service"""
     
-    def __init__(self, router_ip: str, username: str, password: str, port: int = 8728):
+    def __init__(self, router_ip: str, username: str, password: str, port: int = 8728,
+                 router_id: str = None):
         self.connection = None
+        self.router_id = router_id
         self.api = None
         self.router_ip = router_ip
         self.username = username
         self.password = password
         self.port = port
         self.routeros_version = None
+        self.board_name = None
         self.capsman_supported = False
+        self._release_session = None
         self.connect()
     
     def connect(self) -> bool:
-        """Establish connection to MikroTik router"""
+        """Establish connection to MikroTik router
+
+        Used for provisioning, so it queues for the router as a write.
+        """
+        grant = router_scheduler.session(self.router_id or self.router_ip, priority=WRITE)
+        if grant is not None:
+            self._release_session = weakref.finalize(self, grant.release)
+            track_request_session(self)
         try:
             self.connection = routeros_api.RouterOsApiPool(
                 host=self.router_ip,
@@ -36,7 +55,8 @@ class MikroTikAdvancedService:
                 plaintext_login=True,
                 use_ssl=False
             )
-            self.api = self.connection.get_api()
+            self.api = instrument(self.connection, self.connection.get_api(),
+                                  self.router_id or self.router_ip)
             
             # Detect router info
             self._detect_router_info()
@@ -45,6 +65,7 @@ class MikroTikAdvancedService:
             
         except Exception as e:
             logger.error(f"Error connecting to MikroTik: {e}")
+            self.disconnect()
             raise
     
     def _detect_router_info(self):
@@ -56,6 +77,7 @@ class MikroTikAdvancedService:
             if system_info:
                 version = system_info[0].get('version', '6.0')
                 self.routeros_version = self._parse_version(version)
+                self.board_name = system_info[0].get('board-name')
                 
                 # Detect CAPsMAN support
                 try:
@@ -81,31 +103,37 @@ class MikroTikAdvancedService:
         except:
             return False
     
-    def provision_client(self, client: Client, plan: Plan) -> Dict[str, Any]:
+    def provision_client(self, client: Client, plan: Plan, profile: bool = False) -> Dict[str, Any]:
         """Provision a new client with advanced configuration"""
         results = {
             'success': False,
             'steps': {},
             'errors': []
         }
+        profiler = ProvisioningProfiler(self.api, enabled=profile)
         
         try:
             # 1. Configure IP address
             if client.ip_address and client.connection_type == 'static':
-                results['steps']['ip_config'] = self._configure_static_ip(client)
+                with profiler.step('ip_config'):
+                    results['steps']['ip_config'] = self._configure_static_ip(client)
             
             # 2. Create DHCP lease if needed
             if client.mac_address:
-                results['steps']['dhcp_lease'] = self._create_dhcp_lease(client)
+                with profiler.step('dhcp_lease'):
+                    results['steps']['dhcp_lease'] = self._create_dhcp_lease(client)
             
             # 3. Apply advanced QoS
-            results['steps']['qos'] = self._apply_advanced_qos(client, plan)
+            with profiler.step('qos'):
+                results['steps']['qos'] = self._apply_advanced_qos(client, plan)
             
             # 4. Configure firewall rules
-            results['steps']['firewall'] = self._configure_client_firewall(client)
+            with profiler.step('firewall'):
+                results['steps']['firewall'] = self._configure_client_firewall(client)
             
             # 5. Set up WiFi if CPE has wireless
-            results['steps']['wifi'] = self._configure_client_wifi(client)
+            with profiler.step('wifi'):
+                results['steps']['wifi'] = self._configure_client_wifi(client)
             
             # Check if all steps were successful
             all_success = all(results['steps'].values())
@@ -120,6 +148,10 @@ class MikroTikAdvancedService:
             logger.error(f"Error provisioning client: {e}")
             results['errors'].append(str(e))
         
+        if profiler.enabled:
+            results['profile'] = profiler.to_dict()
+            profiler.save(self.board_name, self.routeros_version)
+        
         return results
     
     def _configure_static_ip(self, client: Client) -> bool:
@@ -203,18 +235,18 @@ class MikroTikAdvancedService:
                 queue_type_api.add(
                     name="PCQ_Download",
                     kind="pcq",
-                    pcq-rate="0",
-                    pcq-limit="50",
-                    pcq-classifier="dst-address"
+                    **{"pcq-rate": "0",
+                       "pcq-limit": "50",
+                       "pcq-classifier": "dst-address"}
                 )
             
             if not pcq_upload_exists:
                 queue_type_api.add(
                     name="PCQ_Upload",
                     kind="pcq",
-                    pcq-rate="0",
-                    pcq-limit="50",
-                    pcq-classifier="src-address"
+                    **{"pcq-rate": "0",
+                       "pcq-limit": "50",
+                       "pcq-classifier": "src-address"}
                 )
             
             # Create queue
@@ -296,45 +328,47 @@ class MikroTikAdvancedService:
             # System resource metrics
             system_resource = self.api.get_resource('/system/resource')
             system_info = system_resource.get()[0]
+            values = parse_row(system_info, SYSTEM_RESOURCE_SCHEMA)
             metrics['system'] = {
-                'cpu_load': system_info.get('cpu-load'),
-                'free_memory': system_info.get('free-memory'),
-                'total_memory': system_info.get('total-memory'),
+                'cpu_load': values['cpu-load'],
+                'free_memory': int(values['free-memory']),
+                'total_memory': int(values['total-memory']),
                 'uptime': system_info.get('uptime'),
+                'uptime_seconds': int(values['uptime']),
                 'version': system_info.get('version'),
                 'board_name': system_info.get('board-name')
             }
             
             # Interface metrics
             interface_api = self.api.get_resource('/interface')
-            interfaces = interface_api.get()
-            metrics['interfaces'] = []
-            
-            for interface in interfaces:
-                metrics['interfaces'].append({
-                    'name': interface.get('name'),
-                    'type': interface.get('type'),
-                    'rx_bytes': interface.get('rx-byte'),
-                    'tx_bytes': interface.get('tx-byte'),
-                    'rx_packets': interface.get('rx-packet'),
-                    'tx_packets': interface.get('tx-packet'),
-                    'running': interface.get('running') == 'true'
-                })
+            interfaces = parse_table(interface_api.get(), INTERFACE_SCHEMA)
+            metrics['interfaces'] = to_records(interfaces, {
+                'name': 'name',
+                'type': 'type',
+                'rx_bytes': 'rx-byte',
+                'tx_bytes': 'tx-byte',
+                'rx_packets': 'rx-packet',
+                'tx_packets': 'tx-packet',
+                'running': 'running'
+            })
             
             # Queue metrics
             queue_api = self.api.get_resource('/queue/simple')
-            queues = queue_api.get()
-            metrics['queues'] = []
-            
-            for queue in queues[:10]:  # Limit to first 10 queues
-                metrics['queues'].append({
-                    'name': queue.get('name'),
-                    'target': queue.get('target'),
-                    'rate': queue.get('rate'),
-                    'packet_rate': queue.get('packet-rate'),
-                    'queued_bytes': queue.get('queued-bytes'),
-                    'queued_packets': queue.get('queued-packets')
-                })
+            queues = parse_table(queue_api.get()[:10], SIMPLE_QUEUE_SCHEMA)  # Limit to first 10 queues
+            queues['rate_up'], queues['rate_down'] = queues['rate'].T
+            queues['packet_rate_up'], queues['packet_rate_down'] = queues['packet-rate'].T
+            queues['queued_bytes'] = queues['queued-bytes'].sum(axis=1)
+            queues['queued_packets'] = queues['queued-packets'].sum(axis=1)
+            metrics['queues'] = to_records(queues, {
+                'name': 'name',
+                'target': 'target',
+                'rate_up_bps': 'rate_up',
+                'rate_down_bps': 'rate_down',
+                'packet_rate_up': 'packet_rate_up',
+                'packet_rate_down': 'packet_rate_down',
+                'queued_bytes': 'queued_bytes',
+                'queued_packets': 'queued_packets'
+            })
             
             return metrics
             
@@ -377,3 +411,7 @@ class MikroTikAdvancedService:
                 self.connection.disconnect()
         except:
             pass
+        finally:
+            if self._release_session is not None:
+                self._release_session()
+                self._release_session = None
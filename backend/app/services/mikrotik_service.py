@@ -2,41 +2,89 @@
 MikroTik Management Service
 Handles all MikroTik router operations for ISPMAX
 """
-import routeros_api
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, Iterator, List, Optional, Any, Set, Tuple
+from itertools import islice
 import logging
 import ipaddress
 import re
+import weakref
 from datetime import datetime, timedelta
 from app.models import Client, Plan, MikroTikRouter
-from app import db, cache
+from app import db
+from app.services.backup_store import get_backup_store
+from app.services.config_drift_service import ConfigDriftService
+from app.services.health_service import HealthScoringService
+from app.services.metadata_cache import metadata_cache
+from app.services.provisioning_profile import ProvisioningProfiler
+from app.services.routeros_metrics import instrument
+from app.services.router_scheduler import READ, RouterBusy, router_scheduler, track_request_session
+from app.startup import lazy_module
+from app.services.routeros_values import (INTERFACE_SCHEMA, SIMPLE_QUEUE_SCHEMA, SYSTEM_RESOURCE_SCHEMA,
+                                          parse_row, parse_table, to_records)
+from flask import current_app
 import json
 
 logger = logging.getLogger(__name__)
 
+routeros_api = lazy_module('routeros_api')
+
+# Rows parsed per NumPy batch when streaming long listings
+STREAM_BATCH_ROWS = 1000
+
+# router_id -> last time this process wrote MikroTikRouter.last_seen
+_last_seen_writes: Dict[str, datetime] = {}
+
 class MikroTikService:
     """Main MikroTik service for ISPMAX"""
     
-    def __init__(self, router_id: str = None):
+    def __init__(self, router_id: str = None, priority: int = READ):
+        """``priority`` orders this session against others queued for the
+        same router (router_scheduler.WRITE for client mutations)"""
         self.router = None
         self.api = None
+        self.priority = priority
+        self._release_session = None
         if router_id:
             self.connect_to_router(router_id)
     
     def connect_to_router(self, router_id: str) -> bool:
-        """Connect to specific router by ID"""
+        """Connect to specific router by ID
+
+        Waits for a session slot on the router; raises RouterBusy (503) if
+        none frees up within MIKROTIK_QUEUE_TIMEOUT.
+        """
         try:
-            self.router = MikroTikRouter.query.get(router_id)
+            self.router = metadata_cache.get_router(router_id)
             if not self.router:
                 logger.error(f"Router {router_id} not found")
                 return False
             
-            return self._connect(self.router.ip_address, self.router.username, 
-                               self.router.password, self.router.api_port)
+            self._hold_session(router_scheduler.session(self.router.id, self.router.isp_id, self.priority))
+            if self._connect(self.router.ip_address, self.router.username,
+                             self.router.password, self.router.api_port):
+                return True
+            self._end_session()
+            return False
+        except RouterBusy:
+            raise
         except Exception as e:
             logger.error(f"Error connecting to router {router_id}: {e}")
+            self._end_session()
             return False
     
+    def _hold_session(self, grant):
+        self._end_session()
+        if grant is not None:
+            # Released by disconnect(), at the end of the request, or when
+            # this service is garbage collected, whichever comes first
+            self._release_session = weakref.finalize(self, grant.release)
+            track_request_session(self)
+    
+    def _end_session(self):
+        if self._release_session is not None:
+            self._release_session()
+            self._release_session = None
+    
     def _connect(self, ip: str, username: str, password: str, port: int = 8728) -> bool:
         """Establish connection to MikroTik router"""
         try:
@@ -46,25 +94,40 @@ class MikroTikService:
                 password=password,
                 port=port,
                 plaintext_login=True,
-                use_ssl=False,
-                timeout=10
+                use_ssl=False
             )
-            self.api = self.connection.get_api()
+            self.connection.set_timeout(10)
+            self.api = instrument(self.connection, self.connection.get_api(),
+                                  self.router.id if self.router else ip)
             logger.info(f"Connected to MikroTik {ip}")
             
             # Update last seen
             if self.router:
-                self.router.last_seen = datetime.utcnow()
-                db.session.commit()
+                self._touch_last_seen(self.router.id)
             
             return True
         except Exception as e:
             logger.error(f"Connection failed to {ip}: {e}")
             return False
     
+    @staticmethod
+    def _touch_last_seen(router_id: str):
+        """Record last_seen, at most once per MIKROTIK_LAST_SEEN_INTERVAL per process"""
+        now = datetime.utcnow()
+        interval = current_app.config.get('MIKROTIK_LAST_SEEN_INTERVAL', 60)
+        last_write = _last_seen_writes.get(router_id)
+        if last_write and (now - last_write).total_seconds() < interval:
+            return
+        _last_seen_writes[router_id] = now
+        MikroTikRouter.query.filter_by(id=router_id).update(
+            {'last_seen': now}, synchronize_session=False
+        )
+        db.session.commit()
+    
     # ==================== CLIENT MANAGEMENT ====================
     
-    def provision_client(self, client: Client, plan: Plan, config: Dict = None) -> Dict:
+    def provision_client(self, client: Client, plan: Plan, config: Dict = None,
+                         profile: bool = None) -> Dict:
         """
         Provision a new client on MikroTik
         
@@ -72,6 +135,7 @@ class MikroTikService:
             client: Client model instance
             plan: Plan model instance
             config: Additional configuration options
+            profile: Time each step (defaults to PROVISION_PROFILING)
         
         Returns:
             Dict with success status and details
@@ -82,29 +146,39 @@ class MikroTikService:
             'errors': [],
             'warnings': []
         }
+        if profile is None:
+            profile = current_app.config.get('PROVISION_PROFILING', False)
+        profiler = ProvisioningProfiler(self.api, enabled=profile)
         
         try:
             # Step 1: Configure IP address
             if client.connection_type == 'pppoe':
-                results['steps']['pppoe'] = self._configure_pppoe(client, plan)
+                with profiler.step('pppoe'):
+                    results['steps']['pppoe'] = self._configure_pppoe(client, plan)
             elif client.ip_address:
-                results['steps']['ip'] = self._configure_static_ip(client)
+                with profiler.step('ip'):
+                    results['steps']['ip'] = self._configure_static_ip(client)
             
             # Step 2: DHCP lease if MAC provided
             if client.mac_address:
-                results['steps']['dhcp'] = self._create_dhcp_lease(client)
+                with profiler.step('dhcp'):
+                    results['steps']['dhcp'] = self._create_dhcp_lease(client)
             
             # Step 3: QoS configuration
-            results['steps']['qos'] = self._configure_qos(client, plan)
+            with profiler.step('qos'):
+                results['steps']['qos'] = self._configure_qos(client, plan)
             
             # Step 4: Firewall rules
-            results['steps']['firewall'] = self._configure_firewall_rules(client, plan)
+            with profiler.step('firewall'):
+                results['steps']['firewall'] = self._configure_firewall_rules(client, plan)
             
             # Step 5: WiFi configuration (if applicable)
-            results['steps']['wifi'] = self._configure_wifi(client, config)
+            with profiler.step('wifi'):
+                results['steps']['wifi'] = self._configure_wifi(client, config)
             
             # Step 6: Apply features (IPv6, Gaming, VoIP)
-            results['steps']['features'] = self._apply_plan_features(client, plan)
+            with profiler.step('features'):
+                results['steps']['features'] = self._apply_plan_features(client, plan)
             
             # Check overall success
             successful_steps = [k for k, v in results['steps'].items() if v]
@@ -120,6 +194,11 @@ class MikroTikService:
             logger.error(f"Error provisioning client {client.id}: {e}")
             results['errors'].append(str(e))
         
+        if profiler.enabled:
+            results['profile'] = profiler.to_dict()
+            profiler.save(self.router.model if self.router else None,
+                          self.router.firmware_version if self.router else None)
+        
         return results
     
     def _configure_pppoe(self, client: Client, plan: Plan) -> bool:
@@ -272,7 +351,7 @@ class MikroTikService:
             firewall_api.add(
                 chain="forward",
                 src_address=client.ip_address,
-                connection_limit=1000,32,
+                connection_limit="1000,32",
                 action="drop",
                 comment=f"Rate limit: {client.full_name}"
             )
@@ -430,6 +509,34 @@ class MikroTikService:
             logger.error(f"Error suspending client: {e}")
             return False
     
+    def suspend_clients(self, clients: List[Client], reason: str = "non-payment") -> List[str]:
+        """Suspend many clients over the current session; return the ids suspended"""
+        queue_api = self.api.get_resource('/queue/simple')
+        address_list_api = self.api.get_resource('/ip/firewall/address-list')
+        firewall_api = self.api.get_resource('/ip/firewall/filter')
+
+        suspended = []
+        for client in clients:
+            try:
+                queue_api.set(disabled="yes", name=f"client_{client.id}")
+                address_list_api.add(
+                    list="suspended_clients",
+                    address=client.ip_address,
+                    comment=f"Suspendido: {client.full_name} - Razón: {reason}"
+                )
+                firewall_api.add(
+                    chain="forward",
+                    src_address=client.ip_address,
+                    action="drop",
+                    comment=f"Cliente suspendido: {client.full_name}"
+                )
+                suspended.append(client.id)
+            except Exception as e:
+                logger.error(f"Error suspending client {client.id}: {e}")
+
+        logger.info(f"Suspended {len(suspended)}/{len(clients)} clients: {reason}")
+        return suspended
+
     def activate_client(self, client: Client) -> bool:
         """Activate suspended client"""
         try:
@@ -439,7 +546,8 @@ class MikroTikService:
             
             # Remove from suspended list
             address_list_api = self.api.get_resource('/ip/firewall/address-list')
-            address_list_api.remove(address_list_api.get(list="suspended_clients", address=client.ip_address)[0]['id'])
+            for entry in address_list_api.get(list="suspended_clients", address=client.ip_address):
+                address_list_api.remove(id=entry['id'])
             
             # Remove block rule
             firewall_api = self.api.get_resource('/ip/firewall/filter')
@@ -456,26 +564,96 @@ class MikroTikService:
     def update_client_speed(self, client: Client, new_plan: Plan) -> bool:
         """Update client speed/plan"""
         try:
-            queue_api = self.api.get_resource('/queue/simple')
-            queue_api.set(
-                max_limit=f"{new_plan.download_speed}M/{new_plan.upload_speed}M",
-                name=f"client_{client.id}"
-            )
-            
-            # Update burst if exists
-            if new_plan.burst_download and new_plan.burst_upload:
-                queue_api.set(
-                    burst_limit=f"{new_plan.burst_download}M/{new_plan.burst_upload}M",
-                    burst_threshold=f"{new_plan.download_speed * 0.8}M/{new_plan.upload_speed * 0.8}M",
-                    name=f"client_{client.id}"
-                )
-            
+            self._set_plan_limits(self.api.get_resource('/queue/simple'), client, new_plan)
             logger.info(f"Client {client.full_name} speed updated to {new_plan.name}")
             return True
         except Exception as e:
             logger.error(f"Error updating client speed: {e}")
             return False
     
+    @staticmethod
+    def _set_plan_limits(queue_api, client: Client, plan: Plan):
+        queue_api.set(
+            max_limit=f"{plan.download_speed}M/{plan.upload_speed}M",
+            name=f"client_{client.id}"
+        )
+        
+        # Update burst if exists
+        if plan.burst_download and plan.burst_upload:
+            queue_api.set(
+                burst_limit=f"{plan.burst_download}M/{plan.burst_upload}M",
+                burst_threshold=f"{plan.download_speed * 0.8}M/{plan.upload_speed * 0.8}M",
+                name=f"client_{client.id}"
+            )
+    
+    def apply_client_states(self, changes: List[Tuple[Client, Optional[Plan], Set[str]]],
+                            reasons: Dict[str, str] = None) -> Dict[str, bool]:
+        """Bring clients to their current database state over this session
+        
+        ``changes`` holds (client, plan, aspects), aspects being any of
+        'status', 'plan' and 'provision'. Re-provisioning covers the plan.
+        The suspension address list and block rules are read once for the
+        whole batch, and suspending an already blocked client adds nothing.
+        Returns client id -> success.
+        """
+        reasons = reasons or {}
+        queue_api = self.api.get_resource('/queue/simple')
+        address_list_api = self.api.get_resource('/ip/firewall/address-list')
+        firewall_api = self.api.get_resource('/ip/firewall/filter')
+        
+        listed: Dict[str, List[str]] = {}
+        blocks: Dict[str, List[str]] = {}
+        if any('status' in aspects for _, _, aspects in changes):
+            for entry in address_list_api.get(list="suspended_clients"):
+                listed.setdefault(entry.get('address'), []).append(entry['id'])
+            for rule in firewall_api.get(chain="forward", action="drop"):
+                if rule.get('comment', '').startswith("Cliente suspendido: "):
+                    blocks.setdefault(rule['comment'], []).append(rule['id'])
+        
+        results = {}
+        for client, plan, aspects in changes:
+            try:
+                if 'provision' in aspects:
+                    if not self.provision_client(client, plan)['success']:
+                        results[client.id] = False
+                        continue
+                elif 'plan' in aspects and plan is not None:
+                    self._set_plan_limits(queue_api, client, plan)
+                
+                if 'status' in aspects:
+                    comment = f"Cliente suspendido: {client.full_name}"
+                    if client.status == 'suspended':
+                        reason = reasons.get(client.id, "non-payment")
+                        queue_api.set(disabled="yes", name=f"client_{client.id}")
+                        if client.ip_address not in listed:
+                            address_list_api.add(
+                                list="suspended_clients",
+                                address=client.ip_address,
+                                comment=f"Suspendido: {client.full_name} - Razón: {reason}"
+                            )
+                        if comment not in blocks:
+                            firewall_api.add(
+                                chain="forward",
+                                src_address=client.ip_address,
+                                action="drop",
+                                comment=comment
+                            )
+                    elif client.status == 'active':
+                        queue_api.set(disabled="no", name=f"client_{client.id}")
+                        for entry_id in listed.pop(client.ip_address, []):
+                            address_list_api.remove(id=entry_id)
+                        for rule_id in blocks.pop(comment, []):
+                            firewall_api.remove(id=rule_id)
+                results[client.id] = True
+            except Exception as e:
+                logger.error(f"Error applying state of client {client.id}: {e}")
+                results[client.id] = False
+        
+        applied = sum(results.values())
+        logger.info(f"Applied {applied}/{len(changes)} client states on router "
+                    f"{self.router.id if self.router else 'unregistered'}")
+        return results
+    
     # ==================== ROUTER MANAGEMENT ====================
     
     def get_router_info(self) -> Dict:
@@ -487,7 +665,9 @@ class MikroTikService:
             
             info = system_resource.get()[0]
             identity = system_identity.get()[0]
-            routerboard = system_routerboard.get()[0] if system_routerboard.get() else {}
+            routerboards = system_routerboard.get()
+            routerboard = routerboards[0] if routerboards else {}
+            values = parse_row(info, SYSTEM_RESOURCE_SCHEMA)
             
             return {
                 'identity': identity.get('name', 'Unknown'),
@@ -495,9 +675,10 @@ class MikroTikService:
                 'serial_number': routerboard.get('serial-number', 'Unknown'),
                 'firmware': info.get('version', 'Unknown'),
                 'uptime': info.get('uptime', 'Unknown'),
-                'cpu_load': info.get('cpu-load', 'Unknown'),
-                'memory_usage': info.get('free-memory', 'Unknown'),
-                'total_memory': info.get('total-memory', 'Unknown'),
+                'uptime_seconds': int(values['uptime']),
+                'cpu_load': values['cpu-load'],
+                'memory_usage': int(values['free-memory']),
+                'total_memory': int(values['total-memory']),
                 'board_name': info.get('board-name', 'Unknown')
             }
         except Exception as e:
@@ -508,23 +689,22 @@ class MikroTikService:
         """Get interface statistics"""
         try:
             interface_api = self.api.get_resource('/interface')
-            interfaces = interface_api.get()
-            
-            stats = []
-            for interface in interfaces:
-                stats.append({
-                    'name': interface.get('name'),
-                    'type': interface.get('type'),
-                    'mtu': interface.get('mtu'),
-                    'mac_address': interface.get('mac-address'),
-                    'running': interface.get('running') == 'true',
-                    'rx_bytes': interface.get('rx-byte', '0'),
-                    'tx_bytes': interface.get('tx-byte', '0'),
-                    'rx_packets': interface.get('rx-packet', '0'),
-                    'tx_packets': interface.get('tx-packet', '0')
-                })
-            
-            return stats
+            interfaces = parse_table(interface_api.get(), INTERFACE_SCHEMA)
+            
+            return to_records(interfaces, {
+                'name': 'name',
+                'type': 'type',
+                'mtu': 'mtu',
+                'mac_address': 'mac-address',
+                'running': 'running',
+                'rx_bytes': 'rx-byte',
+                'tx_bytes': 'tx-byte',
+                'rx_packets': 'rx-packet',
+                'tx_packets': 'tx-packet',
+                'rx_errors': 'rx-error',
+                'tx_errors': 'tx-error',
+                'disabled': 'disabled'
+            })
         except Exception as e:
             logger.error(f"Error getting interface stats: {e}")
             return []
@@ -532,63 +712,103 @@ class MikroTikService:
     def get_queue_stats(self) -> List[Dict]:
         """Get queue statistics"""
         try:
-            queue_api = self.api.get_resource('/queue/simple')
-            queues = queue_api.get()
-            
-            stats = []
-            for queue in queues[:50]:  # Limit to first 50 queues
-                stats.append({
-                    'name': queue.get('name', ''),
-                    'target': queue.get('target', ''),
-                    'max_limit': queue.get('max-limit', ''),
-                    'rate': queue.get('rate', ''),
-                    'packet_rate': queue.get('packet-rate', ''),
-                    'queued_bytes': queue.get('queued-bytes', '0'),
-                    'queued_packets': queue.get('queued-packets', '0'),
-                    'disabled': queue.get('disabled') == 'true'
-                })
-            
-            return stats
+            return list(self.iter_queue_stats(limit=50))  # Limit to first 50 queues
         except Exception as e:
             logger.error(f"Error getting queue stats: {e}")
             return []
     
+    def iter_queue_stats(self, limit: Optional[int] = None) -> Iterator[Dict]:
+        """Queue statistics parsed in fixed-size batches as rows arrive from the router"""
+        queue_api = self.api.get_resource('/queue/simple')
+        rows = queue_api.iterate('print')
+        try:
+            remaining = limit
+            while remaining is None or remaining > 0:
+                size = STREAM_BATCH_ROWS if remaining is None else min(STREAM_BATCH_ROWS, remaining)
+                queues = list(islice(rows, size))
+                if not queues:
+                    break
+                if remaining is not None:
+                    remaining -= len(queues)
+                yield from self._queue_records(queues)
+        finally:
+            rows.close()
+    
+    @staticmethod
+    def _queue_records(queues: List[Dict]) -> List[Dict]:
+        table = parse_table(queues, SIMPLE_QUEUE_SCHEMA)
+        table['rate_up'], table['rate_down'] = table['rate'].T
+        table['limit_up'], table['limit_down'] = table['max-limit'].T
+        table['queued_bytes'] = table['queued-bytes'].sum(axis=1)
+        table['queued_packets'] = table['queued-packets'].sum(axis=1)
+        
+        stats = to_records(table, {
+            'name': 'name',
+            'target': 'target',
+            'rate_up_bps': 'rate_up',
+            'rate_down_bps': 'rate_down',
+            'max_limit_up_bps': 'limit_up',
+            'max_limit_down_bps': 'limit_down',
+            'queued_bytes': 'queued_bytes',
+            'queued_packets': 'queued_packets',
+            'disabled': 'disabled'
+        })
+        # Display strings are passed through as RouterOS prints them
+        for stat, queue in zip(stats, queues):
+            stat['max_limit'] = queue.get('max-limit', '')
+            stat['rate'] = queue.get('rate', '')
+            stat['packet_rate'] = queue.get('packet-rate', '')
+        return stats
+    
+    def get_queue_samples(self) -> List[Dict]:
+        """Name, byte counters, current rate and max-limit of every simple queue"""
+        queue_api = self.api.get_resource('/queue/simple')
+        return queue_api.call('print', {'.proplist': 'name,bytes,rate,max-limit'})
+    
+    def set_queue_limits(self, limits: Dict[str, str]) -> List[str]:
+        """Set max-limit on many client queues over the current session"""
+        queue_api = self.api.get_resource('/queue/simple')
+        updated = []
+        for client_id, max_limit in limits.items():
+            try:
+                queue_api.set(max_limit=max_limit, name=f"client_{client_id}")
+                updated.append(client_id)
+            except Exception as e:
+                logger.error(f"Error setting queue limit for client {client_id}: {e}")
+        return updated
+    
     def get_active_connections(self) -> List[Dict]:
         """Get active connections/leases"""
         try:
-            connections = []
-            
-            # DHCP leases
-            dhcp_api = self.api.get_resource('/ip/dhcp-server/lease')
-            leases = dhcp_api.get()
-            for lease in leases:
-                if lease.get('status') == 'bound':
-                    connections.append({
-                        'type': 'dhcp',
-                        'address': lease.get('address'),
-                        'mac_address': lease.get('mac-address'),
-                        'host_name': lease.get('host-name', ''),
-                        'status': lease.get('status'),
-                        'expires': lease.get('expires-after')
-                    })
-            
-            # PPPoE connections
-            pppoe_api = self.api.get_resource('/ppp/active')
-            pppoe_connections = pppoe_api.get()
-            for conn in pppoe_connections:
-                connections.append({
-                    'type': 'pppoe',
-                    'name': conn.get('name'),
-                    'address': conn.get('address'),
-                    'uptime': conn.get('uptime'),
-                    'service': conn.get('service')
-                })
-            
-            return connections
+            return list(self.iter_active_connections())
         except Exception as e:
             logger.error(f"Error getting active connections: {e}")
             return []
     
+    def iter_active_connections(self) -> Iterator[Dict]:
+        """Bound DHCP leases, then PPPoE sessions, one row at a time"""
+        dhcp_api = self.api.get_resource('/ip/dhcp-server/lease')
+        for lease in dhcp_api.iterate('print'):
+            if lease.get('status') == 'bound':
+                yield {
+                    'type': 'dhcp',
+                    'address': lease.get('address'),
+                    'mac_address': lease.get('mac-address'),
+                    'host_name': lease.get('host-name', ''),
+                    'status': lease.get('status'),
+                    'expires': lease.get('expires-after')
+                }
+        
+        pppoe_api = self.api.get_resource('/ppp/active')
+        for conn in pppoe_api.iterate('print'):
+            yield {
+                'type': 'pppoe',
+                'name': conn.get('name'),
+                'address': conn.get('address'),
+                'uptime': conn.get('uptime'),
+                'service': conn.get('service')
+            }
+    
     # ==================== ADVANCED FEATURES ====================
     
     def configure_hotspot(self, config: Dict) -> bool:
@@ -664,7 +884,7 @@ class MikroTikService:
             return False
     
     def backup_configuration(self, backup_name: str = None) -> Dict:
-        """Backup router configuration"""
+        """Backup router configuration into the deduplicated backup store"""
         try:
             if not backup_name:
                 backup_name = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
@@ -675,16 +895,56 @@ class MikroTikService:
             # Also export configuration
             export_api = self.api.get_resource('/export')
             export = export_api.get(file=backup_name)
+            contents = export[0].get('contents', '') if export else ''
             
-            return {
+            response = {
                 'success': True,
-                'backup_name': backup_name,
-                'export': export[0].get('contents', '') if export else ''
+                'backup_name': backup_name
             }
+            
+            if self.router and contents:
+                lines = contents.splitlines()
+                store = get_backup_store()
+                manifest = store.ingest(self.router.id, lines, name=backup_name)
+                index = ConfigDriftService(store).record(self.router.id, manifest['version'], lines)
+                response.update({
+                    'version': manifest['version'],
+                    'digest': manifest['digest'],
+                    'size': manifest['size'],
+                    'stored_size': manifest['stored_size'],
+                    'config_version': index.fingerprint
+                })
+            
+            return response
         except Exception as e:
             logger.error(f"Error creating backup: {e}")
             return {'success': False, 'error': str(e)}
     
+    @staticmethod
+    def backup_routers(router_ids: List[str], max_workers: int = None) -> Dict[str, Dict]:
+        """Back up several routers in parallel, one connection per worker"""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        app = current_app._get_current_object()
+        max_workers = max_workers or app.config.get('BACKUP_INGEST_WORKERS', 16)
+        
+        def _backup(router_id: str) -> Dict:
+            with app.app_context():
+                try:
+                    service = MikroTikService(router_id)
+                except RouterBusy as e:
+                    return {'success': False, 'error': e.description}
+                try:
+                    if not service.api:
+                        return {'success': False, 'error': 'Could not connect to router'}
+                    return service.backup_configuration()
+                finally:
+                    service.disconnect()
+                    db.session.remove()
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(router_ids, executor.map(_backup, router_ids)))
+    
     def restore_configuration(self, backup_name: str) -> bool:
         """Restore router from backup"""
         try:
@@ -742,38 +1002,28 @@ class MikroTikService:
                 'health_score': 100  # Will be calculated
             }
             
-            # Calculate health score
-            issues = []
-            
-            # Check CPU
-            cpu_load = int(health['router'].get('cpu_load', '0').replace('%', ''))
-            if cpu_load > 80:
-                issues.append(f"CPU high: {cpu_load}%")
-            
-            # Check memory
-            free_mem = int(health['router'].get('memory_usage', 0))
-            total_mem = int(health['router'].get('total_memory', 1))
-            memory_usage = ((total_mem - free_mem) / total_mem) * 100
-            if memory_usage > 85:
-                issues.append(f"Memory high: {memory_usage:.1f}%")
-            
-            # Check interfaces
-            for interface in health['interfaces']:
-                if not interface['running'] and interface['type'] != 'bridge':
-                    issues.append(f"Interface down: {interface['name']}")
-            
-            # Adjust health score
-            if issues:
-                health['health_score'] = max(0, 100 - (len(issues) * 10))
-                health['issues'] = issues
-            else:
-                health['issues'] = []
+            # Score against the router's rolling baseline (read-only here;
+            # the periodic sampler is what moves the baseline)
+            scoring = self._observe_health(health['router'], health['interfaces'], update=False)
+            health['health_score'] = scoring['score']
+            health['issues'] = scoring['issues']
+            health['anomalies'] = scoring['anomalies']
             
             return health
         except Exception as e:
             logger.error(f"Error getting system health: {e}")
             return {'error': str(e)}
     
+    def _observe_health(self, router_info: Dict, interfaces: List[Dict], update: bool = True) -> Dict:
+        scorer = HealthScoringService(alpha=current_app.config['HEALTH_EWMA_ALPHA'],
+                                      warmup=current_app.config['HEALTH_WARMUP_SAMPLES'])
+        router_id = self.router.id if self.router else 'unregistered'
+        return scorer.observe(router_id, router_info, interfaces, update=update and self.router is not None)
+    
+    def sample_health(self) -> Dict:
+        """Observe current health and fold it into the router's baseline"""
+        return self._observe_health(self.get_router_info(), self.get_interface_stats())
+    
     def disconnect(self):
         """Disconnect from router"""
         try:
@@ -782,3 +1032,5 @@ class MikroTikService:
                 logger.info("Disconnected from router")
         except:
             pass
+        finally:
+            self._end_session()
@@ -0,0 +1,186 @@
+"""
+Password Hashing
+bcrypt on a bounded worker pool, with queue-depth admission control and
+transparent cost upgrades on login
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Dict, Optional
+
+from werkzeug.exceptions import ServiceUnavailable
+
+from app.startup import lazy_module
+
+logger = logging.getLogger(__name__)
+
+bcrypt = lazy_module('bcrypt')
+
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+
+
+class HashingOverloaded(ServiceUnavailable):
+    """Every hashing slot and queue place is taken; answered as 503 with Retry-After"""
+
+    description = 'Too many logins in progress, retry shortly'
+
+
+def _executor(workers: int):
+    """Native threads even under gevent, where patched threads would be greenlets
+    and a 250ms hash would stall every request on the worker's hub"""
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+            return NativeThreadPoolExecutor(max_workers=workers)
+    except ImportError:
+        pass
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+
+
+def _hashpw(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _checkpw(password: str, password_hash: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        # Malformed or non-bcrypt hash: never a match
+        return False
+
+
+def hash_rounds(password_hash: str) -> Optional[int]:
+    """Cost factor of a ``$2b$12$...`` hash, None if it is not bcrypt"""
+    parts = (password_hash or '').split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+    """Runs bcrypt off the request thread on at most ``workers`` threads
+
+    bcrypt releases the GIL, so hashes run in parallel up to the pool size
+    while the web worker keeps serving other requests. At most
+    ``max_queue`` more wait for a slot; beyond that, and when a hash does
+    not finish within ``timeout`` seconds, HashingOverloaded is raised
+    at once instead of letting a login burst pin every worker.
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = None, max_queue: int = None,
+                 timeout: float = 5.0, retry_after: int = 2):
+        self.retry_after = retry_after
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.configure(rounds, workers, max_queue, timeout)
+
+    def init_app(self, app):
+        self.configure(rounds=app.config.get('PASSWORD_BCRYPT_ROUNDS', 12),
+                       workers=app.config.get('PASSWORD_HASH_WORKERS'),
+                       max_queue=app.config.get('PASSWORD_HASH_QUEUE'),
+                       timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 5.0))
+        app.extensions['password_hasher'] = self
+
+    def configure(self, rounds: int = 12, workers: int = None, max_queue: int = None,
+                  timeout: float = 5.0):
+        if not MIN_ROUNDS <= rounds <= MAX_ROUNDS:
+            raise ValueError(f"bcrypt rounds must be between {MIN_ROUNDS} and {MAX_ROUNDS}")
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = self.workers * 4 if max_queue is None else max_queue
+        self.timeout = timeout
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def _executor(self):
+        """The pool, created lazily and again after fork (threads do not survive it)"""
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = _executor(self.workers)
+                    self._pool_pid = os.getpid()
+                    self._pending = 0
+        return self._pool
+
+    def _run(self, fn, *args):
+        pool = self._executor()
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HashingOverloaded(retry_after=self.retry_after)
+            self._pending += 1
+        try:
+            future = pool.submit(fn, *args)
+        except BaseException:
+            self._done(pool)
+            raise
+        # A slot stays taken until the hash is really finished (or cancelled
+        # before starting), not merely until this caller stops waiting
+        future.add_done_callback(lambda _: self._done(pool))
+        try:
+            result = future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.rejected += 1
+            raise HashingOverloaded(retry_after=self.retry_after)
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def _done(self, pool):
+        with self._lock:
+            # Hashes of a pool replaced by configure() or a fork are not counted
+            if pool is self._pool:
+                self._pending -= 1
+
+    # ==================== API ====================
+
+    def hash(self, password: str) -> str:
+        return self._run(_hashpw, password, self.rounds)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        if not password_hash:
+            return False
+        return self._run(_checkpw, password, password_hash)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        return hash_rounds(password_hash) != self.rounds
+
+    def upgrade(self, password: str, password_hash: str) -> Optional[str]:
+        """New hash at the current cost after a successful verify, else None
+
+        Skipped when the pool is saturated; the next login retries it.
+        """
+        if not self.needs_rehash(password_hash):
+            return None
+        try:
+            new_hash = self.hash(password)
+        except HashingOverloaded:
+            return None
+        self.rehashed += 1
+        return new_hash
+
+    def stats(self) -> Dict:
+        return {
+            'rounds': self.rounds,
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'pending': self._pending,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'rehashed': self.rehashed
+        }
+
+
+password_hasher = PasswordHasher()
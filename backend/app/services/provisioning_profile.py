@@ -0,0 +1,125 @@
+"""
+Provisioning Profile
+Opt-in per-step timing of provisioning runs and percentiles per router model and version
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.usage_service import get_redis
+
+logger = logging.getLogger(__name__)
+
+STEP_KEY = 'ispmax:provisioning:steps:{group}'
+GROUPS_KEY = 'ispmax:provisioning:steps'
+# Most recent runs kept per (model, version, step)
+SAMPLES_PER_STEP = 500
+
+
+class ProvisioningProfiler:
+    """Wall time, router round trips and bytes of each step of one run
+
+    ``api`` is the instrumented API of the service doing the work; when it
+    has no counters (or profiling is off) steps run untouched.
+    """
+
+    def __init__(self, api, enabled: bool = True):
+        self.enabled = enabled
+        self._counters = getattr(api, 'counters', None) if enabled else None
+        self.steps: Dict[str, Dict] = {}
+
+    @contextmanager
+    def step(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        before = self._counters() if self._counters else (0, 0, 0)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            after = self._counters() if self._counters else (0, 0, 0)
+            self.steps[name] = {
+                'ms': round(elapsed * 1000, 2),
+                'round_trips': after[0] - before[0],
+                'bytes_sent': after[1] - before[1],
+                'bytes_received': after[2] - before[2]
+            }
+
+    def to_dict(self) -> Dict:
+        return {
+            'steps': self.steps,
+            'total_ms': round(sum(s['ms'] for s in self.steps.values()), 2),
+            'round_trips': sum(s['round_trips'] for s in self.steps.values())
+        }
+
+    def save(self, model: Optional[str], version: Optional[str], store: 'ProvisioningProfileStore' = None):
+        """Add this run to the aggregates; never fails the provisioning itself"""
+        if not self.enabled or not self.steps:
+            return
+        try:
+            (store or ProvisioningProfileStore()).record(model, version, self.steps)
+        except Exception as e:
+            logger.warning(f"Could not store provisioning profile: {e}")
+
+
+class ProvisioningProfileStore:
+    """Capped per-step samples in Redis, summarized with NumPy on read"""
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client if redis_client is not None else get_redis()
+
+    @staticmethod
+    def _group(model: Optional[str], version: Optional[str], step: str) -> str:
+        return f"{model or 'unknown'}|{version or 'unknown'}|{step}"
+
+    def record(self, model: Optional[str], version: Optional[str], steps: Dict[str, Dict]):
+        pipe = self.redis.pipeline()
+        for name, step in steps.items():
+            group = self._group(model, version, name)
+            key = STEP_KEY.format(group=group)
+            sample = f"{step['ms']},{step['round_trips']},{step['bytes_sent'] + step['bytes_received']}"
+            pipe.lpush(key, sample)
+            pipe.ltrim(key, 0, SAMPLES_PER_STEP - 1)
+            pipe.sadd(GROUPS_KEY, group)
+        pipe.execute()
+
+    def slowest_steps(self, limit: int = 20, model: str = None, version: str = None) -> Dict:
+        """Steps ranked by p95 wall time per router model and RouterOS version"""
+        groups = sorted(g.decode('utf-8') for g in self.redis.smembers(GROUPS_KEY))
+        groups = [g for g in groups
+                  if (model is None or g.split('|')[0] == model)
+                  and (version is None or g.split('|')[1] == version)]
+        if not groups:
+            return {'groups': 0, 'items': []}
+
+        pipe = self.redis.pipeline()
+        for group in groups:
+            pipe.lrange(STEP_KEY.format(group=group), 0, -1)
+        samples = pipe.execute()
+
+        items: List[Dict] = []
+        for group, rows in zip(groups, samples):
+            if not rows:
+                continue
+            values = np.array([r.decode('utf-8').split(',') for r in rows], dtype=np.float64)
+            p50, p95, p99 = np.percentile(values[:, 0], [50, 95, 99]).tolist()
+            router_model, routeros_version, step = group.split('|', 2)
+            items.append({
+                'model': router_model,
+                'routeros_version': routeros_version,
+                'step': step,
+                'runs': len(values),
+                'p50_ms': round(p50, 2),
+                'p95_ms': round(p95, 2),
+                'p99_ms': round(p99, 2),
+                'max_ms': round(float(values[:, 0].max()), 2),
+                'mean_round_trips': round(float(values[:, 1].mean()), 1),
+                'mean_bytes': round(float(values[:, 2].mean()))
+            })
+        items.sort(key=lambda i: i['p95_ms'], reverse=True)
+        return {'groups': len(items), 'items': items[:limit]}
@@ -0,0 +1,211 @@
+"""
+Query Service
+Keyset pagination, column projections and filters shared by API list endpoints
+"""
+import base64
+import json
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+from sqlalchemy import and_, or_
+
+from app import db
+from app.models import Client, MikroTikRouter, Plan
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of the last row into an opaque cursor"""
+    raw = json.dumps([v.isoformat() if isinstance(v, (date, datetime)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def keyset_after(columns: Sequence[Any], values: Sequence[Any]):
+    """Row-value comparison (c1, c2, ...) > (v1, v2, ...) spelled out portably"""
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column > values[i]))
+    return or_(*clauses)
+
+
+def _serialize(value: Any) -> Any:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+class ListQuery:
+    """Declarative list endpoint: allowed fields, sorts and filters for one model
+
+    Rows are fetched as plain column tuples (never ORM instances), at most
+    ``MAX_PAGE_SIZE`` at a time, using keyset pagination so the cost of a
+    page does not grow with its position in the table.
+    """
+
+    def __init__(self, model, fields: Dict[str, Any], default_fields: Sequence[str],
+                 sorts: Dict[str, Sequence[Any]], filters: Dict[str, Any],
+                 joins: Sequence[Any] = ()):
+        self.model = model
+        self.fields = fields
+        self.default_fields = list(default_fields)
+        self.sorts = sorts
+        self.filters = filters
+        self.joins = joins
+
+    def page(self, args: Mapping[str, str], base_filters: Sequence[Any] = ()) -> Dict:
+        """Return one page of projected rows for request-style arguments
+
+        Supported arguments: ``fields`` (comma separated), ``sort``,
+        ``limit``, ``cursor`` and any of the declared filters.
+        """
+        field_names = self._parse_fields(args.get('fields'))
+        sort_name = args.get('sort') or next(iter(self.sorts))
+        if sort_name not in self.sorts:
+            raise ValueError(f"Unsupported sort: {sort_name}")
+        sort_columns = list(self.sorts[sort_name])
+        limit = self._parse_limit(args.get('limit'))
+
+        columns = [self.fields[name].label(name) for name in field_names]
+        sort_labels = []
+        for i, column in enumerate(sort_columns):
+            label = f'_sort{i}'
+            columns.append(column.label(label))
+            sort_labels.append(label)
+
+        query = db.session.query(*columns).select_from(self.model)
+        for target, condition in self.joins:
+            query = query.outerjoin(target, condition)
+
+        for name, column in self.filters.items():
+            value = args.get(name)
+            if value is None or value == '':
+                continue
+            values = value.split(',')
+            if column.type.python_type is bool:
+                values = [v.lower() in ('1', 'true', 'yes') for v in values]
+            query = query.filter(column.in_(values) if len(values) > 1 else column == values[0])
+
+        for condition in base_filters:
+            query = query.filter(condition)
+
+        cursor = args.get('cursor')
+        if cursor:
+            after = decode_cursor(cursor)
+            if len(after) != len(sort_columns):
+                raise ValueError('Invalid cursor')
+            query = query.filter(keyset_after(sort_columns, after))
+
+        rows = query.order_by(*sort_columns).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        items = [{name: _serialize(getattr(row, name)) for name in field_names} for row in rows]
+        next_cursor = None
+        if has_more and rows:
+            next_cursor = encode_cursor([getattr(rows[-1], label) for label in sort_labels])
+
+        return {
+            'items': items,
+            'next_cursor': next_cursor,
+            'limit': limit
+        }
+
+    def _parse_fields(self, fields: Optional[str]) -> List[str]:
+        if not fields:
+            return self.default_fields
+        names = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [n for n in names if n not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return names
+
+    @staticmethod
+    def _parse_limit(limit: Optional[str]) -> int:
+        if not limit:
+            return DEFAULT_PAGE_SIZE
+        try:
+            return max(1, min(int(limit), MAX_PAGE_SIZE))
+        except ValueError:
+            raise ValueError('Invalid limit')
+
+
+router_list = ListQuery(
+    MikroTikRouter,
+    fields={
+        'id': MikroTikRouter.id,
+        'isp_id': MikroTikRouter.isp_id,
+        'name': MikroTikRouter.name,
+        'model': MikroTikRouter.model,
+        'firmware_version': MikroTikRouter.firmware_version,
+        'ip_address': MikroTikRouter.ip_address,
+        'location': MikroTikRouter.location,
+        'latitude': MikroTikRouter.latitude,
+        'longitude': MikroTikRouter.longitude,
+        'is_active': MikroTikRouter.is_active,
+        'status': MikroTikRouter.status,
+        'last_seen': MikroTikRouter.last_seen,
+        'config_version': MikroTikRouter.config_version
+    },
+    default_fields=['id', 'name', 'ip_address', 'model', 'status', 'last_seen'],
+    sorts={
+        'id': [MikroTikRouter.id],
+        'name': [MikroTikRouter.name, MikroTikRouter.id]
+    },
+    filters={
+        'isp_id': MikroTikRouter.isp_id,
+        'status': MikroTikRouter.status,
+        'is_active': MikroTikRouter.is_active
+    }
+)
+
+client_list = ListQuery(
+    Client,
+    fields={
+        'id': Client.id,
+        'isp_id': Client.isp_id,
+        'full_name': Client.full_name,
+        'email': Client.email,
+        'phone': Client.phone,
+        'status': Client.status,
+        'plan_id': Client.plan_id,
+        'plan': Plan.name,
+        'connection_type': Client.connection_type,
+        'ip_address': Client.ip_address,
+        'mac_address': Client.mac_address,
+        'pppoe_username': Client.pppoe_username,
+        'billing_day': Client.billing_day,
+        'balance': Client.balance,
+        'latitude': Client.latitude,
+        'longitude': Client.longitude
+    },
+    default_fields=['id', 'full_name', 'email', 'phone', 'status', 'plan', 'ip_address', 'balance'],
+    sorts={
+        'id': [Client.id],
+        'full_name': [Client.full_name, Client.id]
+    },
+    filters={
+        'isp_id': Client.isp_id,
+        'status': Client.status,
+        'plan_id': Client.plan_id,
+        'connection_type': Client.connection_type
+    },
+    joins=[(Plan, Plan.id == Client.plan_id)]
+)
@@ -0,0 +1,246 @@
+"""
+Rate Limits
+Per-tenant token buckets kept in process and reconciled through Redis in batches
+"""
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from flask import current_app, request
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+from werkzeug.exceptions import TooManyRequests
+
+from app.services.metadata_cache import metadata_cache
+from app.services.usage_service import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Consumption of one tenant and route class in one window, summed over all workers
+COUNTER_KEY = 'ispmax:ratelimit:{route_class}:{tenant}:{window}'
+
+DEFAULT_CLASS = 'default'
+# Endpoints that open a RouterOS session; a tenant's router budget is kept
+# separate so polling dashboards cannot crowd out writes to its routers
+ROUTER_CLASS = 'router'
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_LIMIT_RE = re.compile(r'^\s*(\d+)\s*(?:per|/)\s*(second|minute|hour|day)s?\s*$')
+
+
+def parse_limit(limit: str) -> Tuple[int, int]:
+    """``'200 per minute'`` or ``'200/minute'`` as (requests, period seconds)"""
+    match = _LIMIT_RE.match(limit or '')
+    if not match:
+        raise ValueError(f"Invalid rate limit: {limit!r}")
+    return int(match.group(1)), _PERIODS[match.group(2)]
+
+
+def route_class(name: Optional[str]):
+    """Put a view in a rate limit class; ``None`` exempts it"""
+    def decorator(view):
+        view.rate_limit_class = name
+        return view
+    return decorator
+
+
+class _Bucket:
+    """Local token bucket plus this process's view of the shared window"""
+
+    __slots__ = ('tokens', 'stamp', 'window', 'cluster_used', 'spent', 'syncing', 'touched')
+
+    def __init__(self, capacity: int, now: float, window: int):
+        self.tokens = float(capacity)
+        self.stamp = now
+        self.window = window
+        self.cluster_used = 0   # window total in Redis as of the last sync
+        self.spent = 0          # admitted here since the last sync
+        self.syncing = 0        # admitted here, being added to Redis right now
+        self.touched = now
+
+
+class TenantRateLimiter:
+    """Token buckets keyed by (route class, tenant)
+
+    Admission is decided in process, under one lock, from a token bucket
+    (burst control) and the tenant's fixed-window total across all workers
+    as last seen in Redis. A background thread adds each bucket's local
+    consumption to its Redis counter every ``sync_interval`` seconds in one
+    pipeline and reads the totals back, so the cluster converges on the
+    budget with at most one interval of overshoot and no request waits on
+    Redis. If Redis is unreachable, buckets keep enforcing locally.
+    """
+
+    def __init__(self, budgets: Dict[str, str] = None, sync_interval: float = 1.0,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.sync_interval = sync_interval
+        self.budgets = {name: parse_limit(limit) for name, limit in (budgets or {}).items()}
+        self.tenant_domain = None
+        self.redis = None
+        self._buckets: Dict[Tuple[str, str], _Bucket] = {}
+        self._lock = threading.Lock()
+        self._sync_pid = None
+        self._sync_lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+        self.sync_errors = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        self.sync_interval = app.config.get('RATELIMIT_SYNC_INTERVAL', 1.0)
+        self.budgets = {name: parse_limit(limit)
+                        for name, limit in app.config.get('RATELIMIT_BUDGETS', {}).items()}
+        if DEFAULT_CLASS not in self.budgets:
+            raise ValueError(f"RATELIMIT_BUDGETS needs a '{DEFAULT_CLASS}' budget")
+        self.tenant_domain = app.config.get('RATELIMIT_TENANT_DOMAIN')
+        app.before_request(self._before_request)
+        app.extensions['rate_limiter'] = self
+
+    # ==================== REQUEST HOOK ====================
+
+    def _before_request(self):
+        if not self.enabled or request.endpoint is None:
+            return None
+        view = current_app.view_functions.get(request.endpoint)
+        name = getattr(view, 'rate_limit_class', DEFAULT_CLASS)
+        if name is None or request.method == 'OPTIONS':
+            return None
+        retry_after = self.hit(name if name in self.budgets else DEFAULT_CLASS, self.tenant())
+        if retry_after is not None:
+            raise TooManyRequests(retry_after=max(1, int(retry_after + 0.999)))
+        return None
+
+    def tenant(self) -> str:
+        """ISP of the request: tenant subdomain, token claim or user, else client address"""
+        if self.tenant_domain:
+            host = request.host.split(':', 1)[0]
+            suffix = '.' + self.tenant_domain
+            if host.endswith(suffix) and host != suffix[1:]:
+                return 'subdomain:' + host[:-len(suffix)]
+        try:
+            if verify_jwt_in_request(optional=True):
+                isp_id = get_jwt().get('isp_id')
+                if isp_id:
+                    return 'isp:' + isp_id
+                identity = str(get_jwt_identity())
+                user = metadata_cache.get_user(identity)
+                if user is not None and user.isp_id:
+                    return 'isp:' + user.isp_id
+                return 'user:' + identity
+        except Exception:
+            # Invalid or expired tokens are rejected by the view itself
+            pass
+        return 'ip:' + (request.remote_addr or 'unknown')
+
+    # ==================== BUCKETS ====================
+
+    def hit(self, name: str, tenant: str) -> Optional[float]:
+        """Take one token; None if admitted, else seconds until one is available"""
+        limit, period = self.budgets[name]
+        rate = limit / period
+        now = time.monotonic()
+        window = int(time.time() // period)
+        self._ensure_sync()
+        with self._lock:
+            bucket = self._buckets.get((name, tenant))
+            if bucket is None:
+                bucket = self._buckets[(name, tenant)] = _Bucket(limit, now, window)
+            elif bucket.window != window:
+                # New window; consumption not yet synced belonged to the old one
+                bucket.window = window
+                bucket.cluster_used = bucket.spent = bucket.syncing = 0
+            bucket.tokens = min(limit, bucket.tokens + (now - bucket.stamp) * rate)
+            bucket.stamp = now
+            bucket.touched = now
+            if bucket.cluster_used + bucket.syncing + bucket.spent >= limit:
+                self.limited += 1
+                return (window + 1) * period - time.time()
+            if bucket.tokens < 1:
+                self.limited += 1
+                return (1 - bucket.tokens) / rate
+            bucket.tokens -= 1
+            bucket.spent += 1
+            self.allowed += 1
+            return None
+
+    # ==================== SYNC ====================
+
+    def _ensure_sync(self):
+        """Start the sync thread once per process (again after fork)"""
+        if self._sync_pid == os.getpid():
+            return
+        with self._sync_lock:
+            if self._sync_pid == os.getpid():
+                return
+            self._sync_pid = os.getpid()
+            with self._lock:
+                self._buckets = {}
+            thread = threading.Thread(target=self._sync_loop, name='rate-limit-sync', daemon=True)
+            thread.start()
+
+    def _sync_loop(self):
+        pid = os.getpid()
+        while self._sync_pid == pid:
+            time.sleep(self.sync_interval)
+            self.sync()
+
+    def sync(self):
+        """Add local consumption to the shared counters and read the totals back"""
+        now = time.monotonic()
+        with self._lock:
+            batch = []
+            for key, bucket in list(self._buckets.items()):
+                period = self.budgets[key[0]][1]
+                idle = now - bucket.touched
+                if idle > 2 * period:
+                    del self._buckets[key]
+                    continue
+                if idle > period and not bucket.spent:
+                    # Its window is over; the next hit starts from zero anyway
+                    continue
+                bucket.syncing, bucket.spent = bucket.spent, 0
+                batch.append((key, bucket, bucket.window, bucket.syncing, period))
+        if not batch:
+            return
+
+        totals = None
+        try:
+            pipe = self._redis().pipeline(transaction=False)
+            for (name, tenant), _, window, count, period in batch:
+                counter = COUNTER_KEY.format(route_class=name, tenant=tenant, window=window)
+                # INCRBY 0 still returns what the other workers have used
+                pipe.incrby(counter, count)
+                pipe.expire(counter, period * 2)
+            totals = pipe.execute()[::2]
+        except Exception as e:
+            self.sync_errors += 1
+            logger.warning(f"Could not sync rate limit counters, enforcing locally: {e}")
+
+        with self._lock:
+            for i, (_, bucket, window, count, _) in enumerate(batch):
+                if bucket.window != window:
+                    continue
+                if totals is not None:
+                    bucket.cluster_used = int(totals[i])
+                else:
+                    bucket.cluster_used += count
+                bucket.syncing = 0
+
+    def _redis(self):
+        return self.redis if self.redis is not None else get_redis()
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'budgets': {name: f"{limit}/{period}s" for name, (limit, period) in self.budgets.items()},
+            'buckets': len(self._buckets),
+            'allowed': self.allowed,
+            'limited': self.limited,
+            'sync_errors': self.sync_errors
+        }
+
+
+rate_limiter = TenantRateLimiter()
@@ -0,0 +1,277 @@
+"""
+Response Snapshots
+Versioned, precompressed API responses in Redis for conditional GET on polled endpoints
+"""
+import logging
+import time
+import zlib
+from typing import Callable, Iterable, List, Optional
+
+from flask import Response, request, stream_with_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.http import http_date
+
+from app.models import MikroTikRouter
+from app.services.usage_service import get_redis
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is offered instead
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = 'ispmax:http:snapshot:{scope}:{variant}'
+# Snapshot keys of one scope, so a write can drop every variant of it
+SCOPE_KEY = 'ispmax:http:scope:{scope}'
+
+ROUTERS_SCOPE = 'routers'
+ROUTER_SCOPES = ('router:{router_id}:health', 'router:{router_id}:queues', 'router:{router_id}:connections')
+
+
+def negotiate_encoding() -> str:
+    """Best content coding the client accepts: br, gzip or identity"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return 'identity'
+
+
+class _Compressor:
+    """Incremental gzip or brotli encoder with a common interface"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=min(level, 11))
+        elif encoding == 'gzip':
+            self._zlib = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == 'br':
+            return self._brotli.process(data)
+        if self.encoding == 'gzip':
+            return self._zlib.compress(data)
+        return data
+
+    def flush(self) -> bytes:
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        if self.encoding == 'gzip':
+            return self._zlib.flush()
+        return b''
+
+
+class ResponseSnapshots:
+    """Encoded response bodies shared by all workers for ``ttl`` seconds
+
+    A snapshot's version is the millisecond timestamp at which it was
+    built; it is both the ETag and the Last-Modified date, so validating
+    a poll needs one Redis read and no body hashing or serialization.
+    Bodies are stored already compressed for the negotiated encoding.
+    """
+
+    def __init__(self, ttl: float = 10.0, min_compress_bytes: int = 1024, compress_level: int = 5,
+                 max_bytes: int = 8 * 1024 * 1024):
+        self.ttl = ttl
+        self.min_compress_bytes = min_compress_bytes
+        self.compress_level = compress_level
+        self.max_bytes = max_bytes
+        self.redis = None
+
+    def init_app(self, app):
+        self.ttl = app.config.get('HTTP_SNAPSHOT_TTL', 10)
+        self.min_compress_bytes = app.config.get('HTTP_COMPRESS_MIN_BYTES', 1024)
+        self.compress_level = app.config.get('HTTP_COMPRESS_LEVEL', 5)
+        self.max_bytes = app.config.get('HTTP_SNAPSHOT_MAX_BYTES', 8 * 1024 * 1024)
+        if not event.contains(Session, 'after_flush', _collect_invalidations):
+            event.listen(Session, 'after_flush', _collect_invalidations)
+            event.listen(Session, 'after_commit', _publish_invalidations)
+            event.listen(Session, 'after_rollback', _discard_invalidations)
+        app.extensions['response_snapshots'] = self
+
+    def _redis(self):
+        return self.redis if self.redis is not None else get_redis()
+
+    @staticmethod
+    def _key(scope: str, encoding: str) -> str:
+        variant = f"{encoding}:{request.query_string.decode('utf-8', 'replace')}"
+        return SNAPSHOT_KEY.format(scope=scope, variant=variant)
+
+    # ==================== READ ====================
+
+    def cached(self, scope: str) -> Optional[Response]:
+        """A 304 or the stored body when this request has a fresh snapshot, else None"""
+        if not self.ttl:
+            return None
+        key = self._key(scope, negotiate_encoding())
+        try:
+            client = self._redis()
+            version, encoding = client.hmget(key, 'version', 'encoding')
+            if version is None:
+                return None
+            version = int(version)
+            if time.time() * 1000 - version >= self.ttl * 1000:
+                return None
+            encoding = encoding.decode('utf-8')
+            if self._not_modified(version, encoding):
+                return self._headers(Response(status=304), version, encoding)
+            body = client.hget(key, 'body')
+        except Exception as e:
+            logger.warning(f"Could not read response snapshot {scope}: {e}")
+            return None
+        if body is None:
+            return None
+        response = Response(body, status=200, mimetype='application/json')
+        return self._headers(response, version, encoding)
+
+    @staticmethod
+    def _etag(version: int, encoding: str) -> str:
+        return f'{version}-{encoding}'
+
+    def _not_modified(self, version: int, encoding: str) -> bool:
+        if request.if_none_match:
+            return request.if_none_match.contains(self._etag(version, encoding))
+        if request.if_modified_since:
+            return version // 1000 <= request.if_modified_since.timestamp()
+        return False
+
+    def _headers(self, response: Response, version: int, encoding: str) -> Response:
+        response.set_etag(self._etag(version, encoding))
+        response.headers['Last-Modified'] = http_date(version / 1000)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Accept-Encoding')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    # ==================== WRITE ====================
+
+    def respond(self, scope: str, chunks: Iterable[bytes],
+                cacheable: Callable[[], bool] = lambda: True) -> Response:
+        """Send ``chunks`` as a versioned (and, above the threshold, compressed) response
+
+        The body streams to the client while its encoded form is kept;
+        once complete, and if ``cacheable()`` still holds, it becomes the
+        scope's snapshot for this query string and encoding.
+        """
+        negotiated = negotiate_encoding()
+        key = self._key(scope, negotiated)
+        version = int(time.time() * 1000)
+        iterator = iter(chunks)
+
+        # Content-Encoding has to be chosen before the first byte is sent
+        head: List[bytes] = []
+        size = 0
+        exhausted = False
+        try:
+            while size < self.min_compress_bytes:
+                chunk = next(iterator, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                head.append(chunk)
+                size += len(chunk)
+        except Exception:
+            close = getattr(iterator, 'close', None)
+            if close:
+                close()
+            raise
+        encoding = negotiated if size >= self.min_compress_bytes else 'identity'
+
+        if exhausted:
+            compressor = _Compressor(encoding, self.compress_level)
+            body = b''.join(compressor.compress(chunk) for chunk in head) + compressor.flush()
+            if self.ttl and len(body) <= self.max_bytes and cacheable():
+                self._store(scope, key, version, encoding, body)
+            response = Response(body, status=200, mimetype='application/json')
+            return self._headers(response, version, encoding)
+
+        def generate():
+            compressor = _Compressor(encoding, self.compress_level)
+            stored: Optional[List[bytes]] = [] if self.ttl else None
+            stored_size = 0
+            try:
+                for chunk in _chain(head, iterator):
+                    data = compressor.compress(chunk)
+                    if not data:
+                        continue
+                    if stored is not None:
+                        stored.append(data)
+                        stored_size += len(data)
+                        if stored_size > self.max_bytes:
+                            stored = None
+                    yield data
+                data = compressor.flush()
+                if stored is not None:
+                    stored.append(data)
+                if data:
+                    yield data
+                if stored is not None and cacheable():
+                    self._store(scope, key, version, encoding, b''.join(stored))
+            finally:
+                close = getattr(iterator, 'close', None)
+                if close:
+                    close()
+
+        response = Response(stream_with_context(generate()), status=200, mimetype='application/json')
+        # Let reverse proxies pass chunks through instead of buffering the body
+        response.headers['X-Accel-Buffering'] = 'no'
+        return self._headers(response, version, encoding)
+
+    def _store(self, scope: str, key: str, version: int, encoding: str, body: bytes):
+        try:
+            expires = max(1, int(self.ttl * 2))
+            scope_key = SCOPE_KEY.format(scope=scope)
+            pipe = self._redis().pipeline()
+            pipe.hset(key, mapping={'version': version, 'encoding': encoding, 'body': body})
+            pipe.expire(key, expires)
+            pipe.sadd(scope_key, key)
+            pipe.expire(scope_key, expires)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not store response snapshot {scope}: {e}")
+
+    # ==================== INVALIDATION ====================
+
+    def invalidate(self, *scopes: str):
+        """Drop every variant of the given scopes, e.g. after a write"""
+        try:
+            client = self._redis()
+            for scope in scopes:
+                scope_key = SCOPE_KEY.format(scope=scope)
+                keys = [k.decode('utf-8') for k in client.smembers(scope_key)]
+                client.delete(scope_key, *keys)
+        except Exception as e:
+            # Snapshots still expire after ttl
+            logger.warning(f"Could not invalidate response snapshots {scopes}: {e}")
+
+    def invalidate_router(self, router_id: str):
+        self.invalidate(*(scope.format(router_id=router_id) for scope in ROUTER_SCOPES))
+
+
+response_snapshots = ResponseSnapshots()
+
+
+def _chain(head: List[bytes], rest):
+    yield from head
+    yield from rest
+
+
+def _collect_invalidations(session, flush_context):
+    for objs in (session.new, session.dirty, session.deleted):
+        if any(isinstance(obj, MikroTikRouter) for obj in objs):
+            session.info['response_snapshots_routers'] = True
+            return
+
+
+def _publish_invalidations(session):
+    if session.info.pop('response_snapshots_routers', None):
+        response_snapshots.invalidate(ROUTERS_SCOPE)
+
+
+def _discard_invalidations(session):
+    session.info.pop('response_snapshots_routers', None)
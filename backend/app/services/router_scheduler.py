@@ -0,0 +1,298 @@
+"""
+Router Scheduler
+Per-router caps on RouterOS sessions and in-flight commands, with writes
+served before reads and waiting sessions queued fairly across ISPs
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from flask import g, has_request_context
+from prometheus_client import Counter, Histogram
+from werkzeug.exceptions import ServiceUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Priorities, most urgent first
+WRITE = 0
+READ = 1
+PRIORITY_NAMES = ('write', 'read')
+
+# Verbs that only read router state; anything else is scheduled as a write
+READ_VERBS = frozenset(('print', 'getall', 'listen', 'monitor', 'monitor-traffic', 'ping'))
+
+WAIT_SECONDS = Histogram(
+    'routeros_scheduler_wait_seconds', 'Time queued for a RouterOS session or command slot',
+    ['gate', 'priority'], buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+ROUTER_WAIT_SECONDS = Counter(
+    'routeros_router_wait_seconds_total', 'Time queued for RouterOS slots per router', ['router']
+)
+ROUTER_BUSY = Counter(
+    'routeros_router_busy_total', 'Requests turned away after queueing too long per router', ['router']
+)
+
+
+class RouterBusy(ServiceUnavailable):
+    """A router's queue did not free up within the scheduler timeout"""
+
+    def __init__(self, router_id: str, retry_after: int = 5):
+        super().__init__(f"Router {router_id} is busy, retry shortly", retry_after=retry_after)
+        self.router_id = router_id
+
+
+class _Waiter:
+    __slots__ = ('event', 'granted', 'priority', 'tenant')
+
+    def __init__(self, priority: int, tenant: str):
+        self.event = threading.Event()
+        self.granted = False
+        self.priority = priority
+        self.tenant = tenant
+
+
+class FairGate:
+    """Counting semaphore that hands freed slots to waiters in order
+
+    Waiters of a more urgent priority always go first; within a priority,
+    tenants take turns (one grant each, round robin) and each tenant's own
+    waiters are FIFO. A freed slot passes straight to the chosen waiter, so
+    nothing arriving later can overtake the queue.
+    """
+
+    def __init__(self, capacity: int, lock: threading.Lock):
+        self.capacity = capacity
+        self.active = 0
+        self._lock = lock
+        self._queues: List['OrderedDict[str, deque]'] = [OrderedDict() for _ in PRIORITY_NAMES]
+
+    def acquire(self, priority: int, tenant: str, timeout: Optional[float]) -> bool:
+        with self._lock:
+            if self.active < self.capacity and not self.depth():
+                self.active += 1
+                return True
+            waiter = _Waiter(priority, tenant)
+            self._queues[priority].setdefault(tenant, deque()).append(waiter)
+        waiter.event.wait(timeout)
+        with self._lock:
+            if waiter.granted:
+                return True
+            queue = self._queues[priority][tenant]
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[priority][tenant]
+            return False
+
+    def release(self):
+        with self._lock:
+            for queues in self._queues:
+                if queues:
+                    tenant, queue = next(iter(queues.items()))
+                    waiter = queue.popleft()
+                    if queue:
+                        queues.move_to_end(tenant)
+                    else:
+                        del queues[tenant]
+                    waiter.granted = True
+                    waiter.event.set()
+                    return
+            self.active -= 1
+
+    def depth(self, priority: int = None) -> int:
+        queues = self._queues if priority is None else [self._queues[priority]]
+        return sum(len(q) for tenants in queues for q in tenants.values())
+
+
+class _RouterState:
+    """Gates and wait statistics of one router"""
+
+    def __init__(self, sessions: int, commands: int, lock: threading.Lock):
+        self.sessions = FairGate(sessions, lock)
+        self.commands = FairGate(commands, lock)
+        # per priority: waits, total seconds, max seconds
+        self.waits = [[0, 0.0, 0.0] for _ in PRIORITY_NAMES]
+        self.busy = 0
+
+    def record_wait(self, priority: int, seconds: float):
+        entry = self.waits[priority]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+
+
+class SessionGrant:
+    """A held session slot; released once by disconnect, request teardown or GC"""
+
+    __slots__ = ('_scheduler', 'router_id', '_released', '__weakref__')
+
+    def __init__(self, scheduler: 'RouterScheduler', router_id: str):
+        self._scheduler = scheduler
+        self.router_id = router_id
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._scheduler._release_session(self.router_id)
+
+
+class RouterScheduler:
+    """Admission control in front of every RouterOS session and command
+
+    A router accepts at most ``router_sessions`` concurrent sessions and
+    ``router_commands`` commands in flight across them; the process holds
+    at most ``max_sessions`` sessions over all routers, shared round robin
+    between ISPs so one large tenant cannot occupy every slot. Caps apply
+    per process (web or Celery worker). Writes (suspend, activate, speed
+    changes, provisioning) are served before queued stats reads; a caller
+    still waiting after ``timeout`` seconds gets RouterBusy (503).
+    """
+
+    def __init__(self, router_sessions: int = 2, router_commands: int = 2,
+                 max_sessions: int = 64, timeout: float = 10.0):
+        self.router_sessions = router_sessions
+        self.router_commands = router_commands
+        self.timeout = timeout
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._routers: Dict[str, _RouterState] = {}
+        self._global = FairGate(max_sessions, self._lock)
+
+    def init_app(self, app):
+        self.router_sessions = app.config.get('MIKROTIK_ROUTER_SESSIONS', 2)
+        self.router_commands = app.config.get('MIKROTIK_ROUTER_COMMANDS', 2)
+        self.timeout = app.config.get('MIKROTIK_QUEUE_TIMEOUT', 10.0)
+        self.enabled = app.config.get('MIKROTIK_SCHEDULER_ENABLED', True)
+        with self._lock:
+            self._routers = {}
+            self._global = FairGate(app.config.get('MIKROTIK_MAX_SESSIONS', 64), self._lock)
+        app.teardown_request(_release_request_sessions)
+        app.extensions['router_scheduler'] = self
+
+    def _state(self, router_id: str) -> _RouterState:
+        state = self._routers.get(router_id)
+        if state is None:
+            with self._lock:
+                state = self._routers.get(router_id)
+                if state is None:
+                    state = self._routers[router_id] = _RouterState(
+                        self.router_sessions, self.router_commands, self._lock)
+        return state
+
+    # ==================== SESSIONS ====================
+
+    def session(self, router_id: str, tenant: str = None, priority: int = READ) -> Optional[SessionGrant]:
+        """Wait for a session slot on ``router_id``; RouterBusy on timeout"""
+        if not self.enabled:
+            return None
+        router_id = str(router_id)
+        tenant = tenant or router_id
+        state = self._state(router_id)
+        started = time.monotonic()
+        if not state.sessions.acquire(priority, tenant, self.timeout):
+            self._busy(state, router_id, priority, started, 'session')
+        remaining = None if self.timeout is None else max(0.0, self.timeout - (time.monotonic() - started))
+        if not self._global.acquire(priority, tenant, remaining):
+            state.sessions.release()
+            self._busy(state, router_id, priority, started, 'session')
+        self._waited(state, router_id, priority, started, 'session')
+        return SessionGrant(self, router_id)
+
+    def _release_session(self, router_id: str):
+        self._global.release()
+        self._state(router_id).sessions.release()
+
+    # ==================== COMMANDS ====================
+
+    @contextmanager
+    def command(self, router_id: str, verb: str) -> Iterator[None]:
+        """Hold one of the router's in-flight command slots"""
+        if not self.enabled:
+            yield
+            return
+        router_id = str(router_id)
+        priority = READ if verb in READ_VERBS else WRITE
+        state = self._state(router_id)
+        started = time.monotonic()
+        if not state.commands.acquire(priority, router_id, self.timeout):
+            self._busy(state, router_id, priority, started, 'command')
+        self._waited(state, router_id, priority, started, 'command')
+        try:
+            yield
+        finally:
+            state.commands.release()
+
+    def _waited(self, state: _RouterState, router_id: str, priority: int, started: float, gate: str):
+        seconds = time.monotonic() - started
+        with self._lock:
+            state.record_wait(priority, seconds)
+        try:
+            WAIT_SECONDS.labels(gate, PRIORITY_NAMES[priority]).observe(seconds)
+            if seconds:
+                ROUTER_WAIT_SECONDS.labels(router_id).inc(seconds)
+        except Exception as e:
+            logger.warning(f"Could not record scheduler metrics: {e}")
+
+    def _busy(self, state: _RouterState, router_id: str, priority: int, started: float, gate: str):
+        self._waited(state, router_id, priority, started, gate)
+        with self._lock:
+            state.busy += 1
+        ROUTER_BUSY.labels(router_id).inc()
+        logger.warning(f"Router {router_id} busy: no {gate} slot after {self.timeout}s "
+                       f"({PRIORITY_NAMES[priority]})")
+        raise RouterBusy(router_id)
+
+    # ==================== STATS ====================
+
+    def stats(self, router_id: str = None) -> Dict:
+        with self._lock:
+            items = [(rid, s) for rid, s in self._routers.items() if router_id is None or rid == router_id]
+            routers = []
+            for rid, state in items:
+                waits = {}
+                for priority, (count, total, slowest) in enumerate(state.waits):
+                    waits[PRIORITY_NAMES[priority]] = {
+                        'waits': count,
+                        'mean_wait_ms': round(total / count * 1000, 2) if count else 0.0,
+                        'max_wait_ms': round(slowest * 1000, 2)
+                    }
+                routers.append({
+                    'router': rid,
+                    'sessions': state.sessions.active,
+                    'commands_in_flight': state.commands.active,
+                    'queued': {name: state.sessions.depth(p) + state.commands.depth(p)
+                               for p, name in enumerate(PRIORITY_NAMES)},
+                    'busy': state.busy,
+                    'wait': waits
+                })
+            overall = {
+                'sessions': self._global.active,
+                'max_sessions': self._global.capacity,
+                'queued': self._global.depth()
+            }
+        routers.sort(key=lambda r: (sum(r['queued'].values()), r['sessions']), reverse=True)
+        return {
+            'router_sessions': self.router_sessions,
+            'router_commands': self.router_commands,
+            'timeout': self.timeout,
+            'global': overall,
+            'routers': routers
+        }
+
+
+router_scheduler = RouterScheduler()
+
+
+def track_request_session(service):
+    """Disconnect ``service`` when the current request ends, if it is still open"""
+    if has_request_context():
+        g.setdefault('router_sessions', []).append(service)
+
+
+def _release_request_sessions(exc=None):
+    for service in g.pop('router_sessions', ()):
+        service.disconnect()
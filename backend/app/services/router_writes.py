@@ -0,0 +1,315 @@
+"""
+Router Writes
+Short-window coalescing of per-client router mutations, flushed as one
+batch per router
+"""
+import logging
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Set
+
+from app.models import Client
+from app.services.metadata_cache import metadata_cache
+from app.services.mikrotik_service import MikroTikService
+from app.services.response_snapshots import response_snapshots
+from app.services.router_scheduler import WRITE, RouterBusy
+from app.services.usage_service import get_redis
+
+logger = logging.getLogger(__name__)
+
+# client_id:aspect -> value, per router; rewriting a field is the collapse.
+# No TTL: a change leaves the buffer only once it has been applied.
+PENDING_KEY = 'ispmax:router-writes:{router_id}'
+# Set while a flush of the router is scheduled, so a window schedules one
+SCHEDULED_KEY = 'ispmax:router-writes:{router_id}:scheduled'
+SCHEDULED_SUFFIX = ':scheduled'
+# The batch a flush is applying; deleted once its outcome is buffered back,
+# so a flush that dies midway leaves it for the next one
+PROCESSING_KEY = 'ispmax:router-writes:{router_id}:processing'
+PROCESSING_SUFFIX = ':processing'
+# Held while a flush of the router runs; expires should the worker die
+FLUSHING_KEY = 'ispmax:router-writes:{router_id}:flushing'
+FLUSHING_SUFFIX = ':flushing'
+FLUSH_LEASE = 300
+
+ASPECTS = ('status', 'plan', 'provision')
+# Flushes a client's change is retried in right away; after that it waits
+# in the buffer for the periodic reconcile
+MAX_ATTEMPTS = 3
+# Move the pending buffer into the processing hash and return the batch.
+# A batch left there by a dead flush is merged, newer fields winning.
+# KEYS: pending, processing.
+TAKE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+else
+    local fields = redis.call('HGETALL', KEYS[1])
+    for i = 1, #fields - 1, 2 do
+        redis.call('HSET', KEYS[2], fields[i], fields[i + 1])
+    end
+    redis.call('DEL', KEYS[1])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+# Drop the flush lease only if this flush still holds it. KEYS: lease;
+# ARGV: token.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class ClientWriteCoalescer:
+    """Buffers which parts of a client's router state are stale
+
+    Callers commit the desired state (status, plan) to the database and
+    record here only *what* changed; the flush reads clients as they are
+    then, so any sequence of activate / suspend / speed change / re-provision
+    within the window collapses to the final state. The first change to a
+    router in a window schedules one flush task ``window`` seconds later,
+    which applies every buffered client over a single router session.
+    Changes are never dropped: whatever a flush could not apply, or could
+    not be scheduled for, stays buffered until ``reconcile`` retries it.
+    """
+
+    def __init__(self, window: float = 2.0):
+        self.window = window
+        self.redis = None
+
+    def init_app(self, app):
+        self.window = app.config.get('ROUTER_WRITE_WINDOW', 2.0)
+        app.extensions['router_writes'] = self
+
+    def _redis(self):
+        return self.redis if self.redis is not None else get_redis()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.window)
+
+    # ==================== BUFFER ====================
+
+    def enqueue(self, router_id: str, client_id: str, status: bool = False, plan: bool = False,
+                provision: bool = False, reason: str = None) -> bool:
+        """Mark a client's router state stale; False if it must be applied directly
+
+        Returns False when coalescing is disabled, Redis is unreachable or
+        the flush cannot be scheduled; the caller then applies the change
+        directly (a later flush re-applying the client's state is harmless).
+        """
+        if not self.enabled:
+            return False
+        fields = {}
+        if status:
+            fields[f'{client_id}:status'] = reason or ''
+        if plan:
+            fields[f'{client_id}:plan'] = '1'
+        if provision:
+            fields[f'{client_id}:provision'] = '1'
+        if not fields:
+            return True
+        return self._buffer(router_id, fields)
+
+    def _buffer(self, router_id: str, fields: Dict[str, str]) -> bool:
+        try:
+            scheduled = self._store(router_id, fields)
+        except Exception as e:
+            logger.warning(f"Could not buffer router writes for {router_id}: {e}")
+            return False
+        return not scheduled or self._schedule(router_id)
+
+    def _store(self, router_id: str, fields: Dict[str, str], schedule: bool = True) -> bool:
+        """Add fields to the buffer; True if this call must schedule the flush"""
+        pipe = self._redis().pipeline()
+        pipe.hset(PENDING_KEY.format(router_id=router_id), mapping=fields)
+        if schedule:
+            pipe.set(SCHEDULED_KEY.format(router_id=router_id), int(time.time()),
+                     nx=True, ex=int(self.window * 10) + 10)
+        results = pipe.execute()
+        return bool(schedule and results[-1])
+
+    def _schedule(self, router_id: str) -> bool:
+        from app.tasks import flush_router_writes
+        try:
+            flush_router_writes.apply_async((router_id,), countdown=self.window)
+            return True
+        except Exception as e:
+            logger.error(f"Could not schedule router write flush for {router_id}: {e}")
+            # Let the next write schedule again; what is buffered now
+            # (including changes that counted on this flush) is left to
+            # reconcile
+            try:
+                self._redis().delete(SCHEDULED_KEY.format(router_id=router_id))
+            except Exception:
+                pass
+            return False
+
+    def take(self, router_id: str) -> Dict[str, Dict[str, str]]:
+        """Move the router's buffer to processing and return it as
+        client_id -> {aspect: value}
+
+        The batch stays in the processing hash until ``done``; call this
+        holding the router's flush lease.
+        """
+        client = self._redis()
+        # Clear the marker first: a write landing in between schedules a
+        # new flush, which at worst finds an empty buffer
+        client.delete(SCHEDULED_KEY.format(router_id=router_id))
+        fields = client.register_script(TAKE_SCRIPT)(keys=[
+            PENDING_KEY.format(router_id=router_id),
+            PROCESSING_KEY.format(router_id=router_id)
+        ])
+
+        pending: Dict[str, Dict[str, str]] = defaultdict(dict)
+        for field, value in zip(fields[::2], fields[1::2]):
+            client_id, aspect = _decode(field).rsplit(':', 1)
+            pending[client_id][aspect] = _decode(value)
+        return dict(pending)
+
+    def done(self, router_id: str):
+        """Forget the batch being processed, its outcome buffered back"""
+        self._redis().delete(PROCESSING_KEY.format(router_id=router_id))
+
+    # ==================== FLUSH ====================
+
+    def flush(self, router_id: str, service=None) -> Dict:
+        """Apply the router's buffered changes in one batch
+
+        Clients that could not be applied, or all of them if applying
+        raises, are buffered again for the next window. One flush runs per
+        router at a time; a flush finding another one running reschedules
+        itself. ``service`` is a connected MikroTikService (one is opened
+        with write priority otherwise).
+        """
+        client = self._redis()
+        lease_key = FLUSHING_KEY.format(router_id=router_id)
+        token = uuid.uuid4().hex
+        if not client.set(lease_key, token, nx=True, ex=FLUSH_LEASE):
+            self._schedule(router_id)
+            return {'router_id': router_id, 'clients': 0, 'busy': True}
+        try:
+            pending = self.take(router_id)
+            if not pending:
+                return {'router_id': router_id, 'clients': 0}
+            try:
+                result = self._apply(router_id, pending, service)
+            except Exception:
+                self._requeue(router_id, pending)
+                self.done(router_id)
+                raise
+            self.done(router_id)
+            return result
+        finally:
+            client.register_script(RELEASE_SCRIPT)(keys=[lease_key], args=[token])
+
+    def _apply(self, router_id: str, pending: Dict[str, Dict[str, str]], service) -> Dict:
+        clients = Client.query.filter(Client.id.in_(list(pending))).all()
+        changes = []
+        reasons = {}
+        for client in clients:
+            aspects: Set[str] = set(pending[client.id]) & set(ASPECTS)
+            if 'provision' in aspects:
+                aspects.discard('plan')
+            plan = metadata_cache.get_plan(client.plan_id) if client.plan_id else None
+            changes.append((client, plan, aspects))
+            if pending[client.id].get('status'):
+                reasons[client.id] = pending[client.id]['status']
+
+        failed = []
+        if changes:
+            own_service = service is None
+            if own_service:
+                service = MikroTikService(priority=WRITE)
+                try:
+                    connected = service.connect_to_router(router_id)
+                except RouterBusy:
+                    connected = False
+                if not connected:
+                    self._requeue(router_id, {c.id: pending[c.id] for c, _, _ in changes})
+                    return {'router_id': router_id, 'clients': len(changes), 'error': 'connection failed'}
+            try:
+                results = service.apply_client_states(changes, reasons)
+            finally:
+                if own_service:
+                    service.disconnect()
+            failed = [client_id for client_id, ok in results.items() if not ok]
+            if failed:
+                self._requeue(router_id, {client_id: pending[client_id] for client_id in failed})
+
+            response_snapshots.invalidate_router(router_id)
+
+        return {
+            'router_id': router_id,
+            'clients': len(changes),
+            'applied': len(changes) - len(failed),
+            'failed': failed,
+            'missing': len(pending) - len(clients)
+        }
+
+    def _requeue(self, router_id: str, pending: Dict[str, Dict[str, str]]):
+        """Buffer clients back for another attempt; raises if Redis cannot
+        take them, leaving them in the processing batch"""
+        retry = {}
+        parked = {}
+        for client_id, aspects in pending.items():
+            attempts = int(aspects.get('attempts') or 0) + 1
+            fields = retry if attempts < MAX_ATTEMPTS else parked
+            fields.update({f'{client_id}:{aspect}': value for aspect, value in aspects.items()})
+            fields[f'{client_id}:attempts'] = str(attempts)
+        if parked:
+            clients = len({field.rsplit(':', 1)[0] for field in parked})
+            logger.error(f"Router state of {clients} clients on {router_id} still not applied "
+                         f"after {MAX_ATTEMPTS} attempts; left for reconcile")
+            self._store(router_id, parked, schedule=False)
+        if retry and self._store(router_id, retry):
+            self._schedule(router_id)
+
+    # ==================== RECONCILE ====================
+
+    def pending_routers(self) -> List[str]:
+        """Routers with buffered changes, scheduled or not, or with a batch
+        a flush left unfinished"""
+        prefix = PENDING_KEY.format(router_id='')
+        routers = {}
+        for key in self._redis().scan_iter(match=prefix + '*', count=500):
+            key = _decode(key)
+            if key.endswith((SCHEDULED_SUFFIX, FLUSHING_SUFFIX)):
+                continue
+            if key.endswith(PROCESSING_SUFFIX):
+                key = key[:-len(PROCESSING_SUFFIX)]
+            routers[key[len(prefix):]] = True
+        return list(routers)
+
+    def reconcile(self) -> Dict:
+        """Flush every router whose buffered changes have no flush scheduled
+
+        Picks up changes whose flush could not be scheduled or that ran out
+        of immediate retries; run periodically from Celery beat.
+        """
+        client = self._redis()
+        results = []
+        for router_id in self.pending_routers():
+            if client.exists(SCHEDULED_KEY.format(router_id=router_id)):
+                continue
+            try:
+                results.append(self.flush(router_id))
+            except Exception as e:
+                logger.error(f"Could not reconcile router writes for {router_id}: {e}")
+        return {
+            'routers': len(results),
+            'applied': sum(r.get('applied', 0) for r in results),
+            'failed': sum(len(r.get('failed', ())) for r in results)
+        }
+
+
+router_writes = ClientWriteCoalescer()
+
+
+def _decode(value) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else value
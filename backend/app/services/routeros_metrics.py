@@ -0,0 +1,338 @@
+"""
+RouterOS Metrics
+Per-command latency, row count and wire bytes for every RouterOS API call
+"""
+import bisect
+import logging
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+
+from app.services.router_scheduler import router_scheduler
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Path and verb have a small fixed vocabulary, so they label the histograms;
+# routers number in the thousands and only label plain counters.
+COMMAND_SECONDS = Histogram(
+    'routeros_command_duration_seconds', 'RouterOS API command latency',
+    ['path', 'verb', 'status'], buckets=LATENCY_BUCKETS
+)
+COMMAND_ROWS = Histogram(
+    'routeros_command_rows', 'Rows returned per RouterOS API command',
+    ['path', 'verb'], buckets=(0, 1, 10, 100, 1000, 10000, 100000)
+)
+COMMAND_BYTES = Counter(
+    'routeros_command_bytes_total', 'RouterOS API bytes on the wire',
+    ['path', 'verb', 'direction']
+)
+ROUTER_COMMANDS = Counter(
+    'routeros_router_commands_total', 'RouterOS API commands per router', ['router', 'status']
+)
+ROUTER_SECONDS = Counter(
+    'routeros_router_command_seconds_total', 'Time spent in RouterOS API commands per router', ['router']
+)
+ROUTER_BYTES = Counter(
+    'routeros_router_bytes_total', 'RouterOS API bytes on the wire per router', ['router', 'direction']
+)
+
+
+class CommandStats:
+    """In-process aggregates per (router, path, verb) for the debug endpoint"""
+
+    def __init__(self):
+        self._stats: Dict[tuple, List] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def record(self, router: str, path: str, verb: str, seconds: float, rows: int,
+               sent: int, received: int, error: bool):
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        key = (router, path, verb)
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                # calls, errors, seconds, max seconds, rows, sent, received, buckets
+                entry = self._stats[key] = [0, 0, 0.0, 0.0, 0, 0, 0, [0] * (len(LATENCY_BUCKETS) + 1)]
+            entry[0] += 1
+            entry[1] += error
+            entry[2] += seconds
+            entry[3] = max(entry[3], seconds)
+            entry[4] += rows
+            entry[5] += sent
+            entry[6] += received
+            entry[7][bucket] += 1
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started_at = time.time()
+
+    def summary(self, router: str = None, limit: int = 50, sort: str = 'total_seconds') -> Dict:
+        """Commands ranked by total time (or another numeric field)"""
+        with self._lock:
+            items = [(key, list(entry[:7]), list(entry[7])) for key, entry in self._stats.items()
+                     if router is None or key[0] == router]
+
+        commands = []
+        for (router_id, path, verb), (calls, errors, seconds, slowest, rows, sent, received), buckets in items:
+            commands.append({
+                'router': router_id,
+                'path': path,
+                'verb': verb,
+                'calls': calls,
+                'errors': errors,
+                'total_seconds': round(seconds, 4),
+                'mean_ms': round(seconds / calls * 1000, 2),
+                'p50_ms': _bucket_quantile(buckets, calls, 0.5),
+                'p95_ms': _bucket_quantile(buckets, calls, 0.95),
+                'p99_ms': _bucket_quantile(buckets, calls, 0.99),
+                'max_ms': round(slowest * 1000, 2),
+                'rows': rows,
+                'bytes_sent': sent,
+                'bytes_received': received
+            })
+        if commands and sort not in commands[0]:
+            raise ValueError(f"Unsupported sort: {sort}")
+        commands.sort(key=lambda c: c[sort], reverse=True)
+        return {
+            'since': self.started_at,
+            'commands': len(commands),
+            'items': commands[:limit]
+        }
+
+
+def _bucket_quantile(buckets: List[int], total: int, q: float) -> Optional[float]:
+    """Upper bound (ms) of the bucket holding the q-th call; None above the last bucket"""
+    threshold = q * total
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS, buckets):
+        seen += count
+        if seen >= threshold:
+            return bound * 1000
+    return None
+
+
+command_stats = CommandStats()
+
+
+class WireCounter:
+    """Count bytes through a routeros_api socket wrapper"""
+
+    def __init__(self, socket_wrapper):
+        self.sent = 0
+        self.received = 0
+        send, receive = socket_wrapper.send, socket_wrapper.receive
+
+        def counted_send(data):
+            self.sent += len(data)
+            return send(data)
+
+        def counted_receive(length):
+            data = receive(length)
+            self.received += len(data)
+            return data
+
+        socket_wrapper.send = counted_send
+        socket_wrapper.receive = counted_receive
+
+
+class InstrumentedResource:
+    """RouterOS resource whose blocking calls are scheduled, timed and counted"""
+
+    def __init__(self, resource, owner: 'InstrumentedApi'):
+        self._resource = resource
+        self._owner = owner
+        self.path = resource.path
+
+    def __getattr__(self, name):
+        return getattr(self._resource, name)
+
+    def get(self, **kwargs):
+        return self._timed('print', self._resource.get, **kwargs)
+
+    def detailed_get(self, **kwargs):
+        return self._timed('print', self._resource.detailed_get, **kwargs)
+
+    def set(self, **kwargs):
+        return self._timed('set', self._resource.set, **kwargs)
+
+    def add(self, **kwargs):
+        return self._timed('add', self._resource.add, **kwargs)
+
+    def remove(self, **kwargs):
+        return self._timed('remove', self._resource.remove, **kwargs)
+
+    def call(self, command, arguments=None, queries=None, additional_queries=()):
+        return self._timed(command, self._resource.call, command, arguments, queries, additional_queries)
+
+    def iterate(self, command: str = 'print', arguments=None, queries=None):
+        """Yield reply rows as they are read off the socket
+
+        Only time spent waiting on the router counts as command latency.
+        When the consumer stops early the rest of the reply is still read,
+        so the next command on this connection starts clean.
+        """
+        owner = self._owner
+        with router_scheduler.command(owner.router, command):
+            yield from self._iterate(command, arguments, queries)
+
+    def _iterate(self, command, arguments, queries):
+        owner = self._owner
+        owner.commands += 1
+        wire = owner.wire
+        sent, received = (wire.sent, wire.received) if wire else (0, 0)
+        stream = iter(self._resource.call_async(command, arguments, queries))
+        rows = 0
+        seconds = 0.0
+        finished = error = False
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    row = next(stream)
+                except StopIteration:
+                    finished = True
+                    return
+                finally:
+                    seconds += time.perf_counter() - started
+                rows += 1
+                yield row
+        except GeneratorExit:
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            if not finished and not error:
+                started = time.perf_counter()
+                try:
+                    for _ in stream:
+                        pass
+                except Exception as e:
+                    logger.debug(f"Could not drain {self.path} {command}: {e}")
+                seconds += time.perf_counter() - started
+            if wire:
+                sent, received = wire.sent - sent, wire.received - received
+            _observe(owner.router, self.path, command, seconds, rows, sent, received, error)
+
+    def _timed(self, verb, method, *args, **kwargs):
+        with router_scheduler.command(self._owner.router, verb):
+            return self._call(verb, method, *args, **kwargs)
+
+    def _call(self, verb, method, *args, **kwargs):
+        owner = self._owner
+        owner.commands += 1
+        wire = owner.wire
+        sent, received = (wire.sent, wire.received) if wire else (0, 0)
+        error = False
+        response = None
+        started = time.perf_counter()
+        try:
+            response = method(*args, **kwargs)
+            return response
+        except Exception:
+            error = True
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            rows = len(response) if isinstance(response, list) else 0
+            if wire:
+                sent, received = wire.sent - sent, wire.received - received
+            _observe(owner.router, self.path, verb, seconds, rows, sent, received, error)
+
+
+# Resolved metric children per (router, path, verb, status); labels() is
+# comparatively slow and the set of keys is bounded by the fleet.
+_children: Dict[tuple, tuple] = {}
+
+
+def _metric_children(router: str, path: str, verb: str, status: str) -> tuple:
+    key = (router, path, verb, status)
+    children = _children.get(key)
+    if children is None:
+        children = _children[key] = (
+            COMMAND_SECONDS.labels(path, verb, status),
+            COMMAND_ROWS.labels(path, verb),
+            COMMAND_BYTES.labels(path, verb, 'sent'),
+            COMMAND_BYTES.labels(path, verb, 'received'),
+            ROUTER_COMMANDS.labels(router, status),
+            ROUTER_SECONDS.labels(router),
+            ROUTER_BYTES.labels(router, 'sent'),
+            ROUTER_BYTES.labels(router, 'received')
+        )
+    return children
+
+
+def _observe(router: str, path: str, verb: str, seconds: float, rows: int,
+             sent: int, received: int, error: bool):
+    try:
+        latency, row_count, path_sent, path_received, commands, router_seconds, router_sent, \
+            router_received = _metric_children(router, path, verb, 'error' if error else 'ok')
+        latency.observe(seconds)
+        row_count.observe(rows)
+        commands.inc()
+        router_seconds.inc(seconds)
+        if sent or received:
+            path_sent.inc(sent)
+            path_received.inc(received)
+            router_sent.inc(sent)
+            router_received.inc(received)
+        command_stats.record(router, path, verb, seconds, rows, sent, received, error)
+    except Exception as e:
+        # Metrics must never break a router call
+        logger.warning(f"Could not record RouterOS command metrics: {e}")
+
+
+class InstrumentedApi:
+    """Drop-in wrapper for RouterOsApi returning instrumented resources"""
+
+    def __init__(self, api, router: str, wire: Optional[WireCounter] = None):
+        self._api = api
+        self.router = router
+        self.wire = wire
+        self.commands = 0
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
+    def get_resource(self, path, structure=None):
+        return InstrumentedResource(self._api.get_resource(path, structure), self)
+
+    def get_binary_resource(self, path):
+        return InstrumentedResource(self._api.get_binary_resource(path), self)
+
+    def counters(self) -> Tuple[int, int, int]:
+        """(commands, bytes sent, bytes received) so far on this connection"""
+        if self.wire:
+            return self.commands, self.wire.sent, self.wire.received
+        return self.commands, 0, 0
+
+
+def disable_nagle(socket_wrapper):
+    """Send each command immediately
+
+    routeros_api writes a sentence one word per send(); with Nagle's
+    algorithm on, every command after the first word waits for the
+    router's delayed ACK (~40ms per command on Linux peers).
+    """
+    try:
+        socket_wrapper.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (AttributeError, OSError) as e:
+        logger.debug(f"Could not set TCP_NODELAY: {e}")
+
+
+def instrument(connection, api, router: str) -> InstrumentedApi:
+    """Wrap a freshly opened RouterOsApiPool connection and its API object"""
+    wire = None
+    try:
+        disable_nagle(connection.socket)
+        wire = WireCounter(connection.socket)
+    except AttributeError:
+        logger.debug(f"No socket to count bytes on for router {router}")
+    return InstrumentedApi(api, str(router), wire)
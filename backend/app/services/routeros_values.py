@@ -0,0 +1,198 @@
+"""
+RouterOS Values
+Column-wise conversion of RouterOS API string values into NumPy arrays
+"""
+import re
+from typing import Dict, Iterable, List, Mapping, Sequence
+
+import numpy as np
+
+# Rate and size suffixes as printed by RouterOS (rates are decimal, sizes binary)
+BIT_UNITS = {'': 1, 'k': 10 ** 3, 'K': 10 ** 3, 'M': 10 ** 6, 'G': 10 ** 9, 'T': 10 ** 12}
+BYTE_UNITS = {'': 1, 'B': 1, 'KiB': 2 ** 10, 'MiB': 2 ** 20, 'GiB': 2 ** 30, 'TiB': 2 ** 40}
+DURATION_UNITS = {'w': 604800, 'd': 86400, 'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+
+TRUE_VALUES = ('true', 'yes')
+
+_DURATION_TOKEN = re.compile(r'(\d+)(?:(ms|w|d|h|m|s)|:(\d+):(\d+))|(\n)')
+_NUMBER_SUFFIX = re.compile(r'^([0-9.]*)([A-Za-z]*)$')
+
+
+def _strings(values: Iterable) -> np.ndarray:
+    """Values as a NumPy string array with missing entries as ''"""
+    return np.array(['' if v is None else str(v) for v in values], dtype=str)
+
+
+def _plain_numbers(arr: np.ndarray, dtype) -> np.ndarray:
+    """Fast path: every entry is digits (or empty); conversion runs in C"""
+    return np.where(arr == '', '0', arr).astype(dtype)
+
+
+def _scaled(arr: np.ndarray, units: Mapping[str, float], dtype) -> np.ndarray:
+    """Numbers with optional unit suffixes, converted once per distinct value"""
+    if arr.size == 0:
+        return np.zeros(0, dtype=dtype)
+    try:
+        return _plain_numbers(arr, dtype)
+    except ValueError:
+        pass
+    # Suffixed values repeat heavily (max-limit, plan speeds), so parse
+    # each distinct string once and scatter the results back.
+    distinct, inverse = np.unique(arr, return_inverse=True)
+    parsed = np.zeros(len(distinct), dtype=np.float64)
+    for i, value in enumerate(distinct.tolist()):
+        match = _NUMBER_SUFFIX.match(value.strip())
+        if not match or not match.group(1) or match.group(2) not in units:
+            continue
+        try:
+            parsed[i] = float(match.group(1)) * units[match.group(2)]
+        except ValueError:
+            continue
+    return parsed[inverse.reshape(-1)].astype(dtype)
+
+
+def int_array(values: Iterable, dtype=np.int64) -> np.ndarray:
+    """Integers such as counters, MTUs or '12%' CPU loads"""
+    arr = np.char.rstrip(_strings(values), '%')
+    try:
+        return _plain_numbers(arr, dtype)
+    except ValueError:
+        return _scaled(arr, {'': 1}, np.float64).astype(dtype)
+
+
+def bool_array(values: Iterable) -> np.ndarray:
+    arr = np.char.lower(_strings(values))
+    return np.isin(arr, TRUE_VALUES)
+
+
+def bits_array(values: Iterable) -> np.ndarray:
+    """Rates such as '1500', '10M' or '2.5k' in bits per second"""
+    return _scaled(_strings(values), BIT_UNITS, np.float64)
+
+
+def bytes_array(values: Iterable) -> np.ndarray:
+    """Sizes such as '268435456' or '256.0MiB' in bytes"""
+    return _scaled(_strings(values), BYTE_UNITS, np.float64)
+
+
+def pair_array(values: Iterable, kind: str = 'bits') -> np.ndarray:
+    """'upload/download' pairs as an (n, 2) array
+
+    ``kind`` is 'bits' for rates and limits or 'count' for byte and packet
+    counters, which stay exact as unsigned 64-bit integers.
+    """
+    arr = _strings(values)
+    if arr.size == 0:
+        return np.zeros((0, 2), dtype=np.uint64 if kind == 'count' else np.float64)
+    halves = np.char.partition(arr, '/')
+    columns = (halves[:, 0], halves[:, 2])
+    if kind == 'count':
+        try:
+            return np.stack([_plain_numbers(c, np.uint64) for c in columns], axis=1)
+        except ValueError:
+            return np.stack([_scaled(c, {'': 1}, np.float64) for c in columns], axis=1).astype(np.uint64)
+    return np.stack([_scaled(c, BIT_UNITS, np.float64) for c in columns], axis=1)
+
+
+def duration_array(values: Iterable) -> np.ndarray:
+    """Durations such as '1w2d03:04:05', '3h4m5s' or '500ms' in seconds
+
+    All values are joined and tokenized with one regex scan; token values
+    are then summed per row with bincount instead of parsing row by row.
+    """
+    strings = ['' if v is None else str(v) for v in values]
+    if not strings:
+        return np.zeros(0, dtype=np.float64)
+    tokens = _DURATION_TOKEN.findall('\n'.join(strings) + '\n')
+    if not tokens:
+        return np.zeros(len(strings), dtype=np.float64)
+    numbers, units, minutes, seconds, breaks = (np.array(c, dtype=str) for c in zip(*tokens))
+    is_break = breaks == '\n'
+    rows = np.cumsum(is_break) - is_break
+    # A clock token 'hh:mm:ss' has no unit; its leading number is hours
+    units = np.where((units == '') & (minutes != ''), 'h', units)
+    unit_names, unit_index = np.unique(units, return_inverse=True)
+    factors = np.array([DURATION_UNITS.get(u, 0) for u in unit_names.tolist()],
+                       dtype=np.float64)[unit_index.reshape(-1)]
+    amounts = (_plain_numbers(numbers, np.float64) * factors
+               + _plain_numbers(minutes, np.float64) * 60
+               + _plain_numbers(seconds, np.float64))
+    return np.bincount(rows, weights=amounts, minlength=len(strings))[:len(strings)]
+
+
+# Field kinds of the RouterOS tables read by the stats and health methods
+SYSTEM_RESOURCE_SCHEMA = {
+    'cpu-load': 'int',
+    'free-memory': 'bytes',
+    'total-memory': 'bytes',
+    'free-hdd-space': 'bytes',
+    'total-hdd-space': 'bytes',
+    'uptime': 'duration',
+}
+
+INTERFACE_SCHEMA = {
+    'name': 'str',
+    'type': 'str',
+    'mac-address': 'str',
+    'mtu': 'int',
+    'running': 'bool',
+    'disabled': 'bool',
+    'rx-byte': 'int',
+    'tx-byte': 'int',
+    'rx-packet': 'int',
+    'tx-packet': 'int',
+    'rx-error': 'int',
+    'tx-error': 'int',
+}
+
+SIMPLE_QUEUE_SCHEMA = {
+    'name': 'str',
+    'target': 'str',
+    'max-limit': 'pair',
+    'rate': 'pair',
+    'packet-rate': 'pair',
+    'bytes': 'count_pair',
+    'queued-bytes': 'count_pair',
+    'queued-packets': 'count_pair',
+    'disabled': 'bool',
+}
+
+
+def _column(rows: Sequence[Mapping], key: str) -> List:
+    return [row.get(key) for row in rows]
+
+
+CONVERTERS = {
+    'int': int_array,
+    'bool': bool_array,
+    'bits': bits_array,
+    'bytes': bytes_array,
+    'duration': duration_array,
+    'pair': pair_array,
+    'count_pair': lambda values: pair_array(values, kind='count'),
+    'str': lambda values: np.array(['' if v is None else str(v) for v in values], dtype=object),
+}
+
+
+def parse_table(rows: Sequence[Mapping], schema: Mapping[str, str]) -> Dict[str, np.ndarray]:
+    """Convert API rows into one typed array per column
+
+    ``schema`` maps RouterOS field names to a kind in CONVERTERS; missing
+    fields become zeros, False or ''.
+    """
+    return {field: CONVERTERS[kind](_column(rows, field)) for field, kind in schema.items()}
+
+
+def parse_row(row: Mapping, schema: Mapping[str, str]) -> Dict:
+    """Typed values of a single row (e.g. /system/resource) as Python scalars"""
+    table = parse_table([row], schema)
+    return {field: values[0].tolist() for field, values in table.items()}
+
+
+def to_records(table: Mapping[str, np.ndarray], names: Mapping[str, str]) -> List[Dict]:
+    """Rebuild JSON-ready dicts from columns; ``names`` maps output key to column"""
+    columns = [(key, table[field].tolist()) for key, field in names.items()]
+    if not columns:
+        return []
+    return [dict(zip((key for key, _ in columns), values))
+            for values in zip(*(values for _, values in columns))]
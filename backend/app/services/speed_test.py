@@ -0,0 +1,174 @@
+"""
+Speed Test
+Download payloads sent from one preallocated file, uploads drained into a
+reused buffer, and latency/jitter summaries of probe samples
+"""
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from flask import Response, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import FileWrapper
+
+logger = logging.getLogger(__name__)
+
+# Probe samples kept from a result; more are ignored
+MAX_SAMPLES = 100
+
+_NO_STORE = {'Cache-Control': 'no-store, no-transform'}
+
+
+class _Slice:
+    """First ``length`` bytes of an open file, closed with the response
+
+    Exposes ``fileno()`` so the server can hand the file to sendfile(2);
+    servers that iterate instead get ``read`` capped at ``length``.
+    """
+
+    def __init__(self, file, length: int):
+        self._file = file
+        self._left = length
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def read(self, size: int = -1) -> bytes:
+        if self._left <= 0:
+            return b''
+        size = self._left if size < 0 else min(size, self._left)
+        data = self._file.read(size)
+        self._left -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+class SpeedTestService:
+    """Payload source and sink for client speed tests
+
+    Downloads are served from a file of random (incompressible) bytes
+    written once per host; it stays in the page cache, and the response
+    goes out through the server's ``wsgi.file_wrapper`` with an exact
+    Content-Length, so gunicorn sends it with sendfile(2) instead of
+    copying it through Python. Uploads are read into a per-thread scratch
+    buffer and dropped. Neither touches the database or Redis.
+    """
+
+    def __init__(self, buffer_bytes: int = 64 * 1024 * 1024, chunk_bytes: int = 256 * 1024,
+                 max_upload_bytes: int = 256 * 1024 * 1024, path: str = None):
+        self.buffer_bytes = buffer_bytes
+        self.chunk_bytes = chunk_bytes
+        self.max_upload_bytes = max_upload_bytes
+        self.path = path
+        self._lock = threading.Lock()
+        self._ready = False
+        self._local = threading.local()
+
+    def init_app(self, app):
+        self.buffer_bytes = app.config.get('SPEEDTEST_BUFFER_BYTES', 64 * 1024 * 1024)
+        self.chunk_bytes = app.config.get('SPEEDTEST_CHUNK_BYTES', 256 * 1024)
+        self.max_upload_bytes = app.config.get('SPEEDTEST_MAX_UPLOAD_BYTES', 256 * 1024 * 1024)
+        self.path = app.config.get('SPEEDTEST_BUFFER_PATH') or os.path.join(
+            tempfile.gettempdir(), f'ispmax-speedtest-{self.buffer_bytes}.bin')
+        self._ready = False
+        app.extensions['speed_test'] = self
+
+    # ==================== DOWNLOAD ====================
+
+    def prepare(self) -> str:
+        """Write the payload file unless a complete one exists; returns its path"""
+        if self._ready:
+            return self.path
+        with self._lock:
+            if self._ready:
+                return self.path
+            try:
+                complete = os.path.getsize(self.path) == self.buffer_bytes
+            except OSError:
+                complete = False
+            if not complete:
+                started = time.monotonic()
+                partial = f'{self.path}.{os.getpid()}.tmp'
+                with open(partial, 'wb') as f:
+                    written = 0
+                    while written < self.buffer_bytes:
+                        written += f.write(os.urandom(min(self.buffer_bytes - written, 1024 * 1024)))
+                # Other workers may be writing the same file; the rename is atomic
+                os.replace(partial, self.path)
+                logger.info(f"Wrote {self.buffer_bytes} byte speed test payload to {self.path} "
+                            f"in {time.monotonic() - started:.2f}s")
+            self._ready = True
+        return self.path
+
+    def download(self, nbytes: int = None) -> Response:
+        """Response streaming ``nbytes`` of payload (at most the buffer size)"""
+        nbytes = self.buffer_bytes if nbytes is None else int(nbytes)
+        if nbytes <= 0:
+            raise ValueError('bytes must be positive')
+        nbytes = min(nbytes, self.buffer_bytes)
+
+        payload = _Slice(open(self.prepare(), 'rb'), nbytes)
+        file_wrapper = request.environ.get('wsgi.file_wrapper', FileWrapper)
+        response = Response(file_wrapper(payload, self.chunk_bytes), direct_passthrough=True,
+                            mimetype='application/octet-stream')
+        response.content_length = nbytes
+        response.headers.update(_NO_STORE)
+        # Stream straight through a fronting nginx instead of spooling to disk
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    # ==================== UPLOAD ====================
+
+    def drain(self, stream, content_length: int = None) -> Tuple[int, float]:
+        """Read and discard a request body; (bytes, seconds spent receiving it)"""
+        if content_length and content_length > self.max_upload_bytes:
+            raise RequestEntityTooLarge(f"Upload exceeds {self.max_upload_bytes} bytes")
+        scratch = getattr(self._local, 'scratch', None)
+        if scratch is None or len(scratch) != self.chunk_bytes:
+            scratch = self._local.scratch = memoryview(bytearray(self.chunk_bytes))
+        readinto = getattr(stream, 'readinto', None)
+
+        total = 0
+        started = time.monotonic()
+        while True:
+            if readinto is not None:
+                n = readinto(scratch)
+            else:
+                n = len(stream.read(self.chunk_bytes))
+            if not n:
+                break
+            total += n
+            if total > self.max_upload_bytes:
+                raise RequestEntityTooLarge(f"Upload exceeds {self.max_upload_bytes} bytes")
+        return total, time.monotonic() - started
+
+
+speed_test = SpeedTestService()
+
+
+def no_store(response: Response) -> Response:
+    """Keep caches and compressing proxies out of a probe response"""
+    response.headers.update(_NO_STORE)
+    return response
+
+
+def mbps(nbytes: int, seconds: float) -> float:
+    return round(nbytes * 8 / seconds / 1e6, 2) if seconds > 0 else 0.0
+
+
+def summarize_samples(samples: List[float]) -> Dict[str, float]:
+    """Latency (median) and jitter (mean change between consecutive samples) in ms"""
+    samples = [float(s) for s in samples[:MAX_SAMPLES]]
+    if not samples or any(s < 0 for s in samples):
+        raise ValueError('ping_samples must be non-negative milliseconds')
+    deltas = [abs(b - a) for a, b in zip(samples, samples[1:])]
+    return {
+        'ping_ms': round(statistics.median(samples), 2),
+        'jitter_ms': round(sum(deltas) / len(deltas), 2) if deltas else 0.0
+    }
@@ -0,0 +1,177 @@
+"""
+Traffic Service
+Cached per-queue rate snapshots and top-talker / congestion ranking across the fleet
+"""
+import base64
+import heapq
+import json
+import logging
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.services.metadata_cache import metadata_cache
+from app.services.routeros_values import parse_table
+from app.services.usage_service import QUEUE_PREFIX, get_redis
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = 'ispmax:traffic:queues:{router_id}'
+ROUTERS_KEY = 'ispmax:traffic:routers'
+# A router that misses a few samples drops out of the ranking
+SNAPSHOT_TTL = 300
+
+RANKINGS = ('total', 'down', 'up', 'utilization')
+
+QUEUE_RATE_SCHEMA = {'name': 'str', 'rate': 'pair', 'max-limit': 'pair'}
+
+
+class QueueSnapshot:
+    """Rates of every queue on one router at one point in time
+
+    ``rates`` and ``limits`` are (n, 2) float arrays of upload/download
+    bits per second, aligned with ``names``.
+    """
+
+    def __init__(self, router_id: str, sampled_at: float, names: List[str],
+                 rates: np.ndarray, limits: np.ndarray):
+        self.router_id = router_id
+        self.sampled_at = sampled_at
+        self.names = names
+        self.rates = rates
+        self.limits = limits
+
+    @classmethod
+    def from_queues(cls, router_id: str, queues: Iterable[Dict],
+                    sampled_at: float = None) -> 'QueueSnapshot':
+        table = parse_table(list(queues), QUEUE_RATE_SCHEMA)
+        return cls(router_id, sampled_at or time.time(), table['name'].tolist(),
+                   table['rate'], table['max-limit'])
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def utilization(self) -> np.ndarray:
+        """Highest of upload/download rate over max-limit; 0 where unlimited"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(self.limits > 0, self.rates / self.limits, 0.0)
+        return ratio.max(axis=1) if len(self) else np.zeros(0)
+
+    def scores(self, by: str) -> np.ndarray:
+        if by == 'up':
+            return self.rates[:, 0]
+        if by == 'down':
+            return self.rates[:, 1]
+        if by == 'utilization':
+            return self.utilization()
+        return self.rates.sum(axis=1)
+
+    def entry(self, i: int) -> Dict:
+        name = self.names[i]
+        up, down = self.rates[i].tolist()
+        limit_up, limit_down = self.limits[i].tolist()
+        return {
+            'router_id': self.router_id,
+            'queue': name,
+            'client_id': name[len(QUEUE_PREFIX):] if name.startswith(QUEUE_PREFIX) else None,
+            'up_bps': up,
+            'down_bps': down,
+            'total_bps': up + down,
+            'utilization': round(max(up / limit_up if limit_up else 0.0,
+                                     down / limit_down if limit_down else 0.0), 4)
+        }
+
+    def to_bytes(self) -> bytes:
+        return json.dumps({
+            'router_id': self.router_id,
+            'sampled_at': self.sampled_at,
+            'names': self.names,
+            'rates': base64.b64encode(self.rates.astype('<f8').tobytes()).decode('ascii'),
+            'limits': base64.b64encode(self.limits.astype('<f8').tobytes()).decode('ascii')
+        }).encode('utf-8')
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'QueueSnapshot':
+        raw = json.loads(data)
+        columns = [np.frombuffer(base64.b64decode(raw[key]), dtype='<f8').reshape(-1, 2)
+                   for key in ('rates', 'limits')]
+        return cls(raw['router_id'], raw['sampled_at'], raw['names'], *columns)
+
+
+def top_entries(snapshot: QueueSnapshot, n: int, by: str = 'total'):
+    """(score, snapshot, index) of the n highest-ranked queues
+
+    argpartition selects the winners in linear time; only those n are sorted.
+    """
+    scores = snapshot.scores(by)
+    if len(scores) > n:
+        best = np.argpartition(scores, -n)[-n:]
+    else:
+        best = np.arange(len(scores))
+    best = best[np.argsort(scores[best])[::-1]]
+    return [(float(scores[i]), snapshot, int(i)) for i in best if scores[i] > 0]
+
+
+class TrafficService:
+    """Record queue samples in Redis and rank them per router or fleet-wide"""
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client if redis_client is not None else get_redis()
+
+    def record(self, router_id: str, queues: Iterable[Dict],
+               sampled_at: float = None) -> QueueSnapshot:
+        snapshot = QueueSnapshot.from_queues(router_id, queues, sampled_at)
+        pipe = self.redis.pipeline()
+        pipe.set(SNAPSHOT_KEY.format(router_id=router_id), snapshot.to_bytes(), ex=SNAPSHOT_TTL)
+        pipe.sadd(ROUTERS_KEY, router_id)
+        pipe.execute()
+        return snapshot
+
+    def snapshots(self, router_ids: Optional[List[str]] = None) -> List[QueueSnapshot]:
+        """Latest cached snapshot of each router (all recorded routers by default)"""
+        if router_ids is None:
+            router_ids = sorted(r.decode('utf-8') for r in self.redis.smembers(ROUTERS_KEY))
+        if not router_ids:
+            return []
+        values = self.redis.mget([SNAPSHOT_KEY.format(router_id=r) for r in router_ids])
+        snapshots = []
+        expired = []
+        for router_id, value in zip(router_ids, values):
+            if value is None:
+                expired.append(router_id)
+            else:
+                snapshots.append(QueueSnapshot.from_bytes(value))
+        if expired:
+            self.redis.srem(ROUTERS_KEY, *expired)
+        return snapshots
+
+    def top_talkers(self, n: int = 10, router_id: str = None, by: str = 'total') -> Dict:
+        """Rank queues by rate or limit utilization for one router or the fleet"""
+        if by not in RANKINGS:
+            raise ValueError(f"Unsupported ranking: {by}")
+        started = time.perf_counter()
+        snapshots = self.snapshots([router_id] if router_id else None)
+
+        candidates = []
+        for snapshot in snapshots:
+            candidates.extend(top_entries(snapshot, n, by))
+        best = heapq.nlargest(n, candidates, key=lambda c: c[0])
+
+        now = time.time()
+        items = []
+        for _, snapshot, i in best:
+            entry = snapshot.entry(i)
+            router = metadata_cache.get_router(snapshot.router_id)
+            entry['router_name'] = router.name if router else None
+            entry['age_seconds'] = round(now - snapshot.sampled_at, 1)
+            items.append(entry)
+
+        return {
+            'scope': 'router' if router_id else 'fleet',
+            'by': by,
+            'routers': len(snapshots),
+            'queues': sum(len(s) for s in snapshots),
+            'items': items,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
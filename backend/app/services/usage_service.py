@@ -0,0 +1,359 @@
+"""
+Usage Accounting Service
+Per-client traffic accounting from queue byte counters and data limit enforcement
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import bindparam, func, insert, select, update
+
+from app import db
+from app.models import Client, ClientUsage, Invoice, Plan
+from app.services.billing_service import billing_period_for
+from app.services.metadata_cache import metadata_cache
+from app.services.routeros_values import parse_table
+
+logger = logging.getLogger(__name__)
+
+COUNTER_KEY = 'ispmax:usage:counters:{router_id}'
+# Counter state of routers that stop reporting expires instead of piling up
+COUNTER_TTL = 24 * 3600
+QUEUE_PREFIX = 'client_'
+GB = 1000 ** 3
+COUNTER_WIDTH = 64
+# A decrease smaller than this past the counter width is a wrap, anything
+# else means the counter was reset (router reboot, queue re-created).
+WRAP_WINDOW = 1 << 40
+QUERY_CHUNK = 1000
+# Swap a router's stored counters for a new sample in one step and return
+# the old ones. Two overlapping samples of a router would otherwise both
+# read the same baseline and count the traffic twice; a sample read before
+# the stored one is refused (nil) so an older reading never rewinds it.
+# ARGV: ttl, sampled_at, then client id / 'up/down' pairs.
+SWAP_COUNTERS_SCRIPT = """
+local last = redis.call('HGET', KEYS[1], '@sampled_at')
+if last and tonumber(last) > tonumber(ARGV[2]) then
+    return false
+end
+local previous = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], '@sampled_at', ARGV[2])
+for i = 3, #ARGV - 1, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return previous
+"""
+
+_redis_clients: Dict[str, object] = {}
+_redis_lock = threading.Lock()
+
+
+def counter_delta(previous: int, current: int, width: int = COUNTER_WIDTH) -> int:
+    """Bytes transferred between two samples of a monotonically increasing counter"""
+    if current >= previous:
+        return current - previous
+    wrapped = (1 << width) - previous + current
+    if wrapped <= WRAP_WINDOW:
+        return wrapped
+    return current
+
+
+def parse_queue_counters(queues: Iterable[Dict]) -> Dict[str, Tuple[int, int]]:
+    """Map client id to (upload, download) bytes from /queue/simple rows"""
+    table = parse_table(list(queues), {'name': 'str', 'bytes': 'count_pair'})
+    return {
+        name[len(QUEUE_PREFIX):]: tuple(counts)
+        for name, counts in zip(table['name'].tolist(), table['bytes'].tolist())
+        if name.startswith(QUEUE_PREFIX)
+    }
+
+
+def _chunks(items: List, size: int = QUERY_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def get_redis(url: str = None):
+    """Process-wide Redis client for the configured URL"""
+    if url is None:
+        from flask import current_app
+        url = current_app.config['REDIS_URL']
+    with _redis_lock:
+        if url not in _redis_clients:
+            import redis
+            _redis_clients[url] = redis.Redis.from_url(url)
+        return _redis_clients[url]
+
+
+class UsageAccountingService:
+    """Turn periodic queue counter samples into per-period usage totals
+
+    The last raw counters of each router live in one Redis hash, swapped for
+    the new sample by one script call regardless of client count. Deltas
+    are applied to the ``client_usage`` row of each client's current billing
+    period with a single executemany UPDATE plus one multi-row INSERT for
+    clients starting a new period.
+    """
+
+    def __init__(self, redis_client=None, limit_action: str = 'throttle',
+                 throttle_limit: str = '1M/1M'):
+        self.redis = redis_client if redis_client is not None else get_redis()
+        self.limit_action = limit_action
+        self.throttle_limit = throttle_limit
+        # EVALSHA, loading the script on first use
+        self._swap_counters = self.redis.register_script(SWAP_COUNTERS_SCRIPT)
+
+    # ==================== SAMPLING ====================
+
+    def ingest(self, router_id: str, counters: Dict[str, Tuple[int, int]],
+               now: datetime = None, sampled_at: float = None) -> Dict:
+        """Account one counter sample; return which clients crossed their limit
+
+        ``sampled_at`` is when the counters were read (epoch seconds, default
+        now); a sample older than the stored one is ignored.
+        """
+        now = now or datetime.utcnow()
+        started = time.perf_counter()
+        deltas = self._deltas(router_id, counters, sampled_at or time.time())
+
+        accounted = 0
+        exceeded: List[str] = []
+        restore: List[Tuple[str, str, str]] = []
+        for chunk in _chunks(list(deltas)):
+            result = self._apply(chunk, deltas, now)
+            accounted += result[0]
+            exceeded.extend(result[1])
+            restore.extend(result[2])
+        for chunk in _chunks(list(counters)):
+            restore.extend(self._suspended_last_period(chunk, now))
+        db.session.commit()
+
+        elapsed = time.perf_counter() - started
+        logger.debug(f"Usage sample for router {router_id}: {len(counters)} queues, "
+                     f"{accounted} clients accounted in {elapsed:.3f}s")
+        return {
+            'router_id': router_id,
+            'queues': len(counters),
+            'accounted': accounted,
+            'exceeded': exceeded,
+            'restore': restore,
+            'elapsed_seconds': round(elapsed, 3)
+        }
+
+    def _deltas(self, router_id: str, counters: Dict[str, Tuple[int, int]],
+                sampled_at: float) -> Dict[str, Tuple[int, int]]:
+        args = [COUNTER_TTL, repr(sampled_at)]
+        for cid, (up, down) in counters.items():
+            args.extend((cid, f"{up}/{down}"))
+        flat = self._swap_counters(keys=[COUNTER_KEY.format(router_id=router_id)], args=args)
+        if flat is None:
+            logger.warning(f"Ignoring out-of-order usage sample for router {router_id}")
+            return {}
+        previous = dict(zip(flat[::2], flat[1::2]))
+
+        deltas = {}
+        for cid, (up, down) in counters.items():
+            last = previous.get(cid.encode('utf-8'))
+            if last is None:
+                # First sample of this queue only establishes the baseline
+                continue
+            last_up, _, last_down = last.decode('ascii').partition('/')
+            delta = (counter_delta(int(last_up), up), counter_delta(int(last_down), down))
+            if delta[0] or delta[1]:
+                deltas[cid] = delta
+        return deltas
+
+    def _apply(self, client_ids: List[str], deltas: Dict[str, Tuple[int, int]], now: datetime):
+        clients = db.session.query(
+            Client.id, Client.billing_day, Client.status, Client.plan_id, Plan.data_limit
+        ).outerjoin(Plan, Plan.id == Client.plan_id).filter(Client.id.in_(client_ids)).all()
+        if not clients:
+            return 0, [], []
+
+        periods: Dict[int, Tuple[datetime, datetime]] = {}
+        for client in clients:
+            if client.billing_day not in periods:
+                periods[client.billing_day] = billing_period_for(client.billing_day, now)
+
+        existing = {
+            (row.client_id, row.period_start): row
+            for row in db.session.query(
+                ClientUsage.id, ClientUsage.client_id, ClientUsage.period_start,
+                ClientUsage.bytes_up, ClientUsage.bytes_down, ClientUsage.limit_exceeded_at
+            ).filter(
+                ClientUsage.client_id.in_([c.id for c in clients]),
+                ClientUsage.period_start.in_(list({start for start, _ in periods.values()}))
+            )
+        }
+
+        updates = []
+        inserts = []
+        exceeded = []
+        for client in clients:
+            period_start, period_end = periods[client.billing_day]
+            up, down = deltas[client.id]
+            row = existing.get((client.id, period_start))
+            total = up + down + (row.bytes_up + row.bytes_down if row else 0)
+
+            crossed = (
+                client.data_limit and client.status == 'active'
+                and total >= client.data_limit * GB
+                and (row is None or row.limit_exceeded_at is None)
+            )
+            if crossed:
+                exceeded.append(client.id)
+
+            if row is not None:
+                updates.append({
+                    '_id': row.id,
+                    '_up': up,
+                    '_down': down,
+                    '_exceeded_at': now if crossed else None,
+                    '_action': self.limit_action if crossed else None,
+                    '_now': now
+                })
+            else:
+                inserts.append({
+                    'id': str(uuid.uuid4()),
+                    'client_id': client.id,
+                    'period_start': period_start,
+                    'period_end': period_end,
+                    'bytes_up': up,
+                    'bytes_down': down,
+                    'limit_exceeded_at': now if crossed else None,
+                    'limit_action': self.limit_action if crossed else None,
+                    'created_at': now,
+                    'updated_at': now
+                })
+
+        table = ClientUsage.__table__
+        if updates:
+            db.session.execute(
+                update(table).where(table.c.id == bindparam('_id')).values(
+                    bytes_up=table.c.bytes_up + bindparam('_up'),
+                    bytes_down=table.c.bytes_down + bindparam('_down'),
+                    limit_exceeded_at=func.coalesce(table.c.limit_exceeded_at, bindparam('_exceeded_at')),
+                    limit_action=func.coalesce(table.c.limit_action, bindparam('_action')),
+                    updated_at=bindparam('_now')
+                ),
+                updates
+            )
+        restore = []
+        if inserts:
+            db.session.execute(insert(table), inserts)
+            restore = self._throttled_last_period(
+                {row['client_id']: row['period_start'] for row in inserts},
+                {c.id: c.plan_id for c in clients}
+            )
+
+        return len(clients), exceeded, restore
+
+    @staticmethod
+    def _throttled_last_period(new_periods: Dict[str, datetime],
+                               plan_ids: Dict[str, str]) -> List[Tuple[str, str, str]]:
+        """Clients starting a new period whose previous period was throttled"""
+        rows = db.session.query(ClientUsage.client_id, func.max(ClientUsage.period_start)).filter(
+            ClientUsage.client_id.in_(list(new_periods)),
+            ClientUsage.limit_action == 'throttle'
+        ).group_by(ClientUsage.client_id)
+        return [(client_id, plan_ids[client_id], 'throttle') for client_id, last_start in rows
+                if last_start < new_periods[client_id] and plan_ids.get(client_id)]
+
+    @staticmethod
+    def _suspended_last_period(client_ids: List[str], now: datetime) -> List[Tuple[str, str, str]]:
+        """Suspended clients without overdue invoices whose last data-limit
+        suspension was in an earlier period
+
+        Their queues are disabled, so no traffic starts a new usage row for
+        them; the router's queue list is what brings them up here.
+        """
+        overdue = select(Invoice.client_id).where(Invoice.status == 'overdue')
+        rows = db.session.query(
+            Client.id, Client.plan_id, Client.billing_day, func.max(ClientUsage.period_start)
+        ).join(ClientUsage, ClientUsage.client_id == Client.id).filter(
+            Client.id.in_(client_ids),
+            Client.status == 'suspended',
+            Client.id.notin_(overdue),
+            ClientUsage.limit_action == 'suspend'
+        ).group_by(Client.id, Client.plan_id, Client.billing_day)
+        return [(client_id, plan_id, 'suspend') for client_id, plan_id, billing_day, last_start in rows
+                if last_start < billing_period_for(billing_day, now)[0]]
+
+    # ==================== ENFORCEMENT ====================
+
+    def enforce(self, service, result: Dict):
+        """Apply the outcome of ingest over a connected MikroTikService"""
+        if result['exceeded']:
+            self._enforce(service, result['exceeded'])
+        if result['restore']:
+            self._restore(service, result['restore'])
+
+    def _enforce(self, service, client_ids: List[str]):
+        if self.limit_action == 'suspend':
+            clients = Client.query.filter(Client.id.in_(client_ids)).all()
+            suspended = service.suspend_clients(clients, reason='data-limit')
+            if suspended:
+                Client.query.filter(Client.id.in_(suspended)).update(
+                    {'status': 'suspended', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+                db.session.commit()
+        else:
+            service.set_queue_limits({cid: self.throttle_limit for cid in client_ids})
+        logger.info(f"Data limit reached by {len(client_ids)} clients ({self.limit_action})")
+
+    def _restore(self, service, clients: List[Tuple[str, str, str]]):
+        limits = {}
+        for client_id, plan_id, action in clients:
+            plan = metadata_cache.get_plan(plan_id) if action == 'throttle' else None
+            if plan:
+                limits[client_id] = f"{plan.download_speed}M/{plan.upload_speed}M"
+        if limits:
+            service.set_queue_limits(limits)
+            logger.info(f"Restored plan speed for {len(limits)} clients on a new billing period")
+
+        suspended = [client_id for client_id, _, action in clients if action == 'suspend']
+        if suspended:
+            self._reactivate(service, suspended)
+
+    @staticmethod
+    def _reactivate(service, client_ids: List[str]):
+        """Lift data-limit suspensions at the start of a new period
+
+        Only clients listed on the router for the data limit alone are
+        reactivated; anyone suspended for another reason since stays suspended.
+        """
+        reasons: Dict[str, set] = {}
+        for entry in service.api.get_resource('/ip/firewall/address-list').get(list="suspended_clients"):
+            reason = entry.get('comment', '').rpartition('Razón: ')[2]
+            reasons.setdefault(entry.get('address'), set()).add(reason)
+
+        clients = [
+            client for client in Client.query.filter(
+                Client.id.in_(client_ids), Client.status == 'suspended')
+            if reasons.get(client.ip_address) == {'data-limit'}
+        ]
+        if not clients:
+            return
+
+        for client in clients:
+            client.status = 'active'
+        results = service.apply_client_states([(client, None, {'status'}) for client in clients])
+        for client in clients:
+            if not results.get(client.id):
+                client.status = 'suspended'
+        db.session.commit()
+        logger.info(f"Reactivated {sum(results.values())}/{len(clients)} data-limit suspended "
+                    f"clients on a new billing period")
+
+    # ==================== QUERIES ====================
+
+    @staticmethod
+    def usage_for(client_id: str, limit: int = 12) -> List[Dict]:
+        """Usage per billing period for a client, newest first"""
+        rows = ClientUsage.query.filter(ClientUsage.client_id == client_id).order_by(
+            ClientUsage.period_start.desc()).limit(limit)
+        return [row.to_dict() for row in rows]
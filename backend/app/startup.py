@@ -0,0 +1,84 @@
+"""
+Startup
+Lazy imports of heavy optional integrations and pre-fork preparation for
+gunicorn and Celery masters
+"""
+import gc
+import importlib
+import logging
+import sys
+import threading
+import types
+
+logger = logging.getLogger(__name__)
+
+
+class _LazyModule(types.ModuleType):
+    """Stand-in that imports the real module on first attribute access
+
+    The import runs under a lock with ``importlib.import_module``, so
+    threads racing on the first access all see the fully executed module
+    (``importlib.util.LazyLoader`` is not thread-safe before Python 3.12).
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__['_lazy_lock'] = threading.Lock()
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            with self.__dict__['_lazy_lock']:
+                module = self.__dict__['_lazy_module']
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+
+def lazy_module(name: str) -> types.ModuleType:
+    """Module object that is only executed on first attribute access
+
+    ``routeros_api = lazy_module('routeros_api')`` keeps call sites such as
+    ``routeros_api.RouterOsApiPool(...)`` unchanged while processes that
+    never reach a router (Celery beat, billing workers) skip the import.
+    Missing packages still fail at the call site, not at startup.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return _LazyModule(name)
+
+
+def prepare_fork(app=None) -> int:
+    """Run in the master once the app is preloaded, right before workers fork
+
+    Closes pooled database connections (children must open their own) and
+    moves every object that exists now into the GC's permanent generation,
+    so collections in the workers never touch, and therefore never copy,
+    the pages the master shares with them. Returns the frozen object count.
+    """
+    if app is not None:
+        from app import db
+        with app.app_context():
+            db.engine.dispose()
+    gc.disable()
+    gc.collect()
+    gc.freeze()
+    frozen = gc.get_freeze_count()
+    gc.enable()
+    logger.info(f"Froze {frozen} preloaded objects before forking workers")
+    return frozen
+
+
+def after_fork(app=None):
+    """Run first thing in each forked worker"""
+    if app is not None:
+        from app import db
+        with app.app_context():
+            # Forget, without closing, any connection inherited from the master
+            db.engine.dispose(close=False)
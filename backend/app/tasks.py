@@ -0,0 +1,140 @@
+"""
+Background tasks for ISPMAX
+"""
+import logging
+import time
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.celery import celery
+from app.models import Client, MikroTikRouter
+from app.services.mikrotik_service import MikroTikService
+from app.services.router_scheduler import WRITE
+from app.services.router_writes import router_writes
+from app.services.billing_service import BillingRunService
+from app.services.collections_service import OverduePipeline
+from app.services.traffic_service import TrafficService
+from app.services.usage_service import UsageAccountingService, parse_queue_counters
+
+logger = logging.getLogger(__name__)
+
+
+@celery.task
+def backup_all_routers():
+    """Back up every active router whose backup schedule is due today"""
+    today = datetime.utcnow()
+    schedules = ['daily']
+    if today.weekday() == 6:
+        schedules.append('weekly')
+    if today.day == 1:
+        schedules.append('monthly')
+    
+    router_ids = [r.id for r in MikroTikRouter.query.filter(
+        MikroTikRouter.is_active.is_(True),
+        MikroTikRouter.backup_enabled.is_(True),
+        MikroTikRouter.backup_schedule.in_(schedules)
+    ).with_entities(MikroTikRouter.id)]
+    
+    results = MikroTikService.backup_routers(router_ids)
+    failed = [rid for rid, result in results.items() if not result.get('success')]
+    logger.info(f"Nightly backup finished: {len(results) - len(failed)} ok, {len(failed)} failed")
+    return {'total': len(results), 'failed': failed}
+
+
+@celery.task
+def generate_invoices():
+    """Generate today's invoices for every client whose billing day is due"""
+    service = BillingRunService(
+        batch_size=current_app.config['BILLING_BATCH_SIZE'],
+        due_days=current_app.config['BILLING_DUE_DAYS']
+    )
+    return service.run()
+
+
+@celery.task
+def process_overdue_invoices():
+    """Mark past-due invoices overdue and queue suspensions per router"""
+    pipeline = OverduePipeline(
+        batch_size=current_app.config['OVERDUE_BATCH_SIZE'],
+        grace_days=current_app.config['OVERDUE_GRACE_DAYS'],
+        suspension_chunk=current_app.config['OVERDUE_SUSPENSION_CHUNK']
+    )
+    return pipeline.run()
+
+
+@celery.task
+def suspend_clients_on_router(router_id, client_ids, reason='non-payment'):
+    """Suspend a group of clients served by one router over a single session"""
+    clients = Client.query.filter(
+        Client.id.in_(client_ids),
+        Client.status == 'active'
+    ).all()
+    if not clients:
+        return {'router_id': router_id, 'suspended': 0}
+    
+    service = MikroTikService(priority=WRITE)
+    if not service.connect_to_router(router_id):
+        logger.error(f"Could not reach router {router_id} to suspend {len(clients)} clients")
+        return {'router_id': router_id, 'suspended': 0, 'error': 'connection failed'}
+    try:
+        suspended = service.suspend_clients(clients, reason)
+    finally:
+        service.disconnect()
+    
+    if suspended:
+        Client.query.filter(Client.id.in_(suspended)).update(
+            {'status': 'suspended', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+    return {'router_id': router_id, 'suspended': len(suspended), 'failed': len(clients) - len(suspended)}
+
+
+@celery.task
+def flush_router_writes(router_id):
+    """Apply the client changes buffered for one router in a single session"""
+    return router_writes.flush(router_id)
+
+
+@celery.task
+def reconcile_router_writes():
+    """Retry buffered client changes that have no flush scheduled"""
+    return router_writes.reconcile()
+
+
+@celery.task
+def sample_routers():
+    """Fan out one sample per active router"""
+    router_ids = [r.id for r in MikroTikRouter.query.filter(
+        MikroTikRouter.is_active.is_(True)
+    ).with_entities(MikroTikRouter.id)]
+    for router_id in router_ids:
+        sample_router.delay(router_id)
+    return {'routers': len(router_ids)}
+
+
+@celery.task(expires=55)
+def sample_router(router_id):
+    """Sample a router over one session: every simple queue once, feeding
+    the rate cache and usage accounting (enforcing data limits), then
+    system health, folded into the router's baseline"""
+    service = MikroTikService()
+    if not service.connect_to_router(router_id):
+        return {'router_id': router_id, 'error': 'connection failed'}
+    try:
+        queues = service.get_queue_samples()
+        sampled_at = time.time()
+        TrafficService().record(router_id, queues)
+        
+        usage = UsageAccountingService(
+            limit_action=current_app.config['USAGE_LIMIT_ACTION'],
+            throttle_limit=current_app.config['USAGE_THROTTLE_LIMIT']
+        )
+        result = usage.ingest(router_id, parse_queue_counters(queues), sampled_at=sampled_at)
+        usage.enforce(service, result)
+        
+        health = service.sample_health()
+    finally:
+        service.disconnect()
+    
+    result.pop('restore', None)
+    result['health_score'] = health['score']
+    return result
@@ -0,0 +1,153 @@
+"""
+Login benchmark
+Times one bcrypt hash at each cost factor on this host, then fires bursts
+of concurrent logins at User.check_password through the bounded hashing
+pool and reports throughput, latency and how many were turned away.
+
+Pick PASSWORD_BCRYPT_ROUNDS as the highest cost whose single hash stays
+under the login budget (250 ms by default) and size PASSWORD_HASH_WORKERS
+and PASSWORD_HASH_QUEUE from the burst table.
+
+Usage:
+    python benchmarks/bench_login.py
+    python benchmarks/bench_login.py --rounds 10 --burst 50 200 --workers 4 --queue 16
+    python benchmarks/bench_login.py --calibrate-only --target-ms 300 --json login.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import User
+from app.services.password_hashing import HashingOverloaded, PasswordHasher, password_hasher
+
+PASSWORD = 'correct horse battery staple'
+
+
+def calibrate(rounds_range, repeats: int) -> list:
+    """Median single-hash time per cost factor"""
+    hasher = PasswordHasher(workers=1, max_queue=0, timeout=600)
+    table = []
+    for rounds in rounds_range:
+        hasher.rounds = rounds
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            hasher.hash(PASSWORD)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        table.append({'rounds': rounds, 'hash_ms': round(timings[len(timings) // 2], 1)})
+    return table
+
+
+def burst(user: User, logins: int) -> dict:
+    """``logins`` threads released at once, each verifying the same password"""
+    latencies = []
+    rejected = 0
+    lock = threading.Lock()
+    gate = threading.Barrier(logins + 1)
+
+    def login():
+        nonlocal rejected
+        gate.wait()
+        start = time.perf_counter()
+        try:
+            ok = user.check_password(PASSWORD)
+        except HashingOverloaded:
+            with lock:
+                rejected += 1
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed if ok else float('nan'))
+
+    threads = [threading.Thread(target=login) for _ in range(logins)]
+    for thread in threads:
+        thread.start()
+    gate.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    accepted = len(latencies)
+    return {
+        'logins': logins,
+        'accepted': accepted,
+        'rejected': rejected,
+        'wall_s': round(wall, 3),
+        'logins_per_s': round(accepted / wall, 1) if wall else None,
+        'p50_ms': round(latencies[accepted // 2], 1) if accepted else None,
+        'p99_ms': round(latencies[min(accepted - 1, int(accepted * 0.99))], 1) if accepted else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--min-rounds', type=int, default=8)
+    parser.add_argument('--max-rounds', type=int, default=14)
+    parser.add_argument('--repeats', type=int, default=3, help='Hashes timed per cost factor')
+    parser.add_argument('--target-ms', type=float, default=250.0, help='Longest acceptable single hash')
+    parser.add_argument('--rounds', type=int, help='Cost for the bursts (default: recommended)')
+    parser.add_argument('--burst', type=int, nargs='+', default=[10, 50, 200], help='Concurrent logins')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--queue', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--calibrate-only', action='store_true')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    table = calibrate(range(args.min_rounds, args.max_rounds + 1), args.repeats)
+    within = [row['rounds'] for row in table if row['hash_ms'] <= args.target_ms]
+    recommended = max(within) if within else args.min_rounds
+
+    print(f"{'rounds':>7} {'hash ms':>9} {'logins/s/core':>14}")
+    for row in table:
+        marker = '  <- recommended' if row['rounds'] == recommended else ''
+        print(f"{row['rounds']:>7} {row['hash_ms']:>9} {1000 / row['hash_ms']:>14.1f}{marker}")
+
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count()
+        },
+        'target_ms': args.target_ms,
+        'calibration': table,
+        'recommended_rounds': recommended,
+        'bursts': []
+    }
+
+    if not args.calibrate_only:
+        rounds = args.rounds or recommended
+        # User.check_password goes through the app-wide hasher
+        password_hasher.configure(rounds=rounds, workers=args.workers, max_queue=args.queue,
+                                  timeout=args.timeout)
+        user = User(password_hash=password_hasher.hash(PASSWORD))
+
+        print(f"\nrounds={rounds} workers={args.workers} queue={args.queue} timeout={args.timeout}s")
+        print(f"{'logins':>7} {'accepted':>9} {'rejected':>9} {'logins/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+        for logins in args.burst:
+            result = burst(user, logins)
+            report['bursts'].append(result)
+            print(f"{result['logins']:>7} {result['accepted']:>9} {result['rejected']:>9} "
+                  f"{result['logins_per_s']!s:>9} {result['p50_ms']!s:>9} {result['p99_ms']!s:>9}")
+        report.update({'rounds': rounds, 'workers': args.workers, 'queue': args.queue})
+
+    print(f"\nRecommended PASSWORD_BCRYPT_ROUNDS={recommended} "
+          f"(highest cost hashing in <= {args.target_ms:.0f} ms here)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+MikroTik service benchmark
+
+Runs the MikroTikService hot paths against the local RouterOS simulator
+(benchmarks/routeros_sim.py) seeded with 100, 1k and 10k clients per router,
+with injected WAN latency. Records wall time, router round trips and wire
+bytes per operation as JSON, and compares them with a stored baseline:
+round trips are deterministic and must not grow, wall time may not grow
+beyond a tolerance.
+
+Usage:
+    python benchmarks/bench_mikrotik_service.py --latency-ms 20 --jitter-ms 5 --json results.json
+    python benchmarks/bench_mikrotik_service.py --baseline benchmarks/baselines/mikrotik_service.json
+    python benchmarks/bench_mikrotik_service.py --save-baseline benchmarks/baselines/mikrotik_service.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.config import Config
+from app.models import ISP, Client, MikroTikRouter, Plan
+from app.services.mikrotik_service import MikroTikService
+from benchmarks.routeros_sim import RouterOSSimulator, SimulatedRouter, ip_for, mac_for
+
+SIZES = (100, 1000, 10000)
+OPERATIONS = ('provision_client', 'suspend_client', 'activate_client', 'update_client_speed',
+              'get_system_health', 'get_active_connections', 'backup_configuration')
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///bench_mikrotik_service.db')
+    BACKUP_STORE_PATH = os.environ.get('BENCH_BACKUP_STORE_PATH') or tempfile.mkdtemp(prefix='ispmax-bench-')
+    RATELIMIT_ENABLED = False
+
+
+def seed_router(port: int, objects: int) -> MikroTikRouter:
+    """Database rows for one simulated router and the plans used by the run"""
+    isp = ISP(id=str(uuid.uuid4()), name=f'Bench ISP {objects}', subdomain=f'bench{objects}-{port}')
+    router = MikroTikRouter(id=str(uuid.uuid4()), isp_id=isp.id, name=f'sim-{objects}', model='RB4011iGS+',
+                            firmware_version='7.12', ip_address='127.0.0.1', api_port=port,
+                            username='admin', password='')
+    db.session.add_all([isp, router])
+    db.session.commit()
+    return router
+
+
+def bench_plan(download: int, upload: int) -> Plan:
+    return Plan(id=str(uuid.uuid4()), name=f'Plan {download}M', price=300.0,
+                download_speed=download, upload_speed=upload,
+                features={'ipv6': True, 'voip': False, 'gaming': False})
+
+
+def bench_client(client_id: str, n: int, plan: Plan) -> Client:
+    """Transient client matching the simulator's seeded naming"""
+    return Client(id=client_id, full_name=f'Cliente {client_id}', ip_address=ip_for(n + 1),
+                  mac_address=mac_for(n + 1), connection_type='dhcp', status='active', plan_id=plan.id)
+
+
+def measure(operation: str, objects: int, service: MikroTikService, calls) -> dict:
+    """Run each zero-argument call once, recording wall time and API counters"""
+    latencies, round_trips, wire_bytes = [], [], []
+    errors = 0
+    for call in calls:
+        commands, sent, received = service.api.counters()
+        started = time.perf_counter()
+        result = call()
+        latencies.append((time.perf_counter() - started) * 1000)
+        after = service.api.counters()
+        round_trips.append(after[0] - commands)
+        wire_bytes.append(after[1] - sent + after[2] - received)
+        if result is False or (isinstance(result, dict) and (result.get('error') or result.get('errors'))):
+            errors += 1
+        db.session.rollback()
+
+    latencies.sort()
+    return {
+        'operation': operation,
+        'objects': objects,
+        'runs': len(latencies),
+        'errors': errors,
+        'p50_ms': round(latencies[len(latencies) // 2], 2),
+        'p95_ms': round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'round_trips': round(sum(round_trips) / len(round_trips), 2),
+        'bytes': round(sum(wire_bytes) / len(wire_bytes))
+    }
+
+
+def bench_size(objects: int, args) -> list:
+    router_state = SimulatedRouter(seed=objects)
+    client_ids = router_state.seed_clients(objects)
+    simulator = RouterOSSimulator(router_state, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                  row_cost_us=args.row_cost_us, seed=objects)
+    simulator.start()
+    try:
+        router = seed_router(simulator.port, objects)
+        service = MikroTikService(router.id)
+        if not service.api:
+            raise RuntimeError(f"Could not connect to the simulator on port {simulator.port}")
+
+        plan = bench_plan(20, 10)
+        faster = bench_plan(50, 25)
+        runs = args.runs
+        existing = [bench_client(client_ids[(i * 7919) % objects], (i * 7919) % objects, plan)
+                    for i in range(runs)]
+        new = [bench_client(f'bench-{objects}-{i}', objects + i, plan) for i in range(runs)]
+
+        calls = {
+            'provision_client': [lambda c=c: service.provision_client(c, plan, {}, profile=False) for c in new],
+            'suspend_client': [lambda c=c: service.suspend_client(c) for c in existing],
+            'activate_client': [lambda c=c: service.activate_client(c) for c in existing],
+            'update_client_speed': [lambda c=c: service.update_client_speed(c, faster) for c in existing],
+            'get_system_health': [service.get_system_health] * runs,
+            'get_active_connections': [service.get_active_connections] * runs,
+            'backup_configuration': [service.backup_configuration] * max(1, runs // 2)
+        }
+        results = []
+        for operation in args.operations:
+            result = measure(operation, objects, service, calls[operation])
+            results.append(result)
+            print(f"{operation:26} {objects:>6} {result['p50_ms']:>10} {result['p95_ms']:>10} "
+                  f"{result['round_trips']:>8} {result['bytes']:>10} {result['errors']:>6}")
+        service.disconnect()
+        return results
+    finally:
+        simulator.stop()
+
+
+def compare(results: list, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """Regressions against a baseline: more round trips, or slower beyond tolerance"""
+    previous = {(r['operation'], r['objects']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get((result['operation'], result['objects']))
+        if not before:
+            continue
+        if result['round_trips'] > before['round_trips']:
+            regressions.append(f"{result['operation']}@{result['objects']}: round trips "
+                               f"{before['round_trips']} -> {result['round_trips']}")
+        slower = result['p50_ms'] - before['p50_ms']
+        if slower > min_delta_ms and result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{result['operation']}@{result['objects']}: p50 "
+                               f"{before['p50_ms']}ms -> {result['p50_ms']}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--operations', nargs='+', default=list(OPERATIONS), choices=OPERATIONS)
+    parser.add_argument('--runs', type=int, default=10, help='Calls per operation and size')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Injected WAN latency per command')
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--row-cost-us', type=float, default=2.0, help='Simulated router CPU per row')
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--baseline', help='Compare with this results file; exit 1 on regressions')
+    parser.add_argument('--save-baseline', help='Write results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative p50 slowdown')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help='Ignore smaller p50 slowdowns')
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    print(f"{'operation':26} {'objects':>6} {'p50 ms':>10} {'p95 ms':>10} {'trips':>8} {'bytes':>10} {'errors':>6}")
+    results = []
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for objects in args.sizes:
+            results.extend(bench_size(objects, args))
+
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'latency_ms': args.latency_ms,
+            'jitter_ms': args.jitter_ms,
+            'row_cost_us': args.row_cost_us,
+            'runs': args.runs
+        },
+        'results': results
+    }
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Startup benchmark
+Cold-starts fresh interpreters that import an entry point (wsgi by default)
+under ``-X importtime``, reports where import time goes, grouped by
+top-level package, and fails when the median start exceeds the budget.
+
+Every gunicorn worker without preloading, every Celery process and every
+deploy health check pays this cost, so it is tracked like any other
+regression.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --target worker --runs 7 --top 25
+    python benchmarks/bench_startup.py --budget benchmarks/baselines/startup.json --json startup.json
+    python benchmarks/bench_startup.py --save-budget benchmarks/baselines/startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Median cold start of ``import wsgi`` allowed when no budget file is given
+DEFAULT_BUDGET_MS = 1500.0
+# Room left above the measured median when saving a new budget
+BUDGET_HEADROOM = 0.25
+
+PROBE = ("import time; started = time.perf_counter(); import {target}; "
+         "print((time.perf_counter() - started) * 1000)")
+
+
+def parse_importtime(stderr: str) -> list:
+    """(module, self µs, cumulative µs, depth) for every line of -X importtime output"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def run_once(target: str, env: dict) -> dict:
+    command = [sys.executable, '-X', 'importtime', '-c', PROBE.format(target=target)]
+    completed = subprocess.run(command, cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        tail = '\n'.join(l for l in completed.stderr.splitlines() if not l.startswith('import time:'))
+        raise RuntimeError(f"import {target} failed:\n{tail[-2000:]}")
+    return {
+        'import_ms': float(completed.stdout.strip().splitlines()[-1]),
+        'modules': parse_importtime(completed.stderr)
+    }
+
+
+def summarize_modules(modules: list, top: int) -> dict:
+    packages = {}
+    for name, self_us, _, _ in modules:
+        package = name.split('.', 1)[0]
+        packages[package] = packages.get(package, 0) + self_us
+    slowest = sorted(modules, key=lambda m: m[1], reverse=True)[:top]
+    return {
+        'packages': [{'package': p, 'self_ms': round(us / 1000, 2)}
+                     for p, us in sorted(packages.items(), key=lambda i: i[1], reverse=True)[:top]],
+        'modules': [{'module': name, 'self_ms': round(self_us / 1000, 2),
+                     'cumulative_ms': round(cumulative_us / 1000, 2)}
+                    for name, self_us, cumulative_us, _ in slowest]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--target', default='wsgi', help='Module to import, e.g. wsgi or worker')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=20, help='Packages and modules to list')
+    parser.add_argument('--flask-env', default=os.environ.get('FLASK_ENV', 'production'))
+    parser.add_argument('--budget-ms', type=float, help=f'Median import budget (default {DEFAULT_BUDGET_MS:.0f})')
+    parser.add_argument('--budget', help='Read the budget for --target from this file')
+    parser.add_argument('--save-budget', help='Write the measured median plus headroom as the budget')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    env = dict(os.environ, FLASK_ENV=args.flask_env)
+    # One throwaway run so every later run finds compiled bytecode
+    subprocess.run([sys.executable, '-c', PROBE.format(target=args.target)], cwd=BACKEND_DIR,
+                   env=env, capture_output=True)
+
+    runs = [run_once(args.target, env) for _ in range(args.runs)]
+    timings = sorted(r['import_ms'] for r in runs)
+    median = statistics.median(timings)
+    # Per-module figures from the run closest to the median
+    representative = min(runs, key=lambda r: abs(r['import_ms'] - median))
+    summary = summarize_modules(representative['modules'], args.top)
+
+    print(f"import {args.target}: median {median:.1f} ms, min {timings[0]:.1f} ms, "
+          f"max {timings[-1]:.1f} ms over {args.runs} cold starts")
+    print(f"\n{'package':40} {'self ms':>10}")
+    for row in summary['packages']:
+        print(f"{row['package']:40} {row['self_ms']:>10}")
+    print(f"\n{'module':60} {'self ms':>10} {'cumul ms':>10}")
+    for row in summary['modules']:
+        print(f"{row['module'][:60]:60} {row['self_ms']:>10} {row['cumulative_ms']:>10}")
+
+    budget = args.budget_ms
+    if budget is None and args.budget:
+        with open(args.budget) as f:
+            budget = json.load(f).get('budgets', {}).get(args.target)
+    if budget is None:
+        budget = DEFAULT_BUDGET_MS
+
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'target': args.target,
+            'runs': args.runs
+        },
+        'median_ms': round(median, 2),
+        'min_ms': round(timings[0], 2),
+        'max_ms': round(timings[-1], 2),
+        'budget_ms': budget,
+        **summary
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_budget:
+        budgets = {}
+        if os.path.exists(args.save_budget):
+            with open(args.save_budget) as f:
+                budgets = json.load(f).get('budgets', {})
+        budgets[args.target] = round(median * (1 + BUDGET_HEADROOM), 1)
+        with open(args.save_budget, 'w') as f:
+            json.dump({'meta': report['meta'], 'budgets': budgets}, f, indent=2)
+        print(f"\nSaved budget {budgets[args.target]} ms for {args.target}")
+        return
+
+    if median > budget:
+        print(f"\nOVER BUDGET import {args.target}: {median:.1f} ms > {budget:.1f} ms")
+        sys.exit(1)
+    print(f"\nWithin budget: {median:.1f} ms <= {budget:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
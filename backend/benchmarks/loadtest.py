@@ -0,0 +1,509 @@
+"""
+API load test
+Boots the Flask app against SQLite or a local Postgres and a fleet of
+simulated routers (benchmarks/routeros_sim.py), then drives a realistic mix
+of /api/mikrotik/* traffic from concurrent virtual users:
+
+    dashboard   NOC dashboards polling router lists, health, queues,
+                top talkers and the network map
+    provision   installers provisioning new clients in bursts
+    cutoff      cut-off day: mass suspensions plus some reactivations
+
+Reports throughput, p50/p99 latency and error rate per endpoint and overall,
+and estimates worker saturation from Little's law (mean requests in flight
+divided by the server's worker slots).
+
+Usage:
+    python benchmarks/loadtest.py --routers 20 --clients-per-router 500 --users 50 --duration 60
+    python benchmarks/loadtest.py --profile cutoff-day --offline-fraction 0.1 --offline-mode hang
+    python benchmarks/loadtest.py --server gunicorn --workers 4 --worker-class gevent --json results.json
+    python benchmarks/loadtest.py --mix dashboard=60,provision=20,cutoff=20 --router-latency-ms 40
+
+The database (LOADTEST_DATABASE_URL) is dropped and reseeded on every run;
+one that already holds ISPs or clients is only touched with --reset-db.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from sqlalchemy import inspect
+
+from app import create_app, db
+from app.config import Config
+from app.models import ISP, Client, MikroTikRouter, Plan
+from benchmarks.routeros_sim import ip_for, mac_for, start_fleet
+
+PROFILES = {
+    'steady': {'dashboard': 90, 'provision': 5, 'cutoff': 5},
+    'provisioning-burst': {'dashboard': 50, 'provision': 50, 'cutoff': 0},
+    'cutoff-day': {'dashboard': 30, 'provision': 0, 'cutoff': 70}
+}
+# Guadalajara; clients are scattered around it for the map layer
+CENTER = (20.6736, -103.3440)
+MAP_BBOX = '-103.60,20.45,-103.10,20.90'
+
+
+class LoadTestConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ.get('LOADTEST_DATABASE_URL', 'sqlite:///loadtest.db')
+    BACKUP_STORE_PATH = os.environ.get('LOADTEST_BACKUP_STORE_PATH') or tempfile.mkdtemp(prefix='ispmax-load-')
+    RATELIMIT_ENABLED = False
+
+
+def make_app():
+    """App factory for server workers, e.g. ``gunicorn 'benchmarks.loadtest:make_app()'``"""
+    return create_app(LoadTestConfig)
+
+
+# ==================== ROUTERS ====================
+
+def start_routers(args):
+    """Simulators for the online routers and endpoints for the offline ones
+
+    Offline routers either refuse connections (a closed local port) or hang
+    (a listening socket that never answers, so calls wait for the client's
+    connect timeout).
+    """
+    total = args.routers
+    offline = min(total, int(round(total * args.offline_fraction)))
+    simulators = start_fleet(total - offline, args.clients_per_router, latency_ms=args.router_latency_ms,
+                             jitter_ms=args.router_jitter_ms, row_cost_us=args.row_cost_us)
+    endpoints = [simulator.port for simulator in simulators]
+
+    blackhole = None
+    if offline:
+        if args.offline_mode == 'hang':
+            blackhole = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            blackhole.bind(('127.0.0.1', 0))
+            blackhole.listen(1024)
+            endpoints.extend([blackhole.getsockname()[1]] * offline)
+        else:
+            probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            probe.bind(('127.0.0.1', 0))
+            closed_port = probe.getsockname()[1]
+            probe.close()
+            endpoints.extend([closed_port] * offline)
+    return simulators, endpoints, blackhole
+
+
+# ==================== DATABASE ====================
+
+def populated_tables() -> list:
+    """Tables the run would wipe that already hold rows"""
+    existing = set(inspect(db.engine).get_table_names())
+    return [model.__tablename__ for model in (ISP, Client)
+            if model.__tablename__ in existing and db.session.query(model.id).first() is not None]
+
+def seed_database(endpoints: list, clients_per_router: int, pending_per_router: int, seed: int) -> dict:
+    """One ISP per router, its seeded clients and clients waiting to be provisioned
+
+    Client ids and addresses follow the simulator's seeding
+    (``{router:04d}-{n:06d}``, ``ip_for(n + 1)``) so suspensions and speed
+    changes find their queues on the router.
+    """
+    rng = random.Random(seed)
+    routers, active, pending = [], [], []
+    client_rows = []
+    for i, port in enumerate(endpoints):
+        isp = ISP(id=str(uuid.uuid4()), name=f'Load ISP {i}', subdomain=f'load{i}-{uuid.uuid4().hex[:6]}')
+        plan = Plan(id=str(uuid.uuid4()), isp_id=isp.id, name='Plan 20M', price=300.0,
+                    download_speed=20, upload_speed=10, features={'ipv6': True, 'voip': False, 'gaming': False})
+        router = MikroTikRouter(id=str(uuid.uuid4()), isp_id=isp.id, name=f'sim-{i}', model='RB4011iGS+',
+                                firmware_version='7.12', ip_address='127.0.0.1', api_port=port,
+                                username='admin', password='', is_active=True, status='online')
+        db.session.add_all([isp, plan, router])
+        routers.append((router.id, isp.id))
+
+        for n in range(clients_per_router + pending_per_router):
+            provisioned = n < clients_per_router
+            client_id = f'{i:04d}-{n:06d}' if provisioned else f'{i:04d}-new-{n:06d}'
+            client_rows.append({
+                'id': client_id, 'isp_id': isp.id, 'plan_id': plan.id,
+                'full_name': f'Cliente {client_id}', 'ip_address': ip_for(n + 1),
+                'mac_address': mac_for(n + 1), 'connection_type': 'dhcp',
+                'status': 'active' if provisioned else 'pending',
+                'latitude': CENTER[0] + rng.uniform(-0.2, 0.2),
+                'longitude': CENTER[1] + rng.uniform(-0.2, 0.2),
+                'created_at': datetime.utcnow()
+            })
+            (active if provisioned else pending).append((client_id, router.id))
+    db.session.commit()
+
+    for start in range(0, len(client_rows), 5000):
+        db.session.execute(Client.__table__.insert(), client_rows[start:start + 5000])
+    db.session.commit()
+
+    rng.shuffle(active)
+    rng.shuffle(pending)
+    return {'routers': routers, 'active': active, 'pending': pending}
+
+
+# ==================== SERVER ====================
+
+def free_port() -> int:
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+class InProcessServer:
+    """Threaded werkzeug server in this process; no worker limit"""
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        # One access log line per request would dominate the run
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self._server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self._server.server_port
+        self.pid = None
+        self.workers = 1
+        self.slots = None
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+
+
+class GunicornServer:
+    """``gunicorn`` subprocess running make_app() with the given worker model"""
+
+    def __init__(self, workers: int, threads: int, worker_class: str, env: dict):
+        self.port = free_port()
+        self.workers = workers
+        # Concurrent requests the server can hold; async workers multiplex
+        # up to worker_connections each, so only sync/gthread have a limit
+        self.slots = workers * threads if worker_class in ('sync', 'gthread') else None
+        self._command = [
+            sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{self.port}',
+            '--workers', str(workers), '--threads', str(threads), '--worker-class', worker_class,
+            '--timeout', '120', '--chdir', BACKEND_DIR, 'benchmarks.loadtest:make_app()'
+        ]
+        self._env = env
+        self._process = None
+        self.pid = None
+
+    def start(self):
+        self._process = subprocess.Popen(self._command, env=self._env)
+        self.pid = self._process.pid
+
+    def stop(self):
+        if self._process:
+            self._process.terminate()
+            self._process.wait(timeout=30)
+
+
+def wait_until_ready(port: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/health')
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start within {timeout:.0f}s")
+
+
+def cpu_seconds(pid: int) -> float:
+    """User plus system CPU of a process and its descendants, from /proc"""
+    tick = os.sysconf('SC_CLK_TCK')
+    total, pending = 0.0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / tick
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+# ==================== TRAFFIC ====================
+
+class VirtualUser:
+    """One keep-alive HTTP connection issuing scenario actions until the deadline"""
+
+    def __init__(self, port: int, token: str, state: dict, results: list, rng: random.Random):
+        self.port = port
+        self.headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+        self.state = state
+        self.results = results
+        self.rng = rng
+        self.connection = None
+
+    def request(self, method: str, path: str, name: str, body: dict = None) -> int:
+        payload = json.dumps(body) if body is not None else None
+        started = time.perf_counter()
+        status = 0
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+            self.connection.request(method, path, body=payload, headers=self.headers)
+            response = self.connection.getresponse()
+            response.read()
+            status = response.status
+            if response.getheader('Connection', '').lower() == 'close':
+                self.close()
+        except (OSError, http.client.HTTPException):
+            self.close()
+        finished = time.perf_counter()
+        self.results.append((name, status, finished - started, started, finished))
+        return status
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def dashboard(self):
+        """One refresh of the NOC dashboard"""
+        router_id, _ = self.rng.choice(self.state['routers'])
+        self.request('GET', '/api/mikrotik/routers?limit=50', 'GET /routers')
+        self.request('GET', '/api/mikrotik/health/worst?limit=20', 'GET /health/worst')
+        self.request('GET', '/api/mikrotik/top-talkers?n=10', 'GET /top-talkers')
+        self.request('GET', f'/api/mikrotik/map?layer=clients&zoom=12&bbox={MAP_BBOX}', 'GET /map')
+        self.request('GET', f'/api/mikrotik/routers/{router_id}/health', 'GET /routers/<id>/health')
+        self.request('GET', f'/api/mikrotik/routers/{router_id}/queues?limit=50', 'GET /routers/<id>/queues')
+
+    def provision(self):
+        """An installer finishing a job; falls back to a dashboard when the queue is empty"""
+        try:
+            client_id, router_id = self.state['pending'].popleft()
+        except IndexError:
+            return self.dashboard()
+        self.request('POST', '/api/mikrotik/provision', 'POST /provision',
+                     {'client_id': client_id, 'router_id': router_id, 'profile': False})
+
+    def cutoff(self):
+        """Suspend the next overdue client; one in five pays and gets reactivated"""
+        if self.state['suspended'] and self.rng.random() < 0.2:
+            try:
+                client_id = self.state['suspended'].popleft()
+                self.request('POST', f'/api/mikrotik/clients/{client_id}/activate',
+                             'POST /clients/<id>/activate', {})
+                return
+            except IndexError:
+                pass
+        try:
+            client_id, _ = self.state['active'].popleft()
+        except IndexError:
+            return self.dashboard()
+        status = self.request('POST', f'/api/mikrotik/clients/{client_id}/suspend',
+                              'POST /clients/<id>/suspend', {'reason': 'non-payment'})
+        if status == 200:
+            self.state['suspended'].append(client_id)
+
+    def run(self, scenarios: list, weights: list, deadline: float, think_ms: float):
+        actions = {'dashboard': self.dashboard, 'provision': self.provision, 'cutoff': self.cutoff}
+        while time.perf_counter() < deadline:
+            actions[self.rng.choices(scenarios, weights)[0]]()
+            if think_ms:
+                time.sleep(self.rng.expovariate(1000.0 / think_ms))
+        self.close()
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in PROFILES['steady']:
+            raise argparse.ArgumentTypeError(f"Unknown scenario: {name}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+# ==================== REPORT ====================
+
+def percentile(values: list, q: float) -> float:
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def summarize(name: str, samples: list, window: float) -> dict:
+    latencies = sorted(s[2] * 1000 for s in samples)
+    errors = sum(1 for s in samples if not 200 <= s[1] < 400)
+    return {
+        'endpoint': name,
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4),
+        'rps': round(len(samples) / window, 2),
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2)
+    }
+
+
+def report(results: list, window_start: float, window_end: float, server, cpu: float) -> dict:
+    window = window_end - window_start
+    # Requests started in the window count even when they finish after it,
+    # so calls stuck on hung routers are not dropped from the tail
+    samples = [s for s in results if window_start <= s[3] < window_end]
+    if not samples:
+        raise RuntimeError("No requests completed inside the measurement window")
+
+    by_endpoint = {}
+    for sample in samples:
+        by_endpoint.setdefault(sample[0], []).append(sample)
+    endpoints = [summarize(name, rows, window) for name, rows in sorted(by_endpoint.items())]
+    overall = summarize('overall', samples, window)
+
+    # Little's law: requests in flight = throughput x mean time in system
+    in_flight = sum(s[2] for s in samples) / window
+    saturation = {
+        'in_flight': round(in_flight, 2),
+        'slots': server.slots,
+        'slot_utilization': round(in_flight / server.slots, 3) if server.slots else None,
+        'cpu_utilization': round(cpu / (window * server.workers), 3) if cpu is not None else None
+    }
+
+    print(f"{'endpoint':30} {'requests':>9} {'rps':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for row in endpoints + [overall]:
+        print(f"{row['endpoint']:30} {row['requests']:>9} {row['rps']:>8} {row['p50_ms']:>9} "
+              f"{row['p99_ms']:>9} {row['errors']:>7}")
+    print(f"in flight {saturation['in_flight']} / slots {saturation['slots'] or 'unbounded'}"
+          f"  slot utilization {saturation['slot_utilization']}  cpu utilization {saturation['cpu_utilization']}")
+    return {'overall': overall, 'endpoints': endpoints, 'saturation': saturation}
+
+
+# ==================== MAIN ====================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--routers', type=int, default=10)
+    parser.add_argument('--clients-per-router', type=int, default=200)
+    parser.add_argument('--pending-per-router', type=int, default=50, help='Clients waiting to be provisioned')
+    parser.add_argument('--offline-fraction', type=float, default=0.0, help='Share of routers that are down')
+    parser.add_argument('--offline-mode', choices=('refuse', 'hang'), default='refuse')
+    parser.add_argument('--router-latency-ms', type=float, default=20.0, help='Injected WAN latency per command')
+    parser.add_argument('--router-jitter-ms', type=float, default=5.0)
+    parser.add_argument('--row-cost-us', type=float, default=2.0, help='Simulated router CPU per row')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='steady')
+    parser.add_argument('--mix', type=parse_mix, help='Scenario weights overriding --profile, '
+                                                       'e.g. dashboard=70,provision=10,cutoff=20')
+    parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30.0, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=5.0, help='Seconds excluded from the report')
+    parser.add_argument('--think-ms', type=float, default=0.0, help='Mean pause between user actions')
+    parser.add_argument('--server', choices=('inprocess', 'gunicorn'), default='inprocess')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--worker-class', default='sync', help='gunicorn worker class (sync, gthread, gevent)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--reset-db', action='store_true',
+                        help='Drop and reseed the database even if it already holds ISPs or clients')
+    args = parser.parse_args()
+    mix = args.mix or PROFILES[args.profile]
+
+    app = make_app()
+    with app.app_context():
+        populated = populated_tables()
+        target = db.engine.url.render_as_string(hide_password=True)
+        db.session.remove()
+    if populated and not args.reset_db:
+        parser.error(f"{target} already has rows in {', '.join(populated)}; pass --reset-db to drop it")
+
+    simulators, endpoints, blackhole = start_routers(args)
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seeded = seed_database(endpoints, args.clients_per_router, args.pending_per_router, args.seed)
+        token = create_access_token(identity='loadtest')
+    state = {
+        'routers': seeded['routers'],
+        'active': deque(seeded['active']),
+        'pending': deque(seeded['pending']),
+        'suspended': deque()
+    }
+
+    if args.server == 'gunicorn':
+        env = dict(os.environ, LOADTEST_DATABASE_URL=app.config['SQLALCHEMY_DATABASE_URI'],
+                   LOADTEST_BACKUP_STORE_PATH=app.config['BACKUP_STORE_PATH'])
+        server = GunicornServer(args.workers, args.threads, args.worker_class, env)
+    else:
+        server = InProcessServer(app)
+    server.start()
+    try:
+        wait_until_ready(server.port)
+        print(f"{len(endpoints)} routers ({len(endpoints) - len(simulators)} offline, {args.offline_mode}), "
+              f"{args.users} users, mix {mix}, server {args.server}")
+
+        results = []
+        scenarios = [name for name, weight in mix.items() if weight > 0]
+        weights = [mix[name] for name in scenarios]
+        started = time.perf_counter()
+        window_start = started + args.warmup
+        window_end = window_start + args.duration
+        users = [VirtualUser(server.port, token, state, results, random.Random(args.seed + i))
+                 for i in range(args.users)]
+        threads = [threading.Thread(target=user.run, args=(scenarios, weights, window_end, args.think_ms),
+                                    daemon=True) for user in users]
+        for thread in threads:
+            thread.start()
+
+        time.sleep(max(0.0, window_start - time.perf_counter()))
+        cpu_before = cpu_seconds(server.pid) if server.pid else None
+        time.sleep(max(0.0, window_end - time.perf_counter()))
+        cpu = cpu_seconds(server.pid) - cpu_before if server.pid else None
+        for thread in threads:
+            thread.join()
+        summary = report(results, window_start, window_end, server, cpu)
+    finally:
+        server.stop()
+        for simulator in simulators:
+            simulator.stop()
+        if blackhole:
+            blackhole.close()
+
+    summary['meta'] = {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'server': args.server,
+        'workers': args.workers if args.server == 'gunicorn' else None,
+        'threads': args.threads if args.server == 'gunicorn' else None,
+        'worker_class': args.worker_class if args.server == 'gunicorn' else None,
+        'routers': len(endpoints),
+        'offline_routers': len(endpoints) - len(simulators),
+        'offline_mode': args.offline_mode,
+        'clients_per_router': args.clients_per_router,
+        'router_latency_ms': args.router_latency_ms,
+        'router_jitter_ms': args.router_jitter_ms,
+        'users': args.users,
+        'duration': args.duration,
+        'mix': mix
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,606 @@
+"""
+RouterOS API simulator
+
+A stand-in for a MikroTik router: a TCP server speaking the RouterOS API
+wire protocol (length-prefixed words, tagged sentences, plaintext and
+challenge/response login) backed by in-memory tables for /queue/simple,
+/ip/firewall/*, /ip/dhcp-server/lease, /ppp/*, /interface and /system/*.
+Latency, jitter, per-row cost and failures are configurable, so a
+10k-queue router can be reproduced on a laptop.
+
+Any other menu path behaves as an empty table (add/print/set/remove), which
+is enough for the configuration calls made by the MikroTik services.
+
+Usage:
+    python benchmarks/routeros_sim.py --port 8728 --clients 10000 --latency-ms 20 --jitter-ms 5
+"""
+import argparse
+import binascii
+import hashlib
+import os
+import random
+import socket
+import socketserver
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ==================== WIRE PROTOCOL ====================
+
+
+def encode_length(length: int) -> bytes:
+    if length < 0x80:
+        return length.to_bytes(1, 'big')
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + length.to_bytes(4, 'big')
+
+
+def encode_sentence(words: Iterable[bytes]) -> bytes:
+    parts = []
+    for word in words:
+        parts.append(encode_length(len(word)))
+        parts.append(word)
+    parts.append(b'\x00')
+    return b''.join(parts)
+
+
+def _read_exact(stream, length: int) -> bytes:
+    data = stream.read(length)
+    if len(data) != length:
+        raise EOFError
+    return data
+
+
+def read_length(stream) -> int:
+    first = _read_exact(stream, 1)[0]
+    if first < 0x80:
+        return first
+    if first < 0xC0:
+        return int.from_bytes(bytes([first & 0x3F]) + _read_exact(stream, 1), 'big')
+    if first < 0xE0:
+        return int.from_bytes(bytes([first & 0x1F]) + _read_exact(stream, 2), 'big')
+    if first < 0xF0:
+        return int.from_bytes(bytes([first & 0x0F]) + _read_exact(stream, 3), 'big')
+    return int.from_bytes(_read_exact(stream, 4), 'big')
+
+
+def read_sentence(stream) -> List[bytes]:
+    words = []
+    while True:
+        length = read_length(stream)
+        if length == 0:
+            return words
+        words.append(_read_exact(stream, length))
+
+
+class CommandError(Exception):
+    """Reported to the client as !trap"""
+
+
+# ==================== TABLES ====================
+
+
+def _normalized(values: Dict[str, str]) -> Dict[str, str]:
+    """RouterOS prints booleans given as yes/no as true/false"""
+    if values.get('disabled') in ('yes', 'no'):
+        values = dict(values, disabled='true' if values['disabled'] == 'yes' else 'false')
+    return values
+
+
+class Table:
+    """Rows of one menu keyed by '.id', with a name index for set/remove by name"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows: Dict[str, Dict[str, str]] = {}
+        self.by_name: Dict[str, str] = {}
+        self._next_id = 1
+
+    def add(self, values: Dict[str, str]) -> str:
+        item_id = f'*{self._next_id:X}'
+        self._next_id += 1
+        row = {'.id': item_id, 'disabled': 'false'}
+        row.update(_normalized(values))
+        self.rows[item_id] = row
+        if 'name' in row:
+            self.by_name[row['name']] = item_id
+        return item_id
+
+    def resolve(self, refs: str) -> List[str]:
+        """Item ids for a comma-separated list of ids or names"""
+        ids = []
+        for ref in refs.split(','):
+            item_id = ref if ref in self.rows else self.by_name.get(ref)
+            if item_id is None:
+                raise CommandError('no such item')
+            ids.append(item_id)
+        return ids
+
+    def update(self, item_id: str, values: Dict[str, str]):
+        values = _normalized(values)
+        row = self.rows[item_id]
+        if 'name' in values and row.get('name') != values['name']:
+            self.by_name.pop(row.get('name'), None)
+            self.by_name[values['name']] = item_id
+        row.update(values)
+
+    def remove(self, item_id: str):
+        row = self.rows.pop(item_id)
+        self.by_name.pop(row.get('name'), None)
+
+    def view(self, row: Dict[str, str], now: float) -> Dict[str, str]:
+        """Row as printed; subclasses fill in live counters"""
+        return {k: v for k, v in row.items() if not k.startswith('_')}
+
+    def select(self, queries: List[bytes]) -> List[Dict[str, str]]:
+        if not queries:
+            return list(self.rows.values())
+        # Fast path for the common single equality query on name or id
+        if len(queries) == 1 and b'=' in queries[0][1:]:
+            key, _, value = queries[0][1:].decode().partition('=')
+            if key == 'name' and value in self.by_name:
+                return [self.rows[self.by_name[value]]]
+            if key == '.id':
+                return [self.rows[value]] if value in self.rows else []
+        return [row for row in self.rows.values() if match(row, queries)]
+
+
+class CounterTable(Table):
+    """Table whose rows carry byte counters that advance with their rate"""
+
+    def __init__(self, path: str, started_at: float):
+        super().__init__(path)
+        self.started_at = started_at
+
+    def view(self, row: Dict[str, str], now: float) -> Dict[str, str]:
+        printed = super().view(row, now)
+        up, down = row.get('_rate', (0, 0))
+        elapsed = now - self.started_at
+        if self.path == '/queue/simple':
+            # Counters stay monotonic; a disabled queue just reports no rate
+            printed['rate'] = '0/0' if printed.get('disabled') == 'true' else f'{up}/{down}'
+            printed['bytes'] = f'{int(up * elapsed / 8)}/{int(down * elapsed / 8)}'
+            printed['packet-rate'] = f'{up // 12000}/{down // 12000}'
+        else:
+            printed['rx-byte'] = str(int(down * elapsed / 8))
+            printed['tx-byte'] = str(int(up * elapsed / 8))
+            printed['rx-packet'] = str(int(down * elapsed / 12000))
+            printed['tx-packet'] = str(int(up * elapsed / 12000))
+        return printed
+
+
+def match(row: Dict[str, str], queries: List[bytes]) -> bool:
+    """Evaluate RouterOS API query words (?key=value, ?-key, ?<key=, ?#|&!)"""
+    stack = []
+    for word in queries:
+        query = word[1:].decode()
+        if query.startswith('#'):
+            for op in query[1:]:
+                if op == '!':
+                    stack.append(not stack.pop())
+                elif op in '|&':
+                    b, a = stack.pop(), stack.pop()
+                    stack.append(a or b if op == '|' else a and b)
+        elif query.startswith('-'):
+            stack.append(query[1:] not in row)
+        elif query[:1] in '<>':
+            key, _, value = query[1:].partition('=')
+            current = row.get(key)
+            if current is None:
+                stack.append(False)
+                continue
+            try:
+                left, right = float(current), float(value)
+            except ValueError:
+                left, right = current, value
+            stack.append(left < right if query[0] == '<' else left > right)
+        elif '=' in query:
+            key, _, value = query.partition('=')
+            stack.append(row.get(key) == value)
+        else:
+            stack.append(query in row)
+    return all(stack)
+
+
+def ip_for(n: int) -> str:
+    return f'10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}'
+
+
+def mac_for(n: int) -> str:
+    return ':'.join(f'{b:02X}' for b in n.to_bytes(6, 'big'))
+
+
+# ==================== ROUTER ====================
+
+
+class SimulatedRouter:
+    """In-memory RouterOS configuration and the command semantics over it
+
+    Like the CLI, ``set``/``remove`` accept names as well as ids in
+    ``numbers``. With ``strict=False`` (default) a ``set`` that has no
+    ``.id``/``numbers`` selects the item by its ``name`` argument instead of
+    failing, which is how the services address client queues today.
+    """
+
+    def __init__(self, identity: str = 'ispmax-sim', version: str = '7.12', board: str = 'RB4011iGS+',
+                 interfaces: int = 8, strict: bool = False, seed: int = None):
+        self.identity = identity
+        self.version = version
+        self.board = board
+        self.strict = strict
+        self.started_at = time.time()
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tables: Dict[str, Table] = {
+            '/queue/simple': CounterTable('/queue/simple', self.started_at),
+            '/interface': CounterTable('/interface', self.started_at)
+        }
+        for i in range(interfaces):
+            rate = self.rng.randint(10, 500) * 10 ** 6
+            self.tables['/interface'].add({
+                'name': f'ether{i + 1}', 'type': 'ether', 'mtu': '1500',
+                'mac-address': mac_for(0x4C5E0C000000 + i), 'running': 'true',
+                'rx-error': '0', 'tx-error': '0', '_rate': (rate // 4, rate)
+            })
+
+    def table(self, path: str) -> Table:
+        table = self.tables.get(path)
+        if table is None:
+            table = self.tables[path] = Table(path)
+        return table
+
+    def seed_clients(self, count: int, id_format: str = '{n:06d}', plan: str = '20M/10M',
+                     pppoe_share: float = 0.5, suspended_share: float = 0.0) -> List[str]:
+        """Create queues, DHCP leases and PPP secrets/sessions for ``count`` clients
+
+        Client ``n`` is ``client_<id>`` with address ``ip_for(n)``, matching
+        the naming the services use. Returns the generated client ids.
+        """
+        queues = self.table('/queue/simple')
+        leases = self.table('/ip/dhcp-server/lease')
+        secrets = self.table('/ppp/secret')
+        active = self.table('/ppp/active')
+        address_list = self.table('/ip/firewall/address-list')
+        client_ids = []
+        for n in range(count):
+            client_id = id_format.format(n=n)
+            address = ip_for(n + 1)
+            suspended = self.rng.random() < suspended_share
+            queues.add({
+                'name': f'client_{client_id}', 'target': f'{address}/32', 'max-limit': plan,
+                'comment': f'Cliente: {client_id}', 'disabled': 'true' if suspended else 'false',
+                '_rate': (self.rng.randint(0, 10 ** 7), self.rng.randint(0, 2 * 10 ** 7))
+            })
+            if self.rng.random() < pppoe_share:
+                secrets.add({'name': f'user{client_id}', 'password': 'x', 'service': 'pppoe',
+                             'remote-address': address})
+                active.add({'name': f'user{client_id}', 'service': 'pppoe', 'address': address,
+                            'caller-id': mac_for(n + 1), 'uptime': f'{self.rng.randint(1, 90)}h'})
+            else:
+                leases.add({'address': address, 'mac-address': mac_for(n + 1), 'host-name': f'cpe-{n}',
+                            'status': 'bound', 'expires-after': '9m50s'})
+            if suspended:
+                address_list.add({'list': 'suspended_clients', 'address': address})
+            client_ids.append(client_id)
+        return client_ids
+
+    # ==================== COMMANDS ====================
+
+    def execute(self, path: str, command: str, attributes: Dict[str, str],
+                queries: List[bytes]) -> Tuple[List[Dict[str, str]], Dict[str, str]]:
+        """Run one command; returns (!re rows, !done attributes)"""
+        with self.lock:
+            special = getattr(self, f"_cmd_{path.strip('/').replace('/', '_').replace('-', '_')}_{command}", None)
+            if special:
+                return special(attributes, queries)
+            if path == '/caps-man' or path.startswith('/caps-man/'):
+                raise CommandError('no such command prefix')
+            table = self.table(path)
+            if command == 'print':
+                return self._print(table, attributes, queries), {}
+            if command == 'add':
+                return [], {'ret': table.add(attributes)}
+            if command in ('set', 'enable', 'disable'):
+                values = dict(attributes)
+                for item_id in self._targets(table, values):
+                    if command != 'set':
+                        values['disabled'] = 'true' if command == 'disable' else 'false'
+                    table.update(item_id, values)
+                return [], {}
+            if command == 'remove':
+                for item_id in self._targets(table, dict(attributes), by_name=False):
+                    table.remove(item_id)
+                return [], {}
+            raise CommandError('no such command')
+
+    def _targets(self, table: Table, values: Dict[str, str], by_name: bool = True) -> List[str]:
+        refs = values.pop('.id', None) or values.pop('numbers', None)
+        if refs is None and by_name and not self.strict and 'name' in values:
+            refs = values.pop('name')
+        if refs is None:
+            raise CommandError('missing value(s) of argument(s) numbers')
+        return table.resolve(refs)
+
+    def _print(self, table: Table, attributes: Dict[str, str], queries: List[bytes]) -> List[Dict[str, str]]:
+        now = time.time()
+        rows = [table.view(row, now) for row in table.select(queries)]
+        if 'count-only' in attributes:
+            return [{'ret': str(len(rows))}]
+        proplist = attributes.get('.proplist')
+        if proplist:
+            keys = proplist.split(',')
+            rows = [{k: row[k] for k in keys if k in row} for row in rows]
+        return rows
+
+    def _cmd_system_resource_print(self, attributes, queries):
+        uptime = int(time.time() - self.started_at) + 3 * 86400
+        days, rest = divmod(uptime, 86400)
+        hours, rest = divmod(rest, 3600)
+        minutes, seconds = divmod(rest, 60)
+        total = 1024 * 1024 * 1024
+        return [{
+            'uptime': f'{days}d{hours}h{minutes}m{seconds}s',
+            'version': f'{self.version} (stable)',
+            'board-name': self.board,
+            'architecture-name': 'arm',
+            'cpu': 'ARMv7',
+            'cpu-count': '4',
+            'cpu-load': str(self.rng.randint(3, 25)),
+            'free-memory': str(total - self.rng.randint(200, 300) * 1024 * 1024),
+            'total-memory': str(total),
+            'free-hdd-space': str(400 * 1024 * 1024),
+            'total-hdd-space': str(512 * 1024 * 1024)
+        }], {}
+
+    def _cmd_system_identity_print(self, attributes, queries):
+        return [{'name': self.identity}], {}
+
+    def _cmd_system_routerboard_print(self, attributes, queries):
+        return [{'routerboard': 'true', 'model': self.board, 'serial-number': 'SIM0000001',
+                 'current-firmware': self.version, 'upgrade-firmware': self.version}], {}
+
+    def _cmd_system_reboot(self, attributes, queries):
+        return [], {}
+
+    def _cmd_system_script_run(self, attributes, queries):
+        return [], {}
+
+    def _cmd_system_backup_save(self, attributes, queries):
+        return [], {}
+
+    def _cmd_system_backup_load(self, attributes, queries):
+        return [], {}
+
+    def _cmd_export_print(self, attributes, queries):
+        return [{'contents': '\n'.join(self.export_lines())}], {}
+
+    def export_lines(self) -> List[str]:
+        """Config export in /export layout, one add line per configured row"""
+        lines = [f'# {time.strftime("%b/%d/%Y %H:%M:%S")} by RouterOS {self.version}',
+                 f'# model = {self.board}']
+        for path, table in sorted(self.tables.items()):
+            if path in ('/ppp/active', '/interface') or not table.rows:
+                continue
+            lines.append('/' + path.strip('/').replace('/', ' '))
+            for row in table.rows.values():
+                values = ' '.join(f'{k}="{v}"' if ' ' in v else f'{k}={v}'
+                                  for k, v in row.items() if not k.startswith(('.', '_')))
+                lines.append(f'add {values}')
+        lines.extend(['/system identity', f'set name={self.identity}'])
+        return lines
+
+
+# ==================== SERVER ====================
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        simulator: 'RouterOSSimulator' = self.server.simulator
+        logged_in = False
+        challenge = None
+        while True:
+            try:
+                words = read_sentence(self.rfile)
+            except (EOFError, ConnectionError, OSError):
+                return
+            if not words:
+                continue
+
+            command_path = words[0].decode()
+            attributes: Dict[str, str] = {}
+            queries: List[bytes] = []
+            tag = None
+            for word in words[1:]:
+                if word.startswith(b'='):
+                    key, _, value = word[1:].partition(b'=')
+                    attributes[key.decode()] = value.decode('utf-8', 'replace')
+                elif word.startswith(b'?'):
+                    queries.append(word)
+                elif word.startswith(b'.tag='):
+                    tag = word[5:]
+
+            path, _, command = command_path.rpartition('/')
+            path = path or '/'
+            rows: List[Dict[str, str]] = []
+            done: Dict[str, str] = {}
+            error = None
+
+            if command_path == '/login':
+                if 'response' in attributes and challenge is not None:
+                    logged_in = attributes.get('name') == simulator.username and \
+                        attributes['response'] == simulator.login_response(challenge)
+                    error = None if logged_in else 'invalid user name or password (6)'
+                elif 'password' in attributes:
+                    logged_in = attributes.get('name') == simulator.username and \
+                        attributes['password'] == simulator.password
+                    error = None if logged_in else 'invalid user name or password (6)'
+                else:
+                    challenge = os.urandom(16)
+                    done = {'ret': binascii.hexlify(challenge).decode()}
+            elif command_path == '/quit':
+                self.wfile.write(encode_sentence([b'!fatal', b'session terminated on request']))
+                return
+            elif not logged_in:
+                error = 'not logged in'
+            else:
+                fault = simulator.inject_fault()
+                if fault == 'drop':
+                    return
+                if fault == 'fail':
+                    error = 'simulated failure'
+                else:
+                    try:
+                        rows, done = simulator.router.execute(path, command, attributes, queries)
+                    except CommandError as e:
+                        error = str(e)
+
+            simulator.wait(len(rows))
+            self.wfile.write(simulator.response(rows, done, error, tag))
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class RouterOSSimulator:
+    """Serve a SimulatedRouter over the RouterOS API protocol
+
+    Each response is delayed by ``latency_ms`` plus up to ``jitter_ms`` of
+    uniform jitter and ``row_cost_us`` per returned row. ``failure_rate``
+    answers commands with !trap and ``drop_rate`` closes the connection
+    mid-command.
+    """
+
+    def __init__(self, router: SimulatedRouter = None, host: str = '127.0.0.1', port: int = 0,
+                 username: str = 'admin', password: str = '', latency_ms: float = 0.0,
+                 jitter_ms: float = 0.0, row_cost_us: float = 0.0, failure_rate: float = 0.0,
+                 drop_rate: float = 0.0, seed: int = None):
+        self.router = router or SimulatedRouter(seed=seed)
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.row_cost_us = row_cost_us
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.rng = random.Random(seed)
+        self.commands = 0
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> Tuple[str, int]:
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.simulator = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f'routeros-sim-{self.port}',
+                                        daemon=True)
+        self._thread.start()
+        return self.host, self.port
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> 'RouterOSSimulator':
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def login_response(self, challenge: bytes) -> str:
+        digest = hashlib.md5(b'\x00' + self.password.encode() + challenge).hexdigest()
+        return '00' + digest
+
+    def inject_fault(self) -> Optional[str]:
+        self.commands += 1
+        if self.drop_rate and self.rng.random() < self.drop_rate:
+            return 'drop'
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            return 'fail'
+        return None
+
+    def wait(self, rows: int):
+        delay = self.latency_ms / 1000 + rows * self.row_cost_us / 1e6
+        if self.jitter_ms:
+            delay += self.rng.uniform(0, self.jitter_ms) / 1000
+        if delay > 0:
+            time.sleep(delay)
+
+    @staticmethod
+    def response(rows: List[Dict[str, str]], done: Dict[str, str], error: Optional[str],
+                 tag: Optional[bytes]) -> bytes:
+        suffix = [b'.tag=' + tag] if tag is not None else []
+        if error:
+            return (encode_sentence([b'!trap', f'=message={error}'.encode()] + suffix)
+                    + encode_sentence([b'!done'] + suffix))
+        sentences = [
+            encode_sentence([b'!re'] + [f'={k}={v}'.encode() for k, v in row.items()] + suffix)
+            for row in rows
+        ]
+        sentences.append(encode_sentence([b'!done'] + [f'={k}={v}'.encode() for k, v in done.items()] + suffix))
+        return b''.join(sentences)
+
+
+def start_fleet(count: int, clients_per_router: int = 0, **options) -> List[RouterOSSimulator]:
+    """Start ``count`` simulators on free local ports, each seeded with clients"""
+    simulators = []
+    for i in range(count):
+        router = SimulatedRouter(identity=f'sim-{i}', seed=i)
+        if clients_per_router:
+            router.seed_clients(clients_per_router, id_format=f'{i:04d}-{{n:06d}}')
+        simulator = RouterOSSimulator(router, seed=i, **options)
+        simulator.start()
+        simulators.append(simulator)
+    return simulators
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8728)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--clients', type=int, default=1000, help='Seeded queues/leases/PPP sessions')
+    parser.add_argument('--version', default='7.12')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--row-cost-us', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    router = SimulatedRouter(version=args.version, seed=args.seed)
+    router.seed_clients(args.clients)
+    simulator = RouterOSSimulator(
+        router, host=args.host, port=args.port, username=args.username, password=args.password,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, row_cost_us=args.row_cost_us,
+        failure_rate=args.failure_rate, drop_rate=args.drop_rate, seed=args.seed
+    )
+    host, port = simulator.start()
+    print(f"RouterOS simulator on {host}:{port} with {args.clients} clients (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+Gunicorn configuration
+The app is imported once in the master and shared copy-on-write with the
+workers it forks; see app/startup.py.
+"""
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+
+if worker_class == 'gevent':
+    # The preloaded app imports socket/ssl users in the master, before any
+    # worker could patch them; patch first so the shared modules are green.
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+accesslog = '-'
+
+
+def _preloaded_app():
+    import wsgi
+    return wsgi.app
+
+
+def when_ready(server):
+    if preload_app:
+        from app.startup import prepare_fork
+        prepare_fork(_preloaded_app())
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app.startup import after_fork
+        after_fork(_preloaded_app())
@@ -0,0 +1,27 @@
+"""invoice billing period index
+
+Revision ID: 3c7d2a9e41b8
+Revises: fab5542741f4
+Create Date: 2026-10-19 17:05:12.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c7d2a9e41b8'
+down_revision = 'fab5542741f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('uq_invoices_client_id_period_start', 'invoices',
+                        ['client_id', 'period_start'], unique=True,
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('uq_invoices_client_id_period_start', table_name='invoices')
@@ -0,0 +1,45 @@
+"""speed test results
+
+Revision ID: 3f9a2c71e4b8
+Revises: d51f0c7a93e2
+Create Date: 2026-10-19 21:37:12.408215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a2c71e4b8'
+down_revision = 'd51f0c7a93e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('speed_test_results',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('client_id', sa.String(length=36), nullable=False),
+    sa.Column('download_mbps', sa.Float(), nullable=True),
+    sa.Column('upload_mbps', sa.Float(), nullable=True),
+    sa.Column('ping_ms', sa.Float(), nullable=True),
+    sa.Column('jitter_ms', sa.Float(), nullable=True),
+    sa.Column('bytes_down', sa.BigInteger(), nullable=True),
+    sa.Column('bytes_up', sa.BigInteger(), nullable=True),
+    sa.Column('server', sa.String(length=100), nullable=True),
+    sa.Column('ip_address', sa.String(length=45), nullable=True),
+    sa.Column('user_agent', sa.String(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('speed_test_results', schema=None) as batch_op:
+        batch_op.create_index('ix_speed_test_results_client_id_created_at', ['client_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('speed_test_results', schema=None) as batch_op:
+        batch_op.drop_index('ix_speed_test_results_client_id_created_at')
+
+    op.drop_table('speed_test_results')
@@ -0,0 +1,27 @@
+"""invoice status due date index
+
+Revision ID: 8b4e61d2c0a7
+Revises: 3c7d2a9e41b8
+Create Date: 2026-10-19 18:22:40.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b4e61d2c0a7'
+down_revision = '3c7d2a9e41b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_invoices_status_due_date', 'invoices',
+                        ['status', 'due_date'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_invoices_status_due_date', table_name='invoices')
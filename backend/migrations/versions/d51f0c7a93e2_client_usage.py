@@ -0,0 +1,42 @@
+"""client usage
+
+Revision ID: d51f0c7a93e2
+Revises: 8b4e61d2c0a7
+Create Date: 2026-10-19 19:04:51.337120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd51f0c7a93e2'
+down_revision = '8b4e61d2c0a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('client_usage',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('client_id', sa.String(length=36), nullable=False),
+    sa.Column('period_start', sa.DateTime(), nullable=False),
+    sa.Column('period_end', sa.DateTime(), nullable=True),
+    sa.Column('bytes_up', sa.BigInteger(), nullable=False),
+    sa.Column('bytes_down', sa.BigInteger(), nullable=False),
+    sa.Column('limit_exceeded_at', sa.DateTime(), nullable=True),
+    sa.Column('limit_action', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('client_usage', schema=None) as batch_op:
+        batch_op.create_index('uq_client_usage_client_id_period_start', ['client_id', 'period_start'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('client_usage', schema=None) as batch_op:
+        batch_op.drop_index('uq_client_usage_client_id_period_start')
+
+    op.drop_table('client_usage')
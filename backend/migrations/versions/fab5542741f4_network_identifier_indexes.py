@@ -0,0 +1,48 @@
+"""network identifier indexes
+
+Adds the (isp_id, status) lookup indexes and partial unique indexes on the
+network identities of non-cancelled clients. On PostgreSQL the indexes are
+built CONCURRENTLY so large client tables stay writable; creation fails if
+live duplicates already exist, which must be resolved first.
+
+Revision ID: fab5542741f4
+Revises: 5e1f978bf56b
+Create Date: 2026-10-19 16:32:56.430562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'fab5542741f4'
+down_revision = '5e1f978bf56b'
+branch_labels = None
+depends_on = None
+
+LIVE_CLIENTS = sa.text("status <> 'cancelled'")
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_clients_isp_id_status', 'clients', ['isp_id', 'status'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('uq_clients_isp_ip_address', 'clients', ['isp_id', 'ip_address'],
+                        unique=True, postgresql_concurrently=True,
+                        postgresql_where=LIVE_CLIENTS, sqlite_where=LIVE_CLIENTS)
+        op.create_index('uq_clients_isp_mac_address', 'clients', ['isp_id', 'mac_address'],
+                        unique=True, postgresql_concurrently=True,
+                        postgresql_where=LIVE_CLIENTS, sqlite_where=LIVE_CLIENTS)
+        op.create_index('uq_clients_isp_pppoe_username', 'clients', ['isp_id', 'pppoe_username'],
+                        unique=True, postgresql_concurrently=True,
+                        postgresql_where=LIVE_CLIENTS, sqlite_where=LIVE_CLIENTS)
+        op.create_index('ix_mikrotik_routers_isp_id_is_active', 'mikrotik_routers',
+                        ['isp_id', 'is_active'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_mikrotik_routers_isp_id_is_active', table_name='mikrotik_routers')
+    op.drop_index('uq_clients_isp_pppoe_username', table_name='clients')
+    op.drop_index('uq_clients_isp_mac_address', table_name='clients')
+    op.drop_index('uq_clients_isp_ip_address', table_name='clients')
+    op.drop_index('ix_clients_isp_id_status', table_name='clients')
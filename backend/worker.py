@@ -0,0 +1,21 @@
+"""
+Celery worker entry point
+"""
+import os
+from celery.signals import worker_init, worker_process_init
+from app import create_app
+from app.startup import after_fork, prepare_fork
+
+app = create_app(os.environ.get('FLASK_ENV', 'production'))
+celery = app.extensions['celery']
+
+
+@worker_init.connect
+def freeze_before_pool(**kwargs):
+    """Share the loaded app copy-on-write with the prefork pool"""
+    prepare_fork(app)
+
+
+@worker_process_init.connect
+def reset_after_fork(**kwargs):
+    after_fork(app)
@@ -1,35 +1,85 @@
-import React, { useEffect, useRef } from 'react'
+import React, { useCallback, useEffect, useRef, useState } from 'react'
 import L from 'leaflet'
 import 'leaflet/dist/leaflet.css'
-import { MapContainer, TileLayer, Marker, Popup } from 'react-leaflet'
+import { MapContainer, TileLayer, CircleMarker, Popup, Tooltip, useMap, useMapEvents } from 'react-leaflet'
 
-// Fix for default markers in React
-delete (L.Icon.Default.prototype as any)._getIconUrl
-L.Icon.Default.mergeOptions({
-  iconRetinaUrl: 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.7.1/images/marker-icon-2x.png',
-  iconUrl: 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.7.1/images/marker-icon.png',
-  shadowUrl: 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.7.1/images/marker-shadow.png',
-})
+interface MapCluster {
+  lat: number
+  lng: number
+  count: number
+  status: string
+  statuses: Record<string, number>
+}
+
+interface MapPoint {
+  id: string
+  name: string
+  lat: number
+  lng: number
+  status: string
+}
+
+const STATUS_COLORS: Record<string, string> = {
+  active: '#22c55e',
+  online: '#22c55e',
+  suspended: '#eab308',
+  maintenance: '#eab308',
+  cancelled: '#ef4444',
+  offline: '#ef4444',
+}
+
+const STATUS_LABELS: Record<string, string> = {
+  active: 'Activo',
+  suspended: 'Suspendido',
+  cancelled: 'Cancelado',
+  online: 'En línea',
+  maintenance: 'Mantenimiento',
+  offline: 'Desconectado',
+}
+
+const getStatusColor = (status: string) => STATUS_COLORS[status] || '#6b7280'
+
+// Marker radius grows with the logarithm of the cluster size
+const clusterRadius = (count: number) => Math.min(10 + Math.log2(count) * 3, 36)
 
-const NetworkMap: React.FC = () => {
-  const mapRef = useRef<L.Map>(null)
+const ViewportLoader: React.FC<{ onChange: (map: L.Map) => void }> = ({ onChange }) => {
+  const map = useMap()
+  useMapEvents({ moveend: () => onChange(map) })
+  useEffect(() => onChange(map), [map, onChange])
+  return null
+}
+
+const NetworkMap: React.FC<{ layer?: 'clients' | 'routers' }> = ({ layer = 'clients' }) => {
+  const [clusters, setClusters] = useState<MapCluster[]>([])
+  const [points, setPoints] = useState<MapPoint[]>([])
+  const request = useRef<AbortController | null>(null)
 
-  // Sample client locations
-  const clients = [
-    { id: 1, name: 'Juan Pérez', lat: 19.4326, lng: -99.1332, status: 'active' },
-    { id: 2, name: 'Ana Gómez', lat: 19.4350, lng: -99.1350, status: 'active' },
-    { id: 3, name: 'Carlos López', lat: 19.4300, lng: -99.1300, status: 'warning' },
-    { id: 4, name: 'María Rodríguez', lat: 19.4280, lng: -99.1380, status: 'active' },
-  ]
+  const loadViewport = useCallback(async (map: L.Map) => {
+    const bounds = map.getBounds()
+    const bbox = [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()]
+      .map((v) => v.toFixed(5))
+      .join(',')
 
-  const getStatusColor = (status: string) => {
-    switch (status) {
-      case 'active': return 'bg-green-500'
-      case 'warning': return 'bg-yellow-500'
-      case 'offline': return 'bg-red-500'
-      default: return 'bg-gray-500'
+    // Only the latest viewport matters while the user keeps panning
+    request.current?.abort()
+    const controller = new AbortController()
+    request.current = controller
+    try {
+      const response = await fetch(
+        `/api/mikrotik/map?layer=${layer}&zoom=${map.getZoom()}&bbox=${bbox}`,
+        { signal: controller.signal }
+      )
+      const data = await response.json()
+      if (data.success) {
+        setClusters(data.clusters)
+        setPoints(data.points)
+      }
+    } catch (error) {
+      if ((error as Error).name !== 'AbortError') {
+        console.error('Error loading map:', error)
+      }
     }
-  }
+  }, [layer])
 
   return (
     <div className="h-96 rounded-lg overflow-hidden border border-gray-200">
@@ -37,45 +87,74 @@ const NetworkMap: React.FC = () => {
         center={[19.4326, -99.1332]}
         zoom={14}
         style={{ height: '100%', width: '100%' }}
-        ref={mapRef}
+        preferCanvas
       >
         <TileLayer
           attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
           url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
         />
-        
-        {clients.map((client) => (
-          <Marker key={client.id} position={[client.lat, client.lng]}>
+        <ViewportLoader onChange={loadViewport} />
+
+        {clusters.map((cluster) => (
+          <CircleMarker
+            key={`${cluster.lat},${cluster.lng}`}
+            center={[cluster.lat, cluster.lng]}
+            radius={clusterRadius(cluster.count)}
+            pathOptions={{ color: getStatusColor(cluster.status), fillOpacity: 0.6 }}
+          >
+            <Tooltip direction="center" permanent className="bg-transparent border-0 shadow-none">
+              {cluster.count}
+            </Tooltip>
+            <Popup>
+              <div className="p-2 space-y-1">
+                {Object.entries(cluster.statuses).map(([status, count]) => (
+                  <div key={status} className="flex items-center space-x-2">
+                    <div className="w-3 h-3 rounded-full" style={{ backgroundColor: getStatusColor(status) }}></div>
+                    <span className="text-sm">{STATUS_LABELS[status] || status}: {count}</span>
+                  </div>
+                ))}
+              </div>
+            </Popup>
+          </CircleMarker>
+        ))}
+
+        {points.map((point) => (
+          <CircleMarker
+            key={point.id}
+            center={[point.lat, point.lng]}
+            radius={6}
+            pathOptions={{ color: getStatusColor(point.status), fillOpacity: 0.9 }}
+          >
             <Popup>
               <div className="p-2">
                 <div className="flex items-center space-x-2 mb-2">
-                  <div className={`w-3 h-3 rounded-full ${getStatusColor(client.status)}`}></div>
-                  <span className="font-semibold">{client.name}</span>
+                  <div className="w-3 h-3 rounded-full" style={{ backgroundColor: getStatusColor(point.status) }}></div>
+                  <span className="font-semibold">{point.name}</span>
                 </div>
-                <p className="text-sm text-gray-600">Cliente Activo</p>
+                <p className="text-sm text-gray-600">{STATUS_LABELS[point.status] || point.status}</p>
                 <button className="mt-2 text-xs bg-blue-100 text-blue-700 px-2 py-1 rounded hover:bg-blue-200">
                   Ver detalles
                 </button>
               </div>
             </Popup>
-          </Marker>
+          </CircleMarker>
         ))}
       </MapContainer>
-      
+
       {/* Legend */}
       <div className="absolute bottom-4 right-4 bg-white p-3 rounded-lg shadow-lg border border-gray-200">
         <div className="space-y-2">
           <div className="flex items-center space-x-2">
             <div className="w-3 h-3 rounded-full bg-green-500"></div>
-            <span className="text-sm">Activo</span>
+            <span className="text-sm">{layer === 'clients' ? 'Activo' : 'En línea'}</span>
           </div>
           <div className="flex items-center space-x-2">
             <div className="w-3 h-3 rounded-full bg-yellow-500"></div>
-            <span className="text-sm">Advertencia</span>
+            <span className="text-sm">{layer === 'clients' ? 'Suspendido' : 'Mantenimiento'}</span>
           </div>
           <div className="flex items-center space-x-2">
             <div className="w-3 h-3 rounded-full bg-red-500"></div>
-            <span className="text-sm">Desconectado</span>
+            <span className="text-sm">{layer === 'clients' ? 'Cancelado' : 'Desconectado'}</span>
           </div>
         </div>
       </div>